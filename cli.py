@@ -1,14 +1,30 @@
 import argparse
+import csv
 import getpass
+import glob
 import json
+import os
+import sys
+import time
 from rich import print
 from rich.table import Table
 
 from wallet.keys import init_wallet, next_address, get_mnemonic, verify_wallet_password
 from wallet.utils import load_wallet, wallet_exists, load_addresses
-from wallet.network import get_balance, get_utxos 
+from wallet import network
+from wallet.network import get_balance, get_utxos_many, iter_utxos
 from wallet.password import validate_password_strength
-from wallet.transactions import build_tx_plan, broadcast_tx_hex, send_transaction 
+from wallet.transactions import build_tx_plan, broadcast_tx_hex, send_transaction, load_tx_plan, sign_tx_plan
+from wallet.transactions import KeyIndex, load_address_index, get_wallet_utxos, record_signed_tx
+from wallet.cache import check_inputs_unspent
+from wallet.feebump import bump_fee
+from wallet.fees import resolve_fee_rate, DEFAULT_TARGET_BLOCKS
+from wallet.history import connect as history_db, sync_history, iter_history
+from wallet.psbt import psbt_from_plan, has_bip32_derivations, load_psbt, save_psbt, sign_psbt, finalize_psbt, extract_tx, psbt_summary, psbt_spends
+from wallet.ledger import RESERVATION_TTL, record_broadcast
+from wallet.payments import PaymentWatcher, JsonLinesSink, load_invoices
+from wallet.blockscan import BlockScanner, rebuild as rebuild_chain_store
+from wallet.tracker import TxTracker
 
 
 def _prompt_new_password() -> str:
@@ -100,7 +116,12 @@ def cmd_check_password(_):
     print("[green]Senha correta.[/green]" if ok else "[red]Senha incorreta.[/red]")
 
 
-def _select_from_address(args_from_addr: str | None, addrs: list[str]) -> str:
+def _select_from_address(args_from_addr: str | None, addrs: list[str],
+                         all_addresses: bool = False) -> str | None:
+    if all_addresses:
+        if not addrs:
+            raise ValueError("Nenhum endereço encontrado na carteira.")
+        return None  # UTXOs de todos os endereços
     if args_from_addr:
         if args_from_addr not in addrs:
             raise ValueError(f"Endereço {args_from_addr} não pertence a esta carteira.")
@@ -110,6 +131,14 @@ def _select_from_address(args_from_addr: str | None, addrs: list[str]) -> str:
     return addrs[-1]  # último derivado
 
 
+def _fee_rate_from_args(args) -> int:
+    # --fee-rate manual ou estimativa da API para --target-blocks
+    fee_rate = resolve_fee_rate(args.fee_rate, args.target_blocks)
+    if args.fee_rate is None:
+        print(f"Taxa estimada para {args.target_blocks or DEFAULT_TARGET_BLOCKS} blocos: {fee_rate} sats/vByte")
+    return fee_rate
+
+
 def cmd_create_tx(args):
     """Cria plano de transação (não assina)"""
     if not wallet_exists():
@@ -118,16 +147,16 @@ def cmd_create_tx(args):
 
     try:
         _, addrs, _ = load_addresses()
-        from_addr = _select_from_address(args.from_addr, addrs)
+        from_addr = _select_from_address(args.from_addr, addrs, args.all_addresses)
 
         to_addr = args.to
         amount = args.amount
-        fee_rate = args.fee_rate
-        change_addr = args.change if args.change else from_addr
+        fee_rate = _fee_rate_from_args(args)
+        change_addr = args.change if args.change else (from_addr or addrs[-1])
 
         print("\nCriando plano de transação...")
         print("=" * 70)
-        print(f"De: {from_addr}")
+        print(f"De: {from_addr or 'todos os endereços da carteira'}")
         print(f"Para: {to_addr}")
         print(f"Quantia: {amount:,} sats")
         print(f"Taxa: {fee_rate} sats/vByte")
@@ -140,6 +169,8 @@ def cmd_create_tx(args):
             amount_sats=amount,
             fee_rate=fee_rate,
             change_address=change_addr,
+            low_r=args.low_r,
+            rbf=not args.no_rbf,
         )
 
         print("\nPlano criado com sucesso!")
@@ -157,7 +188,18 @@ def cmd_create_tx(args):
             json.dump(plan, f, indent=2)
         print(f"\nPlano salvo em: {output_file}")
 
+        if args.psbt:
+            # derivações BIP32 vêm da xpub da conta no wallet.json: sem senha aqui
+            psbt = psbt_from_plan(plan)
+            save_psbt(psbt, args.psbt)
+            print(f"PSBT salvo em: {args.psbt}")
+            if not has_bip32_derivations(psbt):
+                print("[yellow]Aviso: PSBT sem derivações BIP32 (a xpub da conta ainda não está no wallet.json). "
+                      "Ele assina com wowlie sign-psbt, mas carteiras de hardware podem recusá-lo; "
+                      "abra a carteira uma vez (ex.: wowlie receive) para gravar a xpub.[/yellow]")
+
         print("\nVocê pode agora:")
+        print(f"  - Assinar exatamente este plano: wowlie sign --plan {output_file} [--broadcast]")
         print("  - Assinar e enviar diretamente: wowlie send --to <addr> --amount <sats> --fee-rate <n>")
         print("  - OU usar Sparrow (opcional): wowlie show-seed -> importar -> criar/assinar -> wowlie broadcast --hex <HEX>\n")
 
@@ -181,12 +223,12 @@ def cmd_send(args):
 
     try:
         _, addrs, _ = load_addresses()
-        from_addr = _select_from_address(args.from_addr, addrs)
+        from_addr = _select_from_address(args.from_addr, addrs, args.all_addresses)
 
         to_addr = args.to
         amount = args.amount
-        fee_rate = args.fee_rate
-        change_addr = args.change if args.change else from_addr
+        fee_rate = _fee_rate_from_args(args)
+        change_addr = args.change if args.change else (from_addr or addrs[-1])
 
         password = _prompt_wallet_password()
 
@@ -199,6 +241,10 @@ def cmd_send(args):
             fee_rate=fee_rate,
             change_address=change_addr,
             broadcast=not args.no_broadcast,
+            workers=args.workers,
+            low_r=args.low_r,
+            rbf=not args.no_rbf,
+            keep_reserved=args.reserve,
         )
 
         print("\nResumo:")
@@ -210,7 +256,7 @@ def cmd_send(args):
         print(f"Taxa: {tx_data['fee_sats']:,} sats")
         if tx_data.get("change_address"):
             print(f"Troco: {tx_data['change_sats']:,} sats → {tx_data['change_address']}")
-        print(f"Tamanho estimado: {tx_data['vbytes']} vBytes")
+        print(f"Tamanho: {tx_data['vbytes']} vBytes (estimado: {tx_data['estimated_vbytes']})")
         print("=" * 70)
 
         if args.no_broadcast:
@@ -222,6 +268,12 @@ def cmd_send(args):
             else:
                 print("Hex (início):")
                 print(tx_data["signed_tx_hex"][:120] + "...")
+            if tx_data.get("reserved_until"):
+                until = time.strftime("%H:%M", time.localtime(tx_data["reserved_until"]))
+                print(f"Inputs reservados até {until}: os próximos envios não vão usá-los.")
+            else:
+                print("Inputs não reservados: um próximo envio pode escolher as mesmas moedas (use --reserve para segurá-las).")
+            print("Envie depois com: wowlie broadcast --file/--hex (registra a transação como pendente).")
         else:
             print("\nTransação enviada com sucesso!")
             print(f"TXID (broadcast): {tx_data.get('txid_broadcast', tx_data['txid'])}")
@@ -229,6 +281,8 @@ def cmd_send(args):
 
         # limpeza de variáveis sensíveis
         del password
+        if args.track and not args.no_broadcast:
+            return _track_txids([tx_data.get("txid_broadcast", tx_data["txid"])], args.track)
         return 0
 
     except RuntimeError as e:
@@ -239,6 +293,196 @@ def cmd_send(args):
         return 1
 
 
+def cmd_sign(args):
+    """
+    Assina um plano salvo por create-tx (mesmos inputs/outputs revisados).
+    Não acessa a rede, a não ser com --refresh-utxos ou --broadcast.
+    """
+    if not wallet_exists():
+        print("Nenhuma carteira encontrada. Execute: wowlie init")
+        return 1
+
+    try:
+        plan = load_tx_plan(args.plan)
+
+        if args.refresh_utxos:
+            get_utxos_many(sorted({inp.get("address") for inp in plan["inputs"] if inp.get("address")}))
+        _, unknown = check_inputs_unspent(plan["inputs"])
+        if unknown:
+            print(f"[yellow]Aviso:[/yellow] {len(unknown)} input(s) sem UTXOs em cache para conferir "
+                  "(use --refresh-utxos para consultar a rede).")
+
+        print(f"\nPlano: {args.plan}")
+        print("=" * 70)
+        for addr, amt in plan["outputs"].items():
+            print(f"  → {addr}: {amt:,} sats")
+        print(f"Inputs: {len(plan['inputs'])}")
+        print(f"Taxa: {plan.get('estimated_fee_sats', 0):,} sats")
+        print("=" * 70)
+
+        password = _prompt_wallet_password()
+        tx_data = sign_tx_plan(plan, password, workers=args.workers)
+        del password
+
+        print(f"\nTXID (calculado): {tx_data['txid']}")
+        print(f"Tamanho: {tx_data['vbytes']} vBytes | Taxa: {tx_data['fee_sats']:,} sats")
+
+        if args.out_hex:
+            with open(args.out_hex, "w") as f:
+                f.write(tx_data["signed_tx_hex"])
+            print(f"Hex salvo em: {args.out_hex}")
+
+        if args.broadcast:
+            txid = broadcast_tx_hex(tx_data["signed_tx_hex"])
+            record_broadcast(txid, plan["inputs"], plan["outputs"], load_address_index())
+            print("\nTransação enviada com sucesso!")
+            print(f"TXID (broadcast): {txid}")
+            print(f"https://blockstream.info/testnet/tx/{txid}")
+        elif not args.out_hex:
+            print("\nTransação assinada (não enviada). Hex:")
+            print(tx_data["signed_tx_hex"])
+        return 0
+
+    except (RuntimeError, ValueError) as e:
+        print(f"{e}")
+        return 1
+    except Exception as e:
+        print(f"Erro ao assinar plano: {e}")
+        return 1
+
+
+def cmd_bump_fee(args):
+    """
+    Aumenta a taxa de uma transação ainda no mempool: RBF (mesmos inputs,
+    menos troco) ou CPFP (filha gastando o troco).
+    """
+    if not wallet_exists():
+        print("Nenhuma carteira encontrada. Execute: wowlie init")
+        return 1
+
+    try:
+        method = "cpfp" if args.cpfp else ("rbf" if args.rbf else "auto")
+        password = _prompt_wallet_password()
+
+        print(f"\nAumentando a taxa de {args.txid} para {args.fee_rate} sat/vB...")
+        tx_data = bump_fee(args.txid, args.fee_rate, password, method=method,
+                           change_address=args.change, broadcast=not args.no_broadcast,
+                           low_r=args.low_r, replace_descendants=args.replace_descendants)
+        del password
+
+        print("\nResumo:")
+        print("=" * 70)
+        if tx_data["method"] == "rbf":
+            print(f"Método: RBF (substitui {tx_data['replaces']})")
+            print(f"Taxa: {tx_data['old_fee_sats']:,} → {tx_data['fee_sats']:,} sats")
+            if tx_data.get("change_address"):
+                print(f"Troco: {tx_data['change_sats']:,} sats → {tx_data['change_address']}")
+            else:
+                print("Troco: descartado (abaixo do dust)")
+            for child in tx_data.get("invalidates", []):
+                print(f"[yellow]Atenção: a pendente {child} gasta o troco substituído e deixa de valer; "
+                      "refaça esse envio.[/yellow]")
+        else:
+            print(f"Método: CPFP (filha de {tx_data['parent_txid']})")
+            print(f"Taxa da filha: {tx_data['fee_sats']:,} sats "
+                  f"(pai: {tx_data['parent_fee_sats']:,} sats)")
+            print(f"Taxa do pacote: {tx_data['package_fee_rate']:.2f} sat/vB")
+        print(f"TXID (calculado): {tx_data['txid']}")
+        print(f"Tamanho: {tx_data['vbytes']} vBytes")
+        print("=" * 70)
+
+        if args.no_broadcast:
+            print("\nTransação assinada (não enviada). Hex:")
+            print(tx_data["signed_tx_hex"])
+        else:
+            txid = tx_data.get("txid_broadcast", tx_data["txid"])
+            print("\nTransação enviada com sucesso!")
+            print(f"TXID (broadcast): {txid}")
+            print(f"https://blockstream.info/testnet/tx/{txid}")
+        return 0
+
+    except (RuntimeError, ValueError) as e:
+        print(f"{e}")
+        return 1
+    except Exception as e:
+        print(f"Erro ao aumentar a taxa: {e}")
+        return 1
+
+
+def _expand_paths(patterns: list[str]) -> list[str]:
+    # o shell do Windows não expande curingas: expandimos aqui
+    paths = []
+    for pat in patterns:
+        matches = sorted(glob.glob(pat)) if any(c in pat for c in "*?[") else [pat]
+        paths.extend(m for m in matches if m not in paths)
+    return paths
+
+
+def cmd_sign_psbt(args):
+    """
+    Assina vários PSBTs com um único unlock (cache de chaves compartilhado),
+    finaliza e extrai a transação de cada um.
+    """
+    if not wallet_exists():
+        print("Nenhuma carteira encontrada. Execute: wowlie init")
+        return 1
+
+    paths = _expand_paths(args.files)
+    if not paths:
+        print("Nenhum arquivo PSBT encontrado.")
+        return 1
+
+    try:
+        psbts = [(path, load_psbt(path)) for path in paths]
+    except (OSError, ValueError) as e:
+        print(f"Erro ao ler PSBT: {e}")
+        return 1
+
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    password = _prompt_wallet_password()
+    failures = 0
+    try:
+        keys = KeyIndex(password)
+    except ValueError as e:
+        print(f"[red]Erro:[/red] {e}")
+        return 1
+    finally:
+        del password
+
+    with keys:
+        index = load_address_index()
+        for path, psbt in psbts:
+            base = os.path.splitext(os.path.basename(path))[0]
+            out_base = os.path.join(args.out_dir or os.path.dirname(path), base)
+            try:
+                n = sign_psbt(psbt, keys, index, low_r=args.low_r)
+                complete = finalize_psbt(psbt)
+                save_psbt(psbt, f"{out_base}.signed.psbt")
+                summary = psbt_summary(psbt)
+                line = f"{path}: {n} input(s) assinado(s), txid {summary['txid']}"
+                if not complete:
+                    print(f"[yellow]{line} — incompleto (inputs de fora da carteira?)[/yellow]")
+                    failures += 1
+                    continue
+
+                tx_hex = extract_tx(psbt)
+                with open(f"{out_base}.hex", "w") as f:
+                    f.write(tx_hex)
+                if args.broadcast:
+                    txid = broadcast_tx_hex(tx_hex)
+                    record_broadcast(txid, *psbt_spends(psbt), index)
+                    line += f" — enviado ({txid})"
+                print(f"[green]{line}[/green]")
+            except Exception as e:
+                print(f"[red]{path}: {e}[/red]")
+                failures += 1
+
+    print(f"\n{len(psbts) - failures}/{len(psbts)} PSBT(s) assinados e finalizados.")
+    return 1 if failures else 0
+
+
 def cmd_broadcast(args):
     """Faz broadcast de transação assinada (HEX)"""
     if args.hex:
@@ -266,14 +510,124 @@ def cmd_broadcast(args):
         print("\nTransação enviada com sucesso!")
         print("=" * 70)
         print(f"TXID: {txid}")
+        try:
+            # inputs gastos e troco pendente no ledger, como num send
+            record_signed_tx(txid, tx_hex)
+        except Exception as e:
+            print(f"[yellow]Aviso: transação não registrada no ledger de pendentes: {e}[/yellow]")
         print("\nVer na Blockstream:")
         print(f"  https://blockstream.info/testnet/tx/{txid}\n")
+        if args.track:
+            return _track_txids([txid], args.track)
         return 0
     except Exception as e:
         print(f"Erro ao enviar transação: {e}")
         return 1
 
 
+def cmd_fee_table(args):
+    """
+    Custo do pagamento (inputs, tamanho, taxa, troco) para vários fee rates,
+    com uma única consulta de UTXOs.
+    """
+    if not wallet_exists():
+        print("Nenhuma carteira encontrada. Execute: wowlie init")
+        return 1
+
+    try:
+        # numpy só é carregado por este comando (os outros não pagam a importação)
+        from wallet.feetable import fee_table, DEFAULT_FEE_RATES
+    except ImportError:
+        print("O comando fee-table precisa do numpy: pip install numpy")
+        return 1
+
+    try:
+        _, addrs, _ = load_addresses()
+        from_addr = _select_from_address(args.from_addr, addrs, args.all_addresses)
+        utxos = get_wallet_utxos([from_addr] if from_addr else None)
+        rows = fee_table(utxos, args.amount, args.rates or DEFAULT_FEE_RATES, low_r=args.low_r)
+
+        t = Table(title=f"Pagamento de {args.amount:,} sats ({len(utxos)} UTXOs disponíveis)")
+        for col in ("sat/vB", "Inputs", "vBytes", "Taxa (sats)", "Troco (sats)"):
+            t.add_column(col, justify="right")
+        for r in rows:
+            if not r["sufficient"]:
+                t.add_row(str(r["fee_rate"]), "—", "—", "saldo insuficiente", "—")
+                continue
+            change = f"{r['change_sats']:,}" if not r["dust_dropped"] else "dust → taxa"
+            t.add_row(str(r["fee_rate"]), str(r["inputs"]), str(r["vbytes"]),
+                      f"{r['fee_sats']:,}", change)
+        print(t)
+        return 0
+    except (RuntimeError, ValueError) as e:
+        print(f"{e}")
+        return 1
+    except Exception as e:
+        print(f"Erro ao calcular tabela de taxas: {e}")
+        return 1
+
+
+def cmd_history(args):
+    """
+    Sincroniza (incremental) e lista o histórico de transações da carteira.
+    Com --csv grava em arquivo ("-" para a saída padrão) linha a linha.
+    """
+    if not wallet_exists():
+        print("Nenhuma carteira encontrada. Execute: wowlie init")
+        return 1
+
+    try:
+        conn = history_db()
+    except Exception as e:
+        print(f"Erro ao abrir histórico: {e}")
+        return 1
+
+    try:
+        if not args.no_sync:
+            try:
+                new = sync_history(conn=conn)
+                if args.csv != "-":
+                    print(f"Histórico sincronizado ({new} transação(ões) confirmada(s) nova(s)).")
+            except Exception as e:
+                print(f"[yellow]Aviso:[/yellow] falha ao sincronizar ({e}); mostrando histórico local.")
+
+        rows = iter_history(conn, limit=args.limit)
+        if args.csv:
+            fields = ["txid", "net_sats", "received_sats", "sent_sats", "fee_sats",
+                      "confirmed", "block_height", "block_time", "addresses"]
+            out = sys.stdout if args.csv == "-" else open(args.csv, "w", newline="")
+            try:
+                writer = csv.DictWriter(out, fieldnames=fields)
+                writer.writeheader()
+                n = 0
+                for r in rows:
+                    writer.writerow({**r, "addresses": " ".join(r["addresses"])})
+                    n += 1
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+            if args.csv != "-":
+                print(f"{n} transação(ões) exportada(s) para {args.csv}")
+            return 0
+
+        n = 0
+        for r in rows:
+            when = (time.strftime("%Y-%m-%d %H:%M", time.localtime(r["block_time"]))
+                    if r["confirmed"] and r["block_time"] else "pendente")
+            color = "green" if r["net_sats"] >= 0 else "red"
+            fee = f" (taxa {r['fee_sats']:,})" if r["fee_sats"] else ""
+            print(f"{when:>16}  [{color}]{r['net_sats']:>+15,} sats[/{color}]{fee}  {r['txid']}")
+            n += 1
+        if not n:
+            print("Nenhuma transação encontrada.")
+        return 0
+    except Exception as e:
+        print(f"Erro ao listar histórico: {e}")
+        return 1
+    finally:
+        conn.close()
+
+
 def cmd_utxos(args):
     """Lista UTXOs de um endereço"""
     if not wallet_exists():
@@ -297,24 +651,24 @@ def cmd_utxos(args):
         print(f"\nUTXOs de: {addr}")
         print("=" * 70)
 
-        utxos = get_utxos(addr)
+        # impressos à medida que chegam (stream), sem esperar a lista inteira
+        total = count = 0
+        for utxo in iter_utxos(addr):
+            count += 1
+            value = utxo["value"]
+            total += value
+            confirmed = utxo.get("status", {}).get("confirmed", False)
+            status = "Confirmado" if confirmed else "Não confirmado"
+            print(f"\n[{count}] {status}")
+            print(f"    TXID: {utxo['txid']}")
+            print(f"    VOUT: {utxo['vout']}")
+            print(f"    Valor: {value:,} sats")
 
-        if not utxos:
+        if not count:
             print("Nenhum UTXO encontrado (endereço sem fundos).")
         else:
-            total = 0
-            for i, utxo in enumerate(utxos, 1):
-                value = utxo["value"]
-                total += value
-                confirmed = utxo.get("status", {}).get("confirmed", False)
-                status = "Confirmado" if confirmed else "Não confirmado"
-                print(f"\n[{i}] {status}")
-                print(f"    TXID: {utxo['txid']}")
-                print(f"    VOUT: {utxo['vout']}")
-                print(f"    Valor: {value:,} sats")
-
             print("\n" + "=" * 70)
-            print(f"Total: {total:,} sats em {len(utxos)} UTXO(s)")
+            print(f"Total: {total:,} sats em {count} UTXO(s)")
         print()
         return 0
     except Exception as e:
@@ -322,6 +676,235 @@ def cmd_utxos(args):
         return 1
 
 
+def cmd_watch_payments(args):
+    """
+    Acompanha os pagamentos das faturas (um endereço por pedido) e emite
+    eventos paid/underpaid/confirmed/dropped/expired em JSON lines. O arquivo
+    de faturas é relido quando muda, então novos pedidos entram sem reiniciar.
+    """
+    try:
+        invoices = load_invoices(args.invoices)
+    except (OSError, ValueError) as e:
+        print(f"Erro ao ler faturas: {e}")
+        return 1
+
+    sink = JsonLinesSink(args.events) if args.events else None
+
+    def on_event(event):
+        if sink:
+            sink(event)
+        if args.events != "-":
+            color = {"confirmed": "green", "paid": "green", "underpaid": "yellow"}.get(event["event"], "red")
+            print(f"[{color}]{event['event']:>10}[/{color}]  {event['invoice']}  "
+                  f"{event['received']:,}/{event['amount']:,} sats  ({event['confirmations']} conf.)")
+
+    watcher = PaymentWatcher(confirmations=args.confirmations, on_event=on_event,
+                             min_interval=args.min_interval, max_interval=args.max_interval,
+                             workers=args.workers)
+    try:
+        watcher.add_invoices(invoices)
+    except ValueError as e:
+        print(f"{e}")
+        return 1
+
+    mtime = os.path.getmtime(args.invoices)
+
+    def reload():
+        nonlocal mtime
+        try:
+            current = os.path.getmtime(args.invoices)
+            if current != mtime:
+                mtime = current
+                watcher.add_invoices(load_invoices(args.invoices))
+        except (OSError, ValueError) as e:
+            print(f"[yellow]Aviso:[/yellow] faturas não recarregadas: {e}")
+
+    if args.events != "-":
+        print(f"Acompanhando {len(watcher.outstanding())} fatura(s) em aberto "
+              f"({args.confirmations} confirmação(ões))" + ("." if args.once else "; Ctrl+C para sair."))
+    try:
+        if args.once:
+            watcher.step()
+        else:
+            watcher.run(reload=reload, until_settled=args.until_settled)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if sink:
+            sink.close()
+    if args.events != "-":
+        s = watcher.stats
+        print(f"{len(watcher.outstanding())} fatura(s) em aberto; {s['polls']} consulta(s), "
+              f"{s['events']} evento(s), {s['errors']} erro(s).")
+    return 0
+
+
+def cmd_sync_blocks(args):
+    """
+    Sincroniza o armazém local de UTXOs varrendo os blocos novos (um download
+    por bloco, independente do número de endereços).
+    """
+    if not wallet_exists():
+        print("Nenhuma carteira encontrada. Execute: wowlie init")
+        return 1
+
+    if args.rebuild:
+        rebuild_chain_store()
+    _, addrs, _ = load_addresses()
+    try:
+        scanner = BlockScanner(addrs)
+    except Exception as e:
+        print(f"Erro ao abrir o armazém de blocos: {e}")
+        return 1
+
+    def progress(height, tip):
+        if height == tip or height % 10 == 0:
+            print(f"[dim]Bloco {height:,} de {tip:,}[/dim]")
+
+    try:
+        if scanner.height is None:
+            scanner.start(args.from_height)
+        while True:
+            t0 = time.time()
+            r = scanner.sync(progress=progress)
+            if r["blocks"] or r["reorged"] or not args.follow:
+                reorg = f", [yellow]{r['reorged']} bloco(s) desfeito(s) por reorganização[/yellow]" if r["reorged"] else ""
+                print(f"Altura {r['height']:,}: {r['blocks']} bloco(s) varrido(s) em {time.time() - t0:.1f}s, "
+                      f"{r['received']} output(s) recebido(s), {r['spent']} gasto(s){reorg}")
+            if not args.follow:
+                break
+            time.sleep(args.follow)
+
+        by_address = scanner.utxos()
+        total = sum(u["value"] for us in by_address.values() for u in us)
+        n = sum(len(us) for us in by_address.values())
+        print(f"Saldo confirmado: {total:,} sats em {n} UTXO(s) de {len(by_address)} endereço(s)")
+        return 0
+    except KeyboardInterrupt:
+        return 0
+    except (RuntimeError, ValueError) as e:
+        print(f"{e}")
+        return 1
+    except Exception as e:
+        print(f"Erro ao sincronizar blocos: {e}")
+        return 1
+    finally:
+        scanner.close()
+
+
+_TRACK_LABELS = {"unknown": "[dim]ainda não vista[/dim]", "mempool": "[yellow]no mempool[/yellow]",
+                 "confirmed": "[green]confirmada[/green]", "dropped": "[red]fora do mempool[/red]"}
+
+
+def _track_txids(txids, confirmations: int, once: bool = False, as_json: bool = False,
+                 max_interval: float = 600) -> int:
+    """Acompanha as transações até confirmarem (ou saírem do mempool); 1 se alguma saiu."""
+    def on_update(e):
+        if as_json:
+            sys.stdout.write(json.dumps({k: e[k] for k in ("txid", "state", "confirmations", "block_height")}) + "\n")
+            sys.stdout.flush()
+            return
+        label = _TRACK_LABELS.get(e["state"]) or f"[cyan]{e['confirmations']}/{confirmations} confirmações[/cyan]"
+        if e["state"] == "confirmed":
+            label += f" ({e['confirmations']} conf., bloco {e['block_height']:,})"
+        print(f"{time.strftime('%H:%M:%S')}  {e['txid']}  {label}")
+
+    tracker = TxTracker(txids, confirmations=confirmations, max_interval=max_interval, on_update=on_update)
+    if not as_json:
+        print(f"Acompanhando {len(tracker.active)} transação(ões) até {confirmations} confirmação(ões)"
+              + ("." if once else "; Ctrl+C para sair."))
+    try:
+        if once:
+            tracker.step()
+        else:
+            tracker.run()
+    except KeyboardInterrupt:
+        pass
+
+    entries = tracker.snapshot()
+    if not as_json and (once or len(entries) > 1):
+        t = Table(title=f"Transações (topo {tracker.tip:,})" if tracker.tip else "Transações")
+        t.add_column("TXID")
+        t.add_column("Estado")
+        t.add_column("Conf.", justify="right")
+        for e in entries:
+            t.add_row(e["txid"], _TRACK_LABELS.get(e["state"], "minerada"), str(e["confirmations"]))
+        print(t)
+    return 1 if any(e["state"] == "dropped" for e in entries) else 0
+
+
+def cmd_track(args):
+    """
+    Acompanha confirmações de várias transações: topo consultado uma vez por
+    ciclo e status de cada uma com backoff próprio.
+    """
+    txids = list(args.txids)
+    if args.file:
+        try:
+            with open(args.file) as f:
+                txids += [line.split()[0] for line in f if line.strip() and not line.startswith("#")]
+        except OSError as e:
+            print(f"Erro ao ler arquivo: {e}")
+            return 1
+    if not txids:
+        print("Informe ao menos um TXID (ou --file).")
+        return 1
+    try:
+        return _track_txids(txids, args.confirmations, once=args.once, as_json=args.json,
+                            max_interval=args.max_interval)
+    except ValueError as e:
+        print(f"{e}")
+        return 1
+
+
+def _ms(value) -> str:
+    return "-" if value is None else f"{value:.0f}"
+
+
+def cmd_endpoints(args):
+    """
+    Sonda os servidores do backend (topo e taxas, --probe vezes) e mostra
+    latência, erros e saúde de cada um.
+    """
+    backend = network.get_backend()
+    errors = 0
+    for _ in range(args.probe):
+        for probe in (network.get_tip_height, network.get_fee_estimates):
+            try:
+                probe()
+            except Exception:
+                errors += 1
+    rows = network.metrics()
+    if args.json:
+        for row in rows:
+            sys.stdout.write(json.dumps(row) + "\n")
+        return 0 if rows else 1
+    if not rows:
+        print(f"O backend {backend.name} não coleta métricas por servidor.")
+        return 1
+
+    t = Table(title=f"Servidores ({backend.name}, {args.probe} sondagem(ns), {errors} falha(s))")
+    t.add_column("URL", overflow="fold")
+    t.add_column("Estado")
+    t.add_column("Reqs", justify="right")
+    t.add_column("Erros", justify="right")
+    t.add_column("429/503", justify="right")
+    t.add_column("p50 ms", justify="right")
+    t.add_column("p95 ms", justify="right")
+    t.add_column("Vitórias", justify="right")
+    t.add_column("Limite", justify="right")
+    for row in rows:
+        state = row.get("state", "up")
+        t.add_row(row["url"], "[green]no ar[/green]" if state == "up" else "[red]fora[/red]",
+                  str(row["requests"]), str(row["errors"]), str(row["throttled"]), _ms(row["p50_ms"]),
+                  _ms(row["p95_ms"]), str(row.get("wins", "-")), str(row["limit"]))
+    print(t)
+    for row in rows:
+        if row.get("last_error"):
+            print(f"[yellow]{row['url']}:[/yellow] {row['last_error']}")
+    return 0
+
+
 def main():
     p = argparse.ArgumentParser(description="WowLie Bitcoin Wallet (testnet)")
     sub = p.add_subparsers(dest="cmd")
@@ -337,35 +920,136 @@ def main():
     p_create = sub.add_parser("create-tx", help="Criar plano de transação (não assina)")
     p_create.add_argument("--to", required=True, help="Endereço de destino (testnet)")
     p_create.add_argument("--amount", type=int, required=True, help="Quantidade em satoshis")
-    p_create.add_argument("--fee-rate", type=int, required=True, help="Taxa em sats/vByte")
-    p_create.add_argument("--from-addr", help="Endereço de origem (da carteira)")
+    p_create_fee = p_create.add_mutually_exclusive_group()
+    p_create_fee.add_argument("--fee-rate", type=int, help="Taxa em sats/vByte (padrão: estimada pela rede)")
+    p_create_fee.add_argument("--target-blocks", type=int, help=f"Estimar a taxa para confirmar em N blocos (padrão: {DEFAULT_TARGET_BLOCKS})")
+    p_create_from = p_create.add_mutually_exclusive_group()
+    p_create_from.add_argument("--from-addr", help="Endereço de origem (da carteira)")
+    p_create_from.add_argument("--all-addresses", action="store_true", help="Gastar UTXOs de todos os endereços da carteira numa única transação")
     p_create.add_argument("--change", help="Endereço de troco")
     p_create.add_argument("--output", help="Arquivo de saída do plano (padrão: tx_plan.json)")
+    p_create.add_argument("--low-r", action="store_true", help="Planejar assinaturas low-R (vsize e taxa exatos)")
+    p_create.add_argument("--no-rbf", action="store_true", help="Não sinalizar replace-by-fee")
+    p_create.add_argument("--psbt", help="Também exportar o plano como PSBT (BIP174) neste arquivo (sem senha; derivações BIP32 pela xpub da conta)")
     p_create.set_defaults(func=cmd_create_tx)
 
     # --- assinar e enviar localmente ---
     p_send = sub.add_parser("send", help="Assinar localmente e enviar (ou só assinar)")
     p_send.add_argument("--to", required=True, help="Endereço de destino (testnet)")
     p_send.add_argument("--amount", type=int, required=True, help="Quantidade em satoshis")
-    p_send.add_argument("--fee-rate", type=int, required=True, help="Taxa em sats/vByte")
-    p_send.add_argument("--from-addr", help="Endereço de origem (da carteira)")
+    p_send_fee = p_send.add_mutually_exclusive_group()
+    p_send_fee.add_argument("--fee-rate", type=int, help="Taxa em sats/vByte (padrão: estimada pela rede)")
+    p_send_fee.add_argument("--target-blocks", type=int, help=f"Estimar a taxa para confirmar em N blocos (padrão: {DEFAULT_TARGET_BLOCKS})")
+    p_send_from = p_send.add_mutually_exclusive_group()
+    p_send_from.add_argument("--from-addr", help="Endereço de origem (da carteira)")
+    p_send_from.add_argument("--all-addresses", action="store_true", help="Gastar UTXOs de todos os endereços da carteira numa única transação")
     p_send.add_argument("--change", help="Endereço de troco")
     p_send.add_argument("--no-broadcast", action="store_true", help="Assina mas não envia (mostra/salva o HEX)")
     p_send.add_argument("--out-hex", help="Arquivo para salvar o TX HEX quando --no-broadcast")
+    p_send.add_argument("--reserve", action="store_true", help=f"Com --no-broadcast, manter os inputs reservados ({RESERVATION_TTL // 60} min) para o broadcast posterior")
+    p_send.add_argument("--workers", type=int, help="Assinar em paralelo com N processos (transações com muitos inputs)")
+    p_send.add_argument("--low-r", action="store_true", help="Assinaturas low-R (<= 71 bytes com sighash): transação menor e taxa exata")
+    p_send.add_argument("--no-rbf", action="store_true", help="Não sinalizar replace-by-fee (a taxa não poderá ser aumentada por RBF)")
+    p_send.add_argument("--track", type=int, nargs="?", const=1, metavar="CONF", help="Depois de enviar, acompanhar até CONF confirmações (padrão: 1)")
     p_send.set_defaults(func=cmd_send)
 
+    # --- assinar um plano existente ---
+    p_sign = sub.add_parser("sign", help="Assinar um plano salvo por create-tx (sem rede)")
+    p_sign.add_argument("--plan", required=True, help="Arquivo do plano (ex.: tx_plan.json)")
+    p_sign.add_argument("--broadcast", action="store_true", help="Enviar a transação após assinar")
+    p_sign.add_argument("--out-hex", help="Arquivo para salvar o TX HEX assinado")
+    p_sign.add_argument("--refresh-utxos", action="store_true", help="Consultar a rede para atualizar o cache de UTXOs antes de conferir o plano")
+    p_sign.add_argument("--workers", type=int, help="Assinar em paralelo com N processos (planos com muitos inputs)")
+    p_sign.set_defaults(func=cmd_sign)
+
+    # --- assinar vários PSBTs ---
+    p_sign_psbt = sub.add_parser("sign-psbt", help="Assinar, finalizar e extrair vários PSBTs com um único unlock")
+    p_sign_psbt.add_argument("files", nargs="+", help="Arquivos .psbt (aceita curingas, ex.: *.psbt)")
+    p_sign_psbt.add_argument("--out-dir", help="Diretório de saída (padrão: o mesmo de cada PSBT)")
+    p_sign_psbt.add_argument("--broadcast", action="store_true", help="Enviar cada transação finalizada")
+    p_sign_psbt.add_argument("--low-r", action="store_true", help="Assinaturas low-R (<= 71 bytes com sighash)")
+    p_sign_psbt.set_defaults(func=cmd_sign_psbt)
+
+    # --- aumentar taxa de transação presa ---
+    p_bump = sub.add_parser("bump-fee", help="Aumentar a taxa de uma transação no mempool (RBF ou CPFP)")
+    p_bump.add_argument("txid", help="TXID da transação a acelerar")
+    p_bump.add_argument("--fee-rate", type=int, required=True, help="Nova taxa em sats/vByte")
+    p_bump_method = p_bump.add_mutually_exclusive_group()
+    p_bump_method.add_argument("--rbf", action="store_true", help="Forçar RBF (padrão: RBF se possível, senão CPFP)")
+    p_bump_method.add_argument("--cpfp", action="store_true", help="Forçar CPFP gastando o troco")
+    p_bump.add_argument("--change", help="Endereço do output de troco (padrão: último output da carteira)")
+    p_bump.add_argument("--no-broadcast", action="store_true", help="Assina mas não envia (mostra o HEX)")
+    p_bump.add_argument("--low-r", action="store_true", help="Assinaturas low-R (<= 71 bytes com sighash)")
+    p_bump.add_argument("--replace-descendants", action="store_true",
+                        help="Permitir que o RBF descarte envios pendentes que gastam o troco (sem isso, aborta)")
+    p_bump.set_defaults(func=cmd_bump_fee)
+
     # --- broadcast de um HEX já assinado ---
     p_brd = sub.add_parser("broadcast", help="Broadcast de transação assinada (HEX)")
     group_hex = p_brd.add_mutually_exclusive_group(required=True)
     group_hex.add_argument("--hex", help="Transação em HEX")
     group_hex.add_argument("--file", help="Arquivo contendo o HEX")
+    p_brd.add_argument("--track", type=int, nargs="?", const=1, metavar="CONF", help="Depois de enviar, acompanhar até CONF confirmações (padrão: 1)")
     p_brd.set_defaults(func=cmd_broadcast)
 
+    # --- tabela de taxas ---
+    p_fee_table = sub.add_parser("fee-table", help="Custo de um pagamento para vários fee rates")
+    p_fee_table.add_argument("--amount", type=int, required=True, help="Quantidade em satoshis")
+    p_fee_table.add_argument("--rates", type=int, nargs="+", help="Fee rates em sats/vByte (padrão: 1 2 3 5 ... 200)")
+    p_fee_table_from = p_fee_table.add_mutually_exclusive_group()
+    p_fee_table_from.add_argument("--from-addr", help="Endereço de origem (da carteira)")
+    p_fee_table_from.add_argument("--all-addresses", action="store_true", help="Considerar UTXOs de todos os endereços da carteira")
+    p_fee_table.add_argument("--low-r", action="store_true", help="Considerar assinaturas low-R")
+    p_fee_table.set_defaults(func=cmd_fee_table)
+
+    # --- histórico ---
+    p_history = sub.add_parser("history", help="Histórico de transações (sincronização incremental)")
+    p_history.add_argument("--csv", help="Exportar para CSV neste arquivo (\"-\" = saída padrão)")
+    p_history.add_argument("--limit", type=int, help="Mostrar só as N mais recentes")
+    p_history.add_argument("--no-sync", action="store_true", help="Não consultar a rede; usar só o histórico local")
+    p_history.set_defaults(func=cmd_history)
+
     # --- utxos ---
     p_utxos = sub.add_parser("utxos", help="Listar UTXOs de um endereço da carteira")
     p_utxos.add_argument("--address", help="Endereço específico (opcional)")
     p_utxos.set_defaults(func=cmd_utxos)
 
+    # --- pagamentos de faturas ---
+    p_watch = sub.add_parser("watch-payments", help="Acompanhar pagamentos de faturas (um endereço por pedido)")
+    p_watch.add_argument("--invoices", required=True, help="Faturas (JSON, JSON lines ou CSV: id,address,amount[,confirmations,expires_at])")
+    p_watch.add_argument("--events", help="Anexar eventos em JSON lines neste arquivo (\"-\" = saída padrão)")
+    p_watch.add_argument("--confirmations", type=int, default=1, help="Confirmações para considerar pago (padrão: 1)")
+    p_watch.add_argument("--min-interval", type=float, default=5, help="Intervalo mínimo por endereço em segundos (padrão: 5)")
+    p_watch.add_argument("--max-interval", type=float, default=300, help="Intervalo máximo por endereço em segundos (padrão: 300)")
+    p_watch.add_argument("--workers", type=int, help="Teto de consultas simultâneas (padrão: ajuste automático)")
+    p_watch_mode = p_watch.add_mutually_exclusive_group()
+    p_watch_mode.add_argument("--once", action="store_true", help="Uma única rodada (ex.: via cron)")
+    p_watch_mode.add_argument("--until-settled", action="store_true", help="Sair quando não restar fatura em aberto")
+    p_watch.set_defaults(func=cmd_watch_payments)
+
+    # --- acompanhar confirmações ---
+    p_track = sub.add_parser("track", help="Acompanhar confirmações de várias transações")
+    p_track.add_argument("txids", nargs="*", help="TXIDs a acompanhar")
+    p_track.add_argument("--file", help="Arquivo com um TXID por linha")
+    p_track.add_argument("--confirmations", type=int, default=1, help="Confirmações para considerar concluída (padrão: 1)")
+    p_track.add_argument("--max-interval", type=float, default=600, help="Intervalo máximo entre consultas de uma transação em segundos (padrão: 600)")
+    p_track.add_argument("--once", action="store_true", help="Uma única consulta e sair")
+    p_track.add_argument("--json", action="store_true", help="Cada mudança como uma linha JSON")
+    p_track.set_defaults(func=cmd_track)
+
+    # --- varredura de blocos ---
+    p_sync = sub.add_parser("sync-blocks", help="Sincronizar UTXOs varrendo os blocos novos (muitos endereços)")
+    p_sync.add_argument("--from-height", type=int, help="Primeira sincronização: varrer a partir desta altura (padrão: retrato no topo atual)")
+    p_sync.add_argument("--rebuild", action="store_true", help="Apagar o armazém local e recomeçar")
+    p_sync.add_argument("--follow", type=float, metavar="SEGUNDOS", help="Continuar acompanhando o topo, consultando a cada N segundos")
+    p_sync.set_defaults(func=cmd_sync_blocks)
+
+    # --- servidores ---
+    p_endpoints = sub.add_parser("endpoints", help="Latência e saúde dos servidores do backend")
+    p_endpoints.add_argument("--probe", type=int, default=5, help="Rodadas de sondagem (padrão: 5)")
+    p_endpoints.add_argument("--json", action="store_true", help="Uma linha JSON por servidor")
+    p_endpoints.set_defaults(func=cmd_endpoints)
+
     args = p.parse_args()
     if hasattr(args, "func"):
         exit_code = args.func(args)
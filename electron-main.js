@@ -1,5 +1,6 @@
 const { app, BrowserWindow, Menu } = require('electron');
 const { spawn } = require('child_process');
+const http = require('http');
 const path = require('path');
 const findFreePort = require('find-free-port');
 
@@ -10,6 +11,36 @@ let streamlitPort;
 // Determinar se está em modo desenvolvimento ou produção
 const isDev = !app.isPackaged;
 
+// Espera pelo servidor: consulta /_stcore/health até responder "ok"
+const HEALTH_POLL_INTERVAL_MS = 100;
+const HEALTH_TIMEOUT_MS = 60000;
+
+// Tempos de cada fase da inicialização (ms desde o início do processo)
+const startupT0 = Date.now();
+const logPhase = (phase) => {
+  console.log(`⏱️ ${phase}: ${Date.now() - startupT0} ms`);
+};
+
+// Bytecode (.pyc) da aplicação. No app empacotado os .pyc são excluídos e a
+// pasta de recursos pode ser somente leitura (ex.: Program Files), então o
+// Python recompilaria tudo a cada abertura; com PYTHONPYCACHEPREFIX os .pyc
+// ficam na pasta de dados do usuário e são reaproveitados.
+const getPycachePrefix = () => {
+  if (isDev) {
+    return null;
+  }
+  return path.join(app.getPath('userData'), 'pycache');
+};
+
+const pythonEnv = () => {
+  const env = { ...process.env, PYTHONUNBUFFERED: '1' };
+  const prefix = getPycachePrefix();
+  if (prefix) {
+    env.PYTHONPYCACHEPREFIX = prefix;
+  }
+  return env;
+};
+
 // Configurar caminhos
 const getAppPath = () => {
   if (isDev) {
@@ -36,6 +67,64 @@ const getPythonCommand = () => {
   return 'python3';
 };
 
+// Consultar /_stcore/health até o Streamlit responder (ou o processo morrer)
+function waitForStreamlit(url) {
+  return new Promise((resolve, reject) => {
+    const deadline = Date.now() + HEALTH_TIMEOUT_MS;
+    let exited = false;
+
+    streamlitProcess.once('exit', (code) => {
+      exited = true;
+      reject(new Error(`Streamlit encerrou durante a inicialização (código ${code})`));
+    });
+
+    const retry = () => {
+      if (exited) {
+        return;
+      }
+      if (Date.now() > deadline) {
+        reject(new Error(`Streamlit não respondeu em ${HEALTH_TIMEOUT_MS / 1000} s`));
+        return;
+      }
+      setTimeout(probe, HEALTH_POLL_INTERVAL_MS);
+    };
+
+    const probe = () => {
+      const req = http.get(`${url}/_stcore/health`, (res) => {
+        res.resume();
+        if (res.statusCode === 200) {
+          resolve(url);
+        } else {
+          retry();
+        }
+      });
+      req.setTimeout(1000, () => req.destroy());
+      req.on('error', retry);
+    };
+
+    probe();
+  });
+}
+
+// Pré-compilar o código da aplicação em segundo plano (próximas aberturas
+// e módulos importados sob demanda já encontram o .pyc pronto)
+function precompileApp() {
+  const appPath = getAppPath();
+  const compile = spawn(getPythonCommand(), [
+    '-m', 'compileall', '-q', '-j', '0',
+    path.join(appPath, 'streamlit_app.py'),
+    path.join(appPath, 'cli.py'),
+    path.join(appPath, 'wallet')
+  ], { cwd: appPath, env: pythonEnv() });
+
+  compile.on('error', (error) => {
+    console.error('Erro ao pré-compilar bytecode:', error);
+  });
+  compile.on('exit', (code) => {
+    logPhase(`bytecode pré-compilado (código ${code})`);
+  });
+}
+
 // Iniciar servidor Streamlit
 async function startStreamlit() {
   return new Promise((resolve, reject) => {
@@ -55,6 +144,9 @@ async function startStreamlit() {
       console.log('🐍 Python:', pythonCmd);
       console.log('📄 Streamlit App:', streamlitApp);
       console.log('🔌 Port:', streamlitPort);
+      if (getPycachePrefix()) {
+        console.log('📦 Bytecode:', getPycachePrefix());
+      }
 
       // Argumentos do Streamlit
       const args = [
@@ -65,11 +157,16 @@ async function startStreamlit() {
         '--browser.gatherUsageStats=false',
         '--server.address=localhost'
       ];
+      if (!isDev) {
+        // sem recarregar ao salvar: não importa nem inicia o observador de arquivos
+        args.push('--server.fileWatcherType=none', '--server.runOnSave=false');
+      }
 
       // Iniciar processo
+      logPhase('iniciando Python');
       streamlitProcess = spawn(pythonCmd, args, {
         cwd: appPath,
-        env: { ...process.env }
+        env: pythonEnv()
       });
 
       streamlitProcess.stdout.on('data', (data) => {
@@ -99,10 +196,13 @@ async function startStreamlit() {
         reject(error);
       });
 
-      // Aguardar servidor iniciar
-      setTimeout(() => {
-        resolve(`http://localhost:${streamlitPort}`);
-      }, 3000);
+      // Aguardar servidor responder
+      waitForStreamlit(`http://localhost:${streamlitPort}`)
+        .then((url) => {
+          logPhase('Streamlit pronto (/_stcore/health)');
+          resolve(url);
+        })
+        .catch(reject);
     });
   });
 }
@@ -130,6 +230,9 @@ function createWindow(url) {
   }
 
   // Carregar aplicação
+  mainWindow.webContents.once('did-finish-load', () => {
+    logPhase('janela carregada');
+  });
   mainWindow.loadURL(url);
 
   // Abrir DevTools apenas em desenvolvimento
@@ -154,11 +257,16 @@ function createWindow(url) {
 app.whenReady().then(async () => {
   try {
     console.log('🚀 Iniciando WowLie Wallet...');
+    logPhase('Electron pronto');
     const url = await startStreamlit();
     console.log('✅ Streamlit iniciado:', url);
     createWindow(url);
+    precompileApp();
   } catch (error) {
     console.error('❌ Erro ao iniciar:', error);
+    if (streamlitProcess) {
+      streamlitProcess.kill();
+    }
     app.quit();
   }
 
@@ -1,16 +1,151 @@
-import io, os
-import qrcode
+import importlib, io, os, json, threading, time
+_SCRIPT_T0 = time.perf_counter()
+import requests
 import streamlit as st
-from wallet.keys import init_wallet, next_address, verify_wallet_password, import_wallet
+from wallet import network
 from wallet.utils import wallet_exists, load_addresses
 from wallet.password import validate_password_strength
-from wallet.network import get_balance
-from wallet.transactions import build_tx_plan, broadcast_tx_hex, send_transaction
+from wallet.network import get_tip_height, get_utxos
+from wallet.refresher import BalanceRefresher
+from wallet.fees import resolve_fee_rate, DEFAULT_TARGET_BLOCKS
+# qrcode, btclib (wallet.keys / wallet.transactions / wallet.session) são
+# importados sob demanda: a tela inicial (login) não precisa deles.
 
 
 st.set_page_config(page_title="WowLie Wallet | BigCute", page_icon="💰", layout="centered")
 
+@st.cache_resource
+def _http_session() -> requests.Session:
+    # cliente HTTP único para todas as sessões e reruns (pool de conexões)
+    session = network.new_session()
+    network.use_session(session)
+    return session
+
+_http_session()
+
+# módulos pesados carregados em segundo plano enquanto o usuário digita a senha
+_PREWARM_MODULES = ("wallet.keys", "wallet.transactions", "wallet.session", "qrcode")
+
+@st.cache_resource
+def _prewarm_imports() -> threading.Thread:
+    def _run():
+        for name in _PREWARM_MODULES:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                pass
+    t = threading.Thread(target=_run, name="wowlie-prewarm", daemon=True)
+    t.start()
+    return t
+
+WORKERS = max(1, min(4, os.cpu_count() or 1))
+MAX_PENDING_JOBS = 16
+SESSION_IDLE_TIMEOUT = 5 * 60   # segundos sem uso até a sessão desbloqueada expirar
+
+@st.cache_resource
+def _executor():
+    from wallet.session import BoundedExecutor
+    # um pool para todas as sessões do navegador: PBKDF2, derivação e assinatura
+    # rodam fora da thread do script, que só acompanha os futures
+    return BoundedExecutor(max_workers=WORKERS, max_pending=MAX_PENDING_JOBS)
+
+def _start_unlock(password: str, rerun_when_done: bool = True) -> None:
+    from wallet.session import UnlockedSession
+    st.session_state.unlock_future = _executor().submit(UnlockedSession, password, SESSION_IDLE_TIMEOUT)
+    st.session_state.unlock_rerun = rerun_when_done
+    st.session_state.unlock_error = None
+
+def _wallet_session():
+    """UnlockedSession ativa desta sessão do navegador, ou None."""
+    sess = st.session_state.get("wallet_session")
+    if sess is not None and sess.expired:
+        st.session_state.wallet_session = None
+        return None
+    return sess
+
+def _lock_wallet() -> None:
+    sess = st.session_state.get("wallet_session")
+    if sess is not None:
+        sess.close()
+    st.session_state.wallet_session = None
+    st.session_state.unlocked = False
+
+@st.fragment(run_every=0.5)
+def _unlock_status():
+    fut = st.session_state.get("unlock_future")
+    if fut is None:
+        return
+    if not fut.done():
+        st.info("🔓 Desbloqueando a carteira…")
+        return
+    st.session_state.unlock_future = None
+    try:
+        st.session_state.wallet_session = fut.result()
+        st.session_state.unlocked = True
+    except Exception as e:
+        st.session_state.unlock_error = str(e)
+        st.session_state.unlocked = False
+    if st.session_state.unlock_rerun:
+        st.rerun()
+
+def _send_job(keys, fee_mode, target_blocks, **kwargs):
+    # executado no pool: estimativa de taxa (rede), seleção, assinatura e broadcast
+    if fee_mode != "Manual":
+        kwargs["fee_rate"] = resolve_fee_rate(target_blocks=target_blocks)
+    from wallet.transactions import send_transaction
+    return send_transaction(password=None, keys=keys, **kwargs)
+
+@st.fragment(run_every=0.5)
+def _send_status():
+    fut = st.session_state.get("send_future")
+    if fut is None:
+        return
+    if not fut.done():
+        st.info("✍️ Construindo e assinando a transação…")
+        return
+    st.session_state.send_future = None
+    try:
+        st.session_state.send_result = {"tx": fut.result(), **st.session_state.send_opts}
+    except Exception as e:
+        st.session_state.send_result = {"error": str(e)}
+    st.rerun()
+
+def _show_send_result(result: dict) -> None:
+    if "error" in result:
+        st.error(f"❌ Erro ao assinar/enviar: {result['error']}")
+        return
+    tx_data = result["tx"]
+    st.success("✅ Transação assinada.")
+    st.subheader("Resumo")
+    c1, c2 = st.columns(2)
+    c1.metric("Valor enviado", f"{tx_data['amount_sats']:,} sats")
+    c2.metric("Taxa", f"{tx_data['fee_sats']:,} sats")
+    if tx_data.get("change_address"):
+        st.write(f"**Troco:** {tx_data['change_sats']:,} sats → {tx_data['change_address']}")
+    st.write(f"**Inputs:** {tx_data['inputs']}  |  **Outputs:** {tx_data['outputs']}")
+    st.write(f"**Tamanho:** {tx_data['vbytes']} vBytes (estimado: {tx_data['estimated_vbytes']})")
+    st.code(f"TXID (calculado): {tx_data['txid']}")
+
+    if result["no_broadcast"]:
+        st.info("Transação **não** enviada. Você pode usar o HEX abaixo em outra ferramenta. "
+                "Os inputs não ficam reservados; para registrar o envio, faça o broadcast pela seção 3️⃣.")
+        st.text_area("TX HEX assinado", tx_data["signed_tx_hex"], height=160)
+        if result["out_hex_name"]:
+            st.download_button(
+                "Baixar HEX",
+                data=tx_data["signed_tx_hex"],
+                file_name=result["out_hex_name"],
+                mime="text/plain"
+            )
+    else:
+        txid_brd = tx_data.get("txid_broadcast", tx_data["txid"])
+        st.success("Transação enviada para a rede (testnet).")
+        st.code(txid_brd)
+        st.markdown(f"[Ver na Blockstream](https://blockstream.info/testnet/tx/{txid_brd})")
+
+@st.cache_data(max_entries=64, show_spinner=False)
 def _qr_png_bytes(data: str) -> bytes:
+    import qrcode
     img = qrcode.make(data)
     buf = io.BytesIO()
     img.save(buf, format="PNG")
@@ -19,6 +154,51 @@ def _qr_png_bytes(data: str) -> bytes:
 def _wallet_file_path() -> str:
     return os.path.expanduser("~/.wowlie/wallet.json")
 
+def _wallet_mtime() -> float:
+    try:
+        return os.path.getmtime(_wallet_file_path())
+    except OSError:
+        return 0.0
+
+@st.cache_data(show_spinner=False)
+def _load_wallet_view(mtime: float):
+    # (idxs, addrs, wallet) relido só quando o wallet.json muda
+    return load_addresses()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _tip_height():
+    try:
+        return get_tip_height()
+    except Exception:
+        return None
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_utxos(address: str, tip) -> list:
+    # chave (endereço, altura do topo): um bloco novo invalida na hora; o TTL cobre o mempool
+    return get_utxos(address)
+
+BALANCE_REFRESH_INTERVAL = 30   # segundos entre rodadas de consulta em segundo plano
+BALANCE_UI_POLL = 2             # segundos entre redesenhos do painel de saldos
+
+def _balance_refresher(addrs) -> BalanceRefresher:
+    # uma thread de atualização por sessão do navegador
+    ref = st.session_state.get("balance_refresher")
+    if ref is None or not ref.alive:
+        ref = BalanceRefresher(addrs, interval=BALANCE_REFRESH_INTERVAL).start()
+        st.session_state.balance_refresher = ref
+    else:
+        ref.set_addresses(addrs)
+    return ref
+
+def _stop_balance_refresher():
+    ref = st.session_state.pop("balance_refresher", None)
+    if ref is not None:
+        ref.stop()
+
+def _clear_wallet_caches():
+    _load_wallet_view.clear()
+    _cached_utxos.clear()
+
 def _redact(addr: str) -> str:
     if len(addr) <= 20:
         return addr
@@ -51,6 +231,18 @@ if "show_qr_initial" not in st.session_state:
 if "tx_plan" not in st.session_state:
     st.session_state.tx_plan = None
 
+for _k in ("wallet_session", "unlock_future", "unlock_error", "send_future", "send_result"):
+    if _k not in st.session_state:
+        st.session_state[_k] = None
+
+# sessão desbloqueada expira por inatividade
+if st.session_state.unlocked and st.session_state.wallet_session is not None and _wallet_session() is None:
+    st.session_state.unlocked = False
+    st.session_state.unlock_error = "Sessão expirada por inatividade. Entre novamente."
+
+# visão da carteira (endereços e metadados) uma vez por rerun
+view = _load_wallet_view(_wallet_mtime())
+
 st.title("💰 WowLie Wallet")
 st.caption("Carteira BigCute Testnet segura")
 
@@ -83,9 +275,12 @@ with tab_create:
                 st.error("❌ As senhas não coincidem.")
             else:
                 try:
+                    from wallet.keys import init_wallet
                     result = init_wallet(pwd)
+                    view = _load_wallet_view(_wallet_mtime())
                     st.session_state.wallet_created = True
                     st.session_state.unlocked = True
+                    _start_unlock(pwd, rerun_when_done=False)
                     st.session_state.just_created_seed = result["mnemonic"]
                     st.session_state.first_address = result["first_address"]
 
@@ -145,9 +340,11 @@ with tab_import:
                 st.error("❌ Por favor, insira a seed de 12 palavras.")
             else:
                 try:
+                    from wallet.keys import import_wallet
                     result = import_wallet(seed_words, pwd_import)
                     st.session_state.wallet_created = True
                     st.session_state.unlocked = True
+                    _start_unlock(pwd_import, rerun_when_done=False)
                     st.session_state.first_address = result["first_address"]
 
                     st.success("✅ Carteira importada com sucesso!")
@@ -175,24 +372,32 @@ if not st.session_state.unlocked:
         if submitted_login:
             if not wallet_exists():
                 st.error("❌ Não há carteira salva. Crie uma primeiro.")
+            elif not pwd_try:
+                st.error("❌ Informe a senha.")
             else:
                 try:
-                    if verify_wallet_password(pwd_try):
-                        st.session_state.unlocked = True
-                        st.success("✅ Carteira desbloqueada — sessão ativa.")
-                        st.rerun()
-                    else:
-                        st.error("❌ Senha incorreta.")
+                    _start_unlock(pwd_try)
                 except Exception as e:
                     st.error(f"❌ Erro ao verificar senha: {e}")
+
+        if st.session_state.unlock_error:
+            st.error(f"❌ {st.session_state.unlock_error}")
+    if st.session_state.unlock_future is not None:
+        _unlock_status()
 else:
     col1, col2 = st.columns([3, 1])
-    col1.success("✅ Sessão ativa: carteira desbloqueada.")
+    sess = _wallet_session()
+    if sess is not None:
+        col1.success(f"✅ Sessão ativa: carteira desbloqueada (expira em {int(sess.remaining // 60) + 1} min sem uso).")
+    else:
+        col1.success("✅ Sessão ativa: carteira desbloqueada.")
+    if st.session_state.unlock_future is not None:
+        _unlock_status()
     if col2.button("Sair"):
-        st.session_state.unlocked = False
+        _lock_wallet()
+        _stop_balance_refresher()
         st.session_state.show_qr_current = False
         st.session_state.show_qr_new = False
-        st.session_state.balance_result = None
         st.rerun()
 
 st.header("📄 Informações da carteira")
@@ -203,7 +408,7 @@ elif not st.session_state.unlocked:
     st.info("Entre na carteira para visualizar informações e endereços.")
 else:
     try:
-        idxs, addrs, w = load_addresses()
+        idxs, addrs, w = view
         st.write("**Account path:**", w["account_path"])
         st.write("**Rede:**", w.get("network", "testnet"))
         st.write("**Total de endereços derivados:**", len(addrs))
@@ -269,7 +474,9 @@ else:
             st.error("❌ Informe a senha.")
         else:
             try:
+                from wallet.keys import next_address
                 addr = next_address(pwd_addr) 
+                view = _load_wallet_view(_wallet_mtime())
                 st.session_state.last_new_address = addr
                 st.success("✅ Novo endereço gerado.")
                 st.write("**Endereço:**")
@@ -286,7 +493,7 @@ else:
                 st.error(f"❌ Erro ao gerar novo endereço: {e}")
 
 
-st.header("💳 Consultar saldo")
+st.header("💳 Saldos")
 
 if not st.session_state.wallet_created:
     st.info("Crie uma carteira para consultar saldo.")
@@ -294,86 +501,64 @@ elif not st.session_state.unlocked:
     st.info("Entre na carteira para consultar saldo dos seus endereços.")
 else:
     try:
-        idxs, addrs, _ = load_addresses()
+        idxs, addrs, _ = view
         if not addrs:
             st.info("Nenhum endereço encontrado. Gere um em '➕ Gerar novo endereço'.")
         else:
-            col_left, col_right = st.columns([3, 1])
-            with col_left:
-                addr_selected = st.selectbox(
-                    "Endereço para consulta",
-                    addrs,
-                    index=len(addrs) - 1,
-                    key="addr_select_balance"
-                )
-            with col_right:
-                aggregate = st.checkbox(
-                    "Somar todos",
-                    value=False,
-                    key="aggregate_balance"
-                )
-
-            c1, c2 = st.columns([1, 1])
-            consultar = c1.button("Consultar saldo", type="primary")
-            limpar = c2.button("Limpar resultado")
-
-            if "balance_result" not in st.session_state:
-                st.session_state.balance_result = None
+            refresher = _balance_refresher(addrs)
+
+            @st.fragment(run_every=BALANCE_UI_POLL)
+            def _balance_panel():
+                # só este fragmento reexecuta a cada poll; o resto da página não espera a rede
+                snap = refresher.snapshot()
+                now = time.time()
+                rows, confirmed, unconfirmed, oldest = [], 0, 0, None
+                for i, a in zip(idxs, addrs):
+                    b = snap.get(a)
+                    if b is None or b["updated_at"] is None:
+                        status = f"erro: {b['error']}" if b and b.get("error") else "consultando…"
+                        rows.append({"#": i, "Endereço": _redact(a), "Confirmado": None,
+                                     "Não confirmado": None, "Atualizado": status})
+                        continue
+                    confirmed += b["confirmed"]
+                    unconfirmed += b["unconfirmed"]
+                    oldest = b["updated_at"] if oldest is None else min(oldest, b["updated_at"])
+                    age = f"há {int(now - b['updated_at'])}s"
+                    if b.get("error"):
+                        age += " (falha na última consulta)"
+                    rows.append({"#": i, "Endereço": _redact(a), "Confirmado": b["confirmed"],
+                                 "Não confirmado": b["unconfirmed"], "Atualizado": age})
+
+                done = sum(1 for b in snap.values() if b["updated_at"] is not None)
+                m1, m2, m3 = st.columns(3)
+                m1.metric("Confirmado (sats)", f"{confirmed:,}".replace(",", "."))
+                m2.metric("Não confirmado (sats)", f"{unconfirmed:,}".replace(",", "."))
+                m3.metric("Total (sats)", f"{confirmed + unconfirmed:,}".replace(",", "."))
+                caption = f"{done}/{len(addrs)} endereços consultados"
+                if oldest is not None:
+                    caption += f" · dado mais antigo: há {int(now - oldest)}s"
+                if refresher.refreshing:
+                    caption += " · atualizando…"
+                st.caption(caption)
+                st.dataframe(rows, hide_index=True, use_container_width=True)
+
+            _balance_panel()
+
+            c1, c2 = st.columns([1, 3])
+            if c1.button("Atualizar agora"):
+                refresher.refresh_now()
+
+            with st.expander("Ver UTXOs de um endereço", expanded=False):
+                addr_utxos = st.selectbox("Endereço", addrs, index=len(addrs) - 1, key="addr_select_utxos")
+                utxos = _cached_utxos(addr_utxos, _tip_height())
+                if not utxos:
+                    st.info("Nenhum UTXO neste endereço.")
+                for u in utxos:
+                    status = "confirmado" if u.get("status", {}).get("confirmed") else "não confirmado"
+                    st.write(f"- `{u['txid'][:16]}…:{u['vout']}` — {u['value']:,} sats ({status})")
 
-            if limpar:
-                st.session_state.balance_result = None
-
-            if consultar:
-                try:
-                    if aggregate:
-                        confirmed = unconfirmed = total = 0
-                        with st.spinner("Consultando todos os endereços..."):
-                            for a in addrs:
-                                bal = get_balance(a)
-                                confirmed += int(bal.get("confirmed", 0))
-                                unconfirmed += int(bal.get("unconfirmed", 0))
-                                total += int(bal.get("total", 0))
-                        
-                        st.session_state.balance_result = {
-                            "type": "aggregate",
-                            "confirmed": confirmed,
-                            "unconfirmed": unconfirmed,
-                            "total": total
-                        }
-                    else:
-                        with st.spinner("Consultando saldo..."):
-                            bal = get_balance(addr_selected)
-                        
-                        st.session_state.balance_result = {
-                            "type": "single",
-                            "address": addr_selected,
-                            "confirmed": int(bal.get("confirmed", 0)),
-                            "unconfirmed": int(bal.get("unconfirmed", 0)),
-                            "total": int(bal.get("total", 0))
-                        }
-                except Exception as e:
-                    st.error(f"❌ Erro ao consultar saldo: {e}")
-                    st.session_state.balance_result = None
-
-            if st.session_state.balance_result:
-                result = st.session_state.balance_result
-                
-                if result["type"] == "aggregate":
-                    st.subheader("💰 Saldo agregado (todos os endereços)")
-                    m1, m2, m3 = st.columns(3)
-                    m1.metric("Confirmado (sats)", f"{result['confirmed']:,}".replace(",", "."))
-                    m2.metric("Não confirmado (sats)", f"{result['unconfirmed']:,}".replace(",", "."))
-                    m3.metric("Total (sats)", f"{result['total']:,}".replace(",", "."))
-                else:
-                    st.subheader("💰 Saldo do endereço")
-                    st.write("**Endereço:**", result["address"])
-                    m1, m2, m3 = st.columns(3)
-                    m1.metric("Confirmado (sats)", f"{result['confirmed']:,}".replace(",", "."))
-                    m2.metric("Não confirmado (sats)", f"{result['unconfirmed']:,}".replace(",", "."))
-                    m3.metric("Total (sats)", f"{result['total']:,}".replace(",", "."))
-                    
     except Exception as e:
-        st.error(f"❌ Erro ao carregar endereços: {e}")
+        st.error(f"❌ Erro ao carregar saldos: {e}")
 
 # ============= ENVIAR TRANSAÇÃO =============
 st.header("📤 Enviar transação")
@@ -392,17 +577,22 @@ else:
     with st.expander("1️⃣ Criar plano de transação (não assina)", expanded=True):
         with st.form("tx_plan_form"):
             try:
-                idxs, addrs, _ = load_addresses()
+                idxs, addrs, _ = view
                 from_addr = st.selectbox("Do endereço", addrs, index=len(addrs)-1)
             except Exception:
                 from_addr = st.text_input("Do endereço")
 
+            use_all = st.checkbox("Usar UTXOs de todos os endereços da carteira", value=False, key="plan_all_addrs")
             to_addr = st.text_input("Para endereço (destino)")
             amount = st.number_input("Quantia (satoshis)", min_value=1, value=10000, step=1000)
-            fee_rate = st.number_input("Taxa (sats/vByte)", min_value=1, value=5, step=1)
+            fee_mode = st.radio("Taxa", ["Estimar pelo prazo", "Manual"], horizontal=True, key="plan_fee_mode")
+            fc1, fc2 = st.columns(2)
+            target_blocks = fc1.number_input("Confirmar em até (blocos)", min_value=1, max_value=1008,
+                                             value=DEFAULT_TARGET_BLOCKS, step=1, key="plan_target")
+            fee_rate = fc2.number_input("Taxa manual (sats/vByte)", min_value=1, value=5, step=1)
 
             try:
-                _, addrs_change, _ = load_addresses()
+                _, addrs_change, _ = view
                 if addrs_change:
                     change_addr = st.selectbox("Endereço de troco", addrs_change, index=len(addrs_change)-1)
                 else:
@@ -420,8 +610,11 @@ else:
             else:
                 try:
                     with st.spinner("Criando plano de transação..."):
+                        if fee_mode != "Manual":
+                            fee_rate = resolve_fee_rate(target_blocks=target_blocks)
+                        from wallet.transactions import build_tx_plan
                         plan = build_tx_plan(
-                            from_address=from_addr,
+                            from_address=None if use_all else from_addr,
                             to_address=to_addr,
                             amount_sats=amount,
                             fee_rate=fee_rate,
@@ -437,8 +630,9 @@ else:
                     c2.metric("Taxa estimada", f"{plan['estimated_fee_sats']:,} sats")
                     c1.metric("Troco", f"{plan.get('change_sats', 0):,} sats")
                     c2.metric("Tamanho estimado", f"{plan['estimated_vbytes']} vBytes")
+                    c1.metric("Taxa por vByte", f"{plan['fee_rate_sats_vb']} sats/vB")
 
-                    st.write("**De:**", plan['from_address'])
+                    st.write("**De:**", ", ".join(plan['from_addresses']))
                     st.write("**Para:**", plan['to_address'])
                     if plan.get('change_address'):
                         st.write("**Troco para:**", plan['change_address'])
@@ -446,6 +640,14 @@ else:
                     with st.expander("Ver JSON completo"):
                         st.json(plan)
 
+                    st.download_button(
+                        "Baixar plano (tx_plan.json)",
+                        data=json.dumps(plan, indent=2),
+                        file_name="tx_plan.json",
+                        mime="application/json"
+                    )
+                    st.caption("Assine exatamente este plano com: `wowlie sign --plan tx_plan.json`")
+
                     st.info("""
                     **Se quiser assinar externamente:**
                     1. Abra o Sparrow Wallet em **testnet**
@@ -460,16 +662,21 @@ else:
     with st.expander("2️⃣ Assinar e enviar localmente (WowLie)", expanded=False):
         with st.form("tx_send_form"):
             try:
-                idxs2, addrs2, _ = load_addresses()
+                idxs2, addrs2, _ = view
                 from_addr2 = st.selectbox("Do endereço", addrs2, index=len(addrs2)-1, key="send_from_addr")
             except Exception:
                 from_addr2 = st.text_input("Do endereço", key="send_from_addr_text")
 
+            use_all2 = st.checkbox("Usar UTXOs de todos os endereços da carteira", value=False, key="send_all_addrs")
             to_addr2 = st.text_input("Para endereço (destino)", key="send_to_addr")
             amount2 = st.number_input("Quantia (satoshis)", min_value=1, value=10000, step=1000, key="send_amount")
-            fee_rate2 = st.number_input("Taxa (sats/vByte)", min_value=1, value=5, step=1, key="send_fee")
+            fee_mode2 = st.radio("Taxa", ["Estimar pelo prazo", "Manual"], horizontal=True, key="send_fee_mode")
+            fc3, fc4 = st.columns(2)
+            target_blocks2 = fc3.number_input("Confirmar em até (blocos)", min_value=1, max_value=1008,
+                                              value=DEFAULT_TARGET_BLOCKS, step=1, key="send_target")
+            fee_rate2 = fc4.number_input("Taxa manual (sats/vByte)", min_value=1, value=5, step=1, key="send_fee")
             try:
-                _, addrs_change2, _ = load_addresses()
+                _, addrs_change2, _ = view
                 if addrs_change2:
                     change_addr2 = st.selectbox("Endereço de troco", addrs_change2, index=len(addrs_change2)-1, key="send_change")
                 else:
@@ -477,63 +684,51 @@ else:
             except Exception:
                 change_addr2 = from_addr2
 
+            low_r2 = st.checkbox("Assinaturas low-R (transação menor, taxa exata)", value=False, key="send_low_r")
             no_broadcast = st.checkbox("Assinar mas não enviar (mostrar/salvar HEX)", value=False, key="send_no_broadcast")
             out_hex_name = st.text_input("Salvar HEX em arquivo (opcional)", value="", placeholder="ex.: signed_tx_hex.txt", key="send_hex_file")
 
-            # Senha só para assinar localmente
-            password_local = st.text_input("Senha da carteira", type="password", key="send_wallet_pwd")
-
-            submitted_send = st.form_submit_button("Assinar (e enviar, se marcado)")
+            submitted_send = st.form_submit_button("Assinar (e enviar, se marcado)",
+                                                   disabled=st.session_state.send_future is not None)
 
         if submitted_send:
+            sess = _wallet_session()
             if not to_addr2:
                 st.error("❌ Informe o endereço de destino.")
             elif amount2 <= 0:
                 st.error("❌ Quantia deve ser maior que zero.")
-            elif not password_local:
-                st.error("❌ Digite a senha da carteira.")
+            elif sess is None:
+                st.error("❌ Sessão bloqueada ou expirada. Entre novamente na carteira.")
             else:
                 try:
-                    with st.spinner("Construindo e assinando a transação..."):
-                        tx_data = send_transaction(
-                            from_address=from_addr2,
-                            to_address=to_addr2,
-                            amount_sats=amount2,
-                            password=password_local,
-                            fee_rate=fee_rate2,
-                            change_address=change_addr2,
-                            broadcast=not no_broadcast
-                        )
-
-                    st.success("✅ Transação assinada.")
-                    st.subheader("Resumo")
-                    c1, c2 = st.columns(2)
-                    c1.metric("Valor enviado", f"{tx_data['amount_sats']:,} sats")
-                    c2.metric("Taxa", f"{tx_data['fee_sats']:,} sats")
-                    if tx_data.get("change_address"):
-                        st.write(f"**Troco:** {tx_data['change_sats']:,} sats → {tx_data['change_address']}")
-                    st.write(f"**Inputs:** {tx_data['inputs']}  |  **Outputs:** {tx_data['outputs']}")
-                    st.write(f"**Tamanho estimado:** {tx_data['vbytes']} vBytes")
-                    st.code(f"TXID (calculado): {tx_data['txid']}")
-
-                    if no_broadcast:
-                        st.info("Transação **não** enviada. Você pode usar o HEX abaixo em outra ferramenta.")
-                        st.text_area("TX HEX assinado", tx_data["signed_tx_hex"], height=160)
-                        if out_hex_name.strip():
-                            st.download_button(
-                                "Baixar HEX",
-                                data=tx_data["signed_tx_hex"],
-                                file_name=out_hex_name.strip(),
-                                mime="text/plain"
-                            )
-                    else:
-                        txid_brd = tx_data.get("txid_broadcast", tx_data["txid"])
-                        st.success("Transação enviada para a rede (testnet).")
-                        st.code(txid_brd)
-                        st.markdown(f"[Ver na Blockstream](https://blockstream.info/testnet/tx/{txid_brd})")
+                    st.session_state.send_result = None
+                    st.session_state.send_opts = {"no_broadcast": no_broadcast,
+                                                  "out_hex_name": out_hex_name.strip()}
+                    st.session_state.send_future = _executor().submit(
+                        _send_job, sess.keys(), fee_mode2, target_blocks2,
+                        from_address=None if use_all2 else from_addr2,
+                        to_address=to_addr2,
+                        amount_sats=amount2,
+                        fee_rate=fee_rate2,
+                        change_address=change_addr2,
+                        broadcast=not no_broadcast,
+                        low_r=low_r2,
+                    )
                 except Exception as e:
                     st.error(f"❌ Erro ao assinar/enviar: {e}")
 
+        if st.session_state.send_future is not None:
+            _send_status()
+        elif st.session_state.send_result is not None:
+            result = st.session_state.send_result
+            if "tx" in result and not result.get("refreshed"):
+                # saldos/UTXOs mudaram: antecipa a próxima consulta
+                result["refreshed"] = True
+                _cached_utxos.clear()
+                if "balance_refresher" in st.session_state:
+                    st.session_state.balance_refresher.refresh_now()
+            _show_send_result(result)
+
     # ------------------ BROADCAST EXTERNO (HEX pronto) ------------------
     with st.expander("3️⃣ Fazer broadcast de TX assinado (externo)", expanded=False):
         st.markdown("Cole o **transaction hex** já assinado (de outra wallet).")
@@ -545,8 +740,15 @@ else:
             else:
                 try:
                     with st.spinner("Enviando transação para a rede..."):
+                        from wallet.transactions import broadcast_tx_hex, record_signed_tx
                         txid = broadcast_tx_hex(tx_hex)
                     st.success("✅ Transação enviada com sucesso!")
+                    try:
+                        # inputs gastos e troco pendente no ledger, como num envio pela carteira
+                        if record_signed_tx(txid, tx_hex):
+                            _cached_utxos.clear()
+                    except Exception as e:
+                        st.warning(f"Transação não registrada no ledger de pendentes: {e}")
                     st.code(txid)
                     st.markdown(f"[Ver na Blockstream](https://blockstream.info/testnet/tx/{txid})")
                 except Exception as e:
@@ -580,12 +782,14 @@ else:
             st.error("❌ Informe a senha.")
         else:
             try:
+                from wallet.keys import verify_wallet_password
                 if not verify_wallet_password(pwd_del):
                     st.error("❌ Senha incorreta.")
                 else:
                     path = _wallet_file_path()
                     if os.path.exists(path):
                         os.remove(path)
+                    _clear_wallet_caches()
 
                     # Limpa estados
                     st.session_state.wallet_created = False
@@ -594,7 +798,9 @@ else:
                     st.session_state.first_address = None
                     st.session_state.last_new_address = None
                     st.session_state.tx_plan = None
-                    st.session_state.balance_result = None
+                    st.session_state.send_result = None
+                    _lock_wallet()
+                    _stop_balance_refresher()
                     for k in ("show_qr_initial", "show_qr_current", "show_qr_new"):
                         if k in st.session_state:
                             st.session_state[k] = False
@@ -610,7 +816,7 @@ with st.expander("🛡️ Boas práticas de segurança", expanded=False):
     - **Endereços são públicos**, mas não exponha sua seed/senha
     - Mostrar endereços não revela chaves privadas, mas pode afetar sua **privacidade**
     - Evite compartilhar a lista completa de endereços publicamente
-    - A **senha NÃO é armazenada**: cada ação pede a senha novamente e ela é descartada
+    - A **senha NÃO é armazenada**; as chaves ficam em memória só enquanto a sessão está desbloqueada e expiram após 5 minutos sem uso (ou ao clicar em **Sair**)
     - Use **testnet** para aprendizado; para mainnet, redobre os cuidados
     - Para valores significativos, use **hardware wallets** (Ledger, Trezor)
     - **Faça backup** das 12 palavras em papel, em múltiplos locais seguros
@@ -618,4 +824,16 @@ with st.expander("🛡️ Boas práticas de segurança", expanded=False):
     """)
 
 st.divider()
-st.caption("WowLie Wallet v1.0 - Testnet BigCute")
\ No newline at end of file
+st.caption("WowLie Wallet v1.0 - Testnet BigCute")
+# Depois da primeira tela desenhada: pré-carrega os módulos pesados e registra
+# o tempo de renderização (aparece no log do Electron).
+_prewarm_imports()
+
+@st.cache_resource
+def _startup_timings() -> dict:
+    return {}
+
+_timings = _startup_timings()
+if "first_render_ms" not in _timings:
+    _timings["first_render_ms"] = (time.perf_counter() - _SCRIPT_T0) * 1000
+    print(f"⏱️ primeira renderização: {_timings['first_render_ms']:.0f} ms", flush=True)
@@ -0,0 +1,348 @@
+"""
+Sincronização por varredura de blocos, para carteiras com muitos endereços.
+
+Em vez de consultar cada endereço (custo proporcional ao número de endereços,
+mesmo que quase todos estejam parados), o BlockScanner segue o topo da chain
+e baixa cada bloco novo uma única vez (/block/{hash}/raw no Esplora, getblock
+no bitcoind). Cada output é conferido contra o dicionário scriptPubKey ->
+endereço da carteira e cada input contra o conjunto de outpoints nossos; os
+resultados vão para um armazém local de UTXOs (~/.wowlie/chain.sqlite). O custo
+de atualizar passa a depender do número de blocos novos, não de endereços.
+
+  - início: um retrato dos UTXOs por endereço no topo atual (uma vez), ou
+    from_height para varrer a partir da altura de criação da carteira
+  - reorganizações: o hash de cada bloco varrido fica guardado (KEEP_BLOCKS);
+    se o bloco seguinte não aponta para ele, o último bloco é desfeito (UTXOs
+    criados nele somem, os gastos nele voltam) até reencontrar a chain
+  - só transações confirmadas: recebimentos no mempool só aparecem no bloco;
+    nossos envios pendentes continuam vindo do ledger (wallet/ledger.py)
+
+Ativação para a seleção de moedas: "sync": "blockscan" no config.json ou
+WOWLIE_SYNC=blockscan. Backends: esplora e bitcoind (o protocolo Electrum não
+entrega blocos inteiros).
+
+Comparação de custo contra o polling por endereço (servidor local):
+    python -m wallet.blockscan --bench [--addresses 5000 --blocks 10 --latency-ms 20]
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import os
+import sqlite3
+import time
+
+from wallet import network
+from wallet.cache import update_utxo_cache_many
+from wallet.rawtx import block_header, read_block, script_from_address
+from wallet.utils import WALLET_DIR, ensure_dirs, load_config
+
+CHAIN_DB = WALLET_DIR / "chain.sqlite"
+KEEP_BLOCKS = 144      # hashes (e gastos) mantidos para desfazer reorganizações
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS utxos (
+    txid         TEXT NOT NULL,
+    vout         INTEGER NOT NULL,
+    address      TEXT NOT NULL,
+    value        INTEGER NOT NULL,
+    height       INTEGER NOT NULL,
+    spent_txid   TEXT,
+    spent_height INTEGER,
+    PRIMARY KEY (txid, vout)
+);
+CREATE INDEX IF NOT EXISTS utxos_address ON utxos (address, spent_txid);
+CREATE TABLE IF NOT EXISTS blocks (
+    height INTEGER PRIMARY KEY,
+    hash   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS addresses (
+    address TEXT PRIMARY KEY
+);
+"""
+
+
+def enabled() -> bool:
+    """True se a carteira deve tirar os UTXOs da varredura de blocos."""
+    return (os.environ.get("WOWLIE_SYNC") or load_config().get("sync")) == "blockscan"
+
+
+def connect(path=None) -> sqlite3.Connection:
+    ensure_dirs()
+    conn = sqlite3.connect(str(path or CHAIN_DB))
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+class BlockScanner:
+    def __init__(self, addresses: Iterable[str], conn: Optional[sqlite3.Connection] = None):
+        self.conn = conn or connect()
+        self._scripts: Dict[str, str] = {}          # scriptPubKey (hex) -> endereço
+        self._owned = {(t, v) for t, v in self.conn.execute(
+            "SELECT txid, vout FROM utxos WHERE spent_txid IS NULL")}
+        self._known = {a for (a,) in self.conn.execute("SELECT address FROM addresses")}
+        self._pending_bootstrap: List[str] = []
+        self._track(addresses)
+
+    def _track(self, addresses: Iterable[str]) -> List[str]:
+        new = []
+        for addr in addresses:
+            script = script_from_address(addr).hex()
+            if script in self._scripts:
+                continue
+            self._scripts[script] = addr
+            if addr not in self._known:
+                new.append(addr)
+        self._pending_bootstrap.extend(new)
+        return new
+
+    @property
+    def height(self) -> Optional[int]:
+        row = self.conn.execute("SELECT MAX(height) FROM blocks").fetchone()
+        return row[0]
+
+    def _stored_hash(self, height: int) -> Optional[str]:
+        row = self.conn.execute("SELECT hash FROM blocks WHERE height = ?", (height,)).fetchone()
+        return row[0] if row else None
+
+    # início e endereços novos
+
+    def start(self, from_height: Optional[int] = None) -> None:
+        """
+        Define o ponto de partida se o armazém estiver vazio. Sem from_height:
+        topo atual + retrato dos UTXOs de cada endereço. Com from_height: a
+        varredura começa nessa altura (endereços sem histórico anterior).
+        """
+        if self.height is not None:
+            return
+        if from_height is None:
+            tip = network.get_tip_height()
+            self._set_base(tip, network.get_block_hash(tip))
+            self._bootstrap()
+        else:
+            self._set_base(from_height - 1, network.get_block_hash(from_height - 1))
+            self._remember(self._pending_bootstrap)
+            self._pending_bootstrap = []
+
+    def _set_base(self, height: int, block_hash: str) -> None:
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?)", (height, block_hash))
+
+    def _remember(self, addresses: List[str]) -> None:
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO addresses VALUES (?)", [(a,) for a in addresses])
+        self._known.update(addresses)
+
+    def _bootstrap(self) -> None:
+        """Retrato (por endereço, uma única vez) dos endereços ainda não conhecidos."""
+        addresses, self._pending_bootstrap = self._pending_bootstrap, []
+        if not addresses:
+            return
+        by_address = network.get_backend().get_utxos_many(addresses)
+        rows = []
+        for addr, utxos in by_address.items():
+            for u in utxos:
+                status = u.get("status", {})
+                if status.get("confirmed") and status.get("block_height") is not None:
+                    rows.append((u["txid"], u["vout"], addr, int(u["value"]), int(status["block_height"])))
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO utxos (txid, vout, address, value, height) "
+                                  "VALUES (?, ?, ?, ?, ?)", rows)
+        self._owned.update((r[0], r[1]) for r in rows)
+        self._remember(addresses)
+
+    def add_addresses(self, addresses: Iterable[str]) -> int:
+        """Passa a acompanhar endereços novos (retrato deles na próxima sincronização)."""
+        return len(self._track(addresses))
+
+    # varredura
+
+    def sync(self, max_blocks: Optional[int] = None,
+             progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """
+        Varre os blocos novos até o topo (ou até max_blocks). Retorna
+        {"height", "blocks", "received", "spent", "reorged"}.
+        """
+        backend = network.get_backend()
+        if type(backend).get_block_raw is network.Backend.get_block_raw:
+            raise RuntimeError(f"O backend {backend.name} não fornece blocos inteiros "
+                               f"(use esplora ou bitcoind para a varredura de blocos)")
+        if self.height is None:
+            self.start()
+        elif self._pending_bootstrap:
+            self._bootstrap()
+        result = {"blocks": 0, "received": 0, "spent": 0, "reorged": 0}
+        tip = network.get_tip_height()
+
+        # o bloco mais recente varrido ainda está na chain?
+        while self.height > tip or network.get_block_hash(self.height) != self._stored_hash(self.height):
+            self._rollback(self.height)
+            result["reorged"] += 1
+
+        while self.height < tip and (max_blocks is None or result["blocks"] < max_blocks):
+            height = self.height + 1
+            block_hash = network.get_block_hash(height)
+            raw = network.get_block_raw(block_hash)
+            header = block_header(raw)
+            if header["hash"] != block_hash:
+                raise RuntimeError(f"Bloco {height} recebido não confere com o hash {block_hash}")
+            if header["prev_hash"] != self._stored_hash(height - 1):
+                # reorganização entre a consulta do topo e agora
+                self._rollback(height - 1)
+                result["reorged"] += 1
+                continue
+            received, spent = self._apply(height, block_hash, raw)
+            result["blocks"] += 1
+            result["received"] += received
+            result["spent"] += spent
+            if progress:
+                progress(height, tip)
+        result["height"] = self.height
+        return result
+
+    def _apply(self, height: int, block_hash: str, raw: bytes) -> Tuple[int, int]:
+        received, spent = [], []
+        for tx in read_block(raw):
+            for vin in tx["vin"]:
+                op = (vin["txid"], vin["vout"])
+                if op in self._owned:
+                    self._owned.discard(op)
+                    spent.append((tx["txid"], height, op[0], op[1]))
+            for n, o in enumerate(tx["vout"]):
+                addr = self._scripts.get(o["scriptpubkey"])
+                if addr is not None:
+                    self._owned.add((tx["txid"], n))
+                    received.append((tx["txid"], n, addr, o["value"], height))
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO utxos (txid, vout, address, value, height) "
+                                  "VALUES (?, ?, ?, ?, ?)", received)
+            self.conn.executemany("UPDATE utxos SET spent_txid = ?, spent_height = ? "
+                                  "WHERE txid = ? AND vout = ?", spent)
+            self.conn.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?)", (height, block_hash))
+            self.conn.execute("DELETE FROM blocks WHERE height < ?", (height - KEEP_BLOCKS,))
+            self.conn.execute("DELETE FROM utxos WHERE spent_height < ?", (height - KEEP_BLOCKS,))
+        return len(received), len(spent)
+
+    def _rollback(self, height: int) -> None:
+        """Desfaz o bloco height (que saiu da chain)."""
+        if self._stored_hash(height - 1) is None:
+            raise RuntimeError(f"Reorganização mais profunda que {KEEP_BLOCKS} blocos; "
+                               f"reconstrua o armazém (sync-blocks --rebuild)")
+        with self.conn:
+            self.conn.execute("DELETE FROM utxos WHERE height = ?", (height,))
+            self.conn.execute("UPDATE utxos SET spent_txid = NULL, spent_height = NULL "
+                              "WHERE spent_height = ?", (height,))
+            self.conn.execute("DELETE FROM blocks WHERE height = ?", (height,))
+        self._owned = {(t, v) for t, v in self.conn.execute(
+            "SELECT txid, vout FROM utxos WHERE spent_txid IS NULL")}
+
+    # leitura
+
+    def utxos(self, addresses: Optional[Iterable[str]] = None) -> Dict[str, list]:
+        """{endereço: UTXOs} no formato da API Esplora (só confirmados)."""
+        wanted = list(addresses) if addresses is not None else list(self._scripts.values())
+        by_address = {a: [] for a in wanted}
+        rows = self.conn.execute("SELECT txid, vout, address, value, height FROM utxos "
+                                 "WHERE spent_txid IS NULL ORDER BY height, txid, vout")
+        for txid, vout, addr, value, height in rows:
+            if addr in by_address:
+                by_address[addr].append({"txid": txid, "vout": vout, "value": value,
+                                         "status": {"confirmed": True, "block_height": height}})
+        return by_address
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def rebuild(path=None) -> None:
+    """Apaga o armazém (a próxima sincronização recomeça do zero)."""
+    for suffix in ("", "-journal", "-wal"):
+        try:
+            os.remove(str(path or CHAIN_DB) + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def wallet_utxos(addresses: Optional[List[str]] = None) -> Dict[str, list]:
+    """
+    Sincroniza os blocos novos e devolve {endereço: UTXOs} dos endereços
+    informados (padrão: todos da carteira); também atualiza o cache de UTXOs.
+    """
+    from wallet.utils import load_addresses
+    _, all_addresses, _ = load_addresses()
+    scanner = BlockScanner(all_addresses)
+    try:
+        scanner.sync()
+        by_address = scanner.utxos(addresses if addresses is not None else all_addresses)
+    finally:
+        scanner.close()
+    update_utxo_cache_many(by_address)
+    return by_address
+
+
+# ---------------------------
+# Benchmark
+# ---------------------------
+
+def benchmark(n_addresses: int = 5000, n_blocks: int = 10, payments_per_block: int = 20,
+              latency: float = 0.02, seed: int = 0) -> Dict:
+    """
+    Servidor Esplora local com n_addresses endereços; a cada bloco alguns
+    recebem pagamentos. Compara uma atualização depois de n_blocks blocos:
+    polling de UTXOs por endereço (em paralelo, get_utxos_many) x varredura de blocos.
+    """
+    import random
+    import tempfile
+    from btclib import b32
+    from wallet.esplora_standin import ChainState, EsploraStandIn
+
+    rng = random.Random(seed)
+    addrs = [b32.address_from_witness(0, rng.randbytes(20), "testnet") for _ in range(n_addresses)]
+    state = ChainState()
+    server = EsploraStandIn(state, latency=latency).start()
+    previous = network.get_backend()
+    network.use_backend(network.EsploraBackend(server.url))
+    tmp = tempfile.mkdtemp()
+    try:
+        scanner = BlockScanner(addrs, connect(os.path.join(tmp, "chain.sqlite")))
+        scanner.start(from_height=state.tip_height + 1)
+        for _ in range(n_blocks):
+            for addr in rng.sample(addrs, payments_per_block):
+                state.fund(addr, [rng.randint(1_000, 100_000)], confirmed=False)
+            state.mine()
+
+        before = server.requests
+        t0 = time.perf_counter()
+        polled = network.get_backend().get_utxos_many(addrs)
+        poll = {"requests": server.requests - before, "seconds": time.perf_counter() - t0}
+
+        before = server.requests
+        t0 = time.perf_counter()
+        scanner.sync()
+        scanned = scanner.utxos()
+        scan = {"requests": server.requests - before, "seconds": time.perf_counter() - t0}
+        scanner.close()
+
+        key = lambda by: {a: sorted((u["txid"], u["vout"], u["value"]) for u in us) for a, us in by.items()}
+        return {"addresses": n_addresses, "blocks": n_blocks, "polling": poll, "blockscan": scan,
+                "same_utxos": key(polled) == key(scanned)}
+    finally:
+        network.use_backend(previous)
+        server.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    p = argparse.ArgumentParser(description="Varredura de blocos: comparação com polling por endereço")
+    p.add_argument("--bench", action="store_true")
+    p.add_argument("--addresses", type=int, default=5000)
+    p.add_argument("--blocks", type=int, default=10)
+    p.add_argument("--payments", type=int, default=20, help="pagamentos por bloco")
+    p.add_argument("--latency-ms", type=float, default=20.0)
+    args = p.parse_args()
+    if not args.bench:
+        p.print_help()
+    else:
+        r = benchmark(args.addresses, args.blocks, args.payments, args.latency_ms / 1000)
+        print(f"{r['addresses']} endereços, {r['blocks']} blocos novos (latência {args.latency_ms:.0f} ms)")
+        for name in ("polling", "blockscan"):
+            print(f"  {name:<10} {r[name]['requests']:>6} requisições  {r[name]['seconds']:>7.2f} s")
+        print(f"  mesmos UTXOs: {'sim' if r['same_utxos'] else 'NÃO'}")
@@ -0,0 +1,111 @@
+"""
+Cache local de UTXOs (~/.wowlie/utxo_cache.json).
+
+Toda consulta de UTXOs à rede grava aqui o último resultado de cada endereço.
+Isso permite validar um plano de transação (inputs ainda não gastos) sem
+nenhuma chamada de rede.
+
+Streamlit, refresher, blockscan e a CLI atualizam o cache ao mesmo tempo: a
+mescla (ler, alterar, gravar) roda sob um lock de arquivo, e cada escrita usa
+um arquivo temporário próprio antes do os.replace.
+"""
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import os
+import tempfile
+import threading
+import time
+
+from wallet.utils import WALLET_DIR, file_lock
+
+UTXO_CACHE_FILE = WALLET_DIR / "utxo_cache.json"
+CACHE_LOCK_FILE = WALLET_DIR / "utxo_cache.lock"
+
+_thread_lock = threading.Lock()
+
+
+@contextmanager
+def cache_lock():
+    """Lock exclusivo entre processos (arquivo) e threads para atualizar o cache."""
+    with _thread_lock, file_lock(CACHE_LOCK_FILE):
+        yield
+
+
+def load_utxo_cache() -> Dict[str, dict]:
+    """
+    Retorna {endereço: {"fetched_at": timestamp, "utxos": [...]}} (vazio se não existir).
+    """
+    try:
+        with open(UTXO_CACHE_FILE) as f:
+            return json.load(f).get("addresses", {})
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def update_utxo_cache(address: str, utxos: List[dict]) -> None:
+    """
+    Grava os UTXOs atuais de um endereço no cache (best-effort: falhas de disco
+    não devem quebrar a consulta de rede que originou a atualização).
+    """
+    update_utxo_cache_many({address: utxos})
+
+
+def update_utxo_cache_many(utxos_by_address: Dict[str, List[dict]], forget: Iterable[str] = ()) -> None:
+    """
+    Como update_utxo_cache, para vários endereços com uma única escrita.
+    forget: endereços que saem do cache (UTXOs demais para guardar em JSON;
+    sem a entrada, a validação de planos os trata como desconhecidos).
+    """
+    forget = list(forget)
+    if not utxos_by_address and not forget:
+        return
+    try:
+        with cache_lock():
+            cache = load_utxo_cache()
+            now = int(time.time())
+            for address, utxos in utxos_by_address.items():
+                cache[address] = {"fetched_at": now, "utxos": utxos}
+            for address in forget:
+                cache.pop(address, None)
+            f = tempfile.NamedTemporaryFile("w", dir=WALLET_DIR, prefix="utxo_cache.", suffix=".tmp", delete=False)
+            try:
+                with f:
+                    json.dump({"addresses": cache}, f)
+                os.replace(f.name, UTXO_CACHE_FILE)
+            except BaseException:
+                os.unlink(f.name)
+                raise
+    except (OSError, TypeError, ValueError):
+        pass
+
+
+def cached_utxos(address: str) -> Optional[List[dict]]:
+    """
+    Últimos UTXOs conhecidos do endereço, ou None se ele nunca foi consultado.
+    """
+    entry = load_utxo_cache().get(address)
+    return entry["utxos"] if entry else None
+
+
+def check_inputs_unspent(inputs: List[dict]) -> Tuple[List[str], List[str]]:
+    """
+    Confere os inputs (txid, vout, address) contra o cache.
+    Retorna (gastos, desconhecidos): outpoints que não aparecem mais entre os
+    UTXOs do endereço e outpoints cujo endereço nunca foi consultado.
+    """
+    cache = load_utxo_cache()
+    live: Dict[str, set] = {}
+    spent, unknown = [], []
+    for inp in inputs:
+        outpoint = f"{inp['txid']}:{inp['vout']}"
+        address = inp.get("address")
+        entry = cache.get(address)
+        if entry is None:
+            unknown.append(outpoint)
+            continue
+        if address not in live:
+            live[address] = {(u["txid"], u["vout"]) for u in entry["utxos"]}
+        if (inp["txid"], inp["vout"]) not in live[address]:
+            spent.append(outpoint)
+    return spent, unknown
@@ -0,0 +1,228 @@
+"""
+Backend de curva elíptica (secp256k1) usado pela carteira.
+
+Operações expostas:
+  - pubkey_from_privkey: multiplicação de ponto k*G (pubkey comprimida)
+  - sign: ECDSA determinístico (RFC6979), low-S, em DER
+  - verify: verificação ECDSA
+  - sign_low_r: sign com grinding até r < 2^255 (DER de até 70 bytes)
+
+Usa a biblioteca nativa coincurve (libsecp256k1) quando estiver instalada;
+caso contrário, cai para o btclib. Os dois backends produzem assinaturas e
+endereços idênticos byte a byte; confira com:
+    python -m wallet.ec
+"""
+from typing import Dict, List, Optional
+import os
+
+from btclib.ec import bytes_from_point, mult
+from btclib.ecc import dsa
+
+# ordem do grupo secp256k1
+N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+
+
+class BtclibBackend:
+    """Implementação com btclib (fallback)."""
+    name = "btclib"
+
+    def pubkey_from_privkey(self, prv: bytes) -> bytes:
+        return bytes_from_point(mult(int.from_bytes(prv, "big")))
+
+    def sign(self, digest: bytes, prv: bytes, extra_entropy: Optional[bytes] = None) -> bytes:
+        if extra_entropy is None:
+            return dsa.sign_(digest, prv).serialize()
+        # entropia extra (ndata) só pelo nonce RFC6979 da própria libsecp256k1,
+        # nos bindings que acompanham o btclib (btclib_libsecp256k1)
+        try:
+            from btclib.ec.libsecp256k1 import ctx, ffi, lib
+        except ImportError:
+            raise RuntimeError("Assinar com entropia extra (low-R) exige o pacote btclib_libsecp256k1 ou coincurve.")
+        sig = ffi.new("secp256k1_ecdsa_signature *")
+        ndata = ffi.new("unsigned char[32]", extra_entropy)
+        if not lib.secp256k1_ecdsa_sign(ctx, sig, bytes(digest), bytes(prv), ffi.NULL, ndata):
+            raise RuntimeError("secp256k1_ecdsa_sign falhou")
+        der = ffi.new("unsigned char[72]")
+        length = ffi.new("size_t *", 72)
+        lib.secp256k1_ecdsa_signature_serialize_der(ctx, der, length, sig)
+        return bytes(ffi.buffer(der, length[0]))
+
+    def verify(self, digest: bytes, sig_der: bytes, pub_key: bytes) -> bool:
+        try:
+            return bool(dsa.verify_(digest, pub_key, sig_der))
+        except Exception:
+            return False
+
+
+class CoincurveBackend:
+    """Implementação nativa com coincurve (libsecp256k1)."""
+    name = "coincurve"
+
+    def __init__(self):
+        import coincurve
+        from coincurve._libsecp256k1 import ffi
+        self._cc = coincurve
+        self._ffi = ffi
+
+    def pubkey_from_privkey(self, prv: bytes) -> bytes:
+        return self._cc.PrivateKey(bytes(prv)).public_key.format(compressed=True)
+
+    def sign(self, digest: bytes, prv: bytes, extra_entropy: Optional[bytes] = None) -> bytes:
+        key = self._cc.PrivateKey(bytes(prv))
+        if extra_entropy is None:
+            return key.sign(digest, hasher=None)
+        ndata = self._ffi.new("unsigned char[32]", extra_entropy)
+        return key.sign(digest, hasher=None, custom_nonce=(self._ffi.NULL, ndata))
+
+    def verify(self, digest: bytes, sig_der: bytes, pub_key: bytes) -> bool:
+        try:
+            return self._cc.PublicKey(pub_key).verify(sig_der, digest, hasher=None)
+        except Exception:
+            return False
+
+
+def available_backends() -> Dict[str, object]:
+    """Backends instaláveis neste ambiente, do mais rápido para o fallback."""
+    backends = {}
+    try:
+        backends["coincurve"] = CoincurveBackend()
+    except ImportError:
+        pass
+    backends["btclib"] = BtclibBackend()
+    return backends
+
+
+_backend = None
+
+
+def get_backend():
+    """
+    Backend ativo. WOWLIE_EC_BACKEND=btclib|coincurve força um específico.
+    """
+    global _backend
+    if _backend is None:
+        backends = available_backends()
+        forced = os.environ.get("WOWLIE_EC_BACKEND")
+        if forced and forced not in backends:
+            raise RuntimeError(f"Backend EC '{forced}' não disponível (instalados: {', '.join(backends)})")
+        _backend = backends[forced] if forced else next(iter(backends.values()))
+    return _backend
+
+
+def use_backend(name: str) -> None:
+    """Troca o backend ativo (útil para testes e benchmarks)."""
+    global _backend
+    backends = available_backends()
+    if name not in backends:
+        raise RuntimeError(f"Backend EC '{name}' não disponível (instalados: {', '.join(backends)})")
+    _backend = backends[name]
+
+
+def pubkey_from_privkey(prv: bytes) -> bytes:
+    """Pubkey comprimida (33 bytes) de uma chave privada de 32 bytes."""
+    return get_backend().pubkey_from_privkey(prv)
+
+
+def sign(digest: bytes, prv: bytes, extra_entropy: Optional[bytes] = None) -> bytes:
+    """
+    Assinatura ECDSA (DER, low-S) de um digest de 32 bytes.
+    extra_entropy (32 bytes) entra na semente do nonce RFC6979, como o
+    parâmetro ndata da libsecp256k1; o resultado continua determinístico.
+    """
+    if extra_entropy is not None and len(extra_entropy) != 32:
+        raise ValueError("extra_entropy deve ter 32 bytes")
+    return get_backend().sign(digest, prv, extra_entropy)
+
+
+def verify(digest: bytes, sig_der: bytes, pub_key: bytes) -> bool:
+    """Verifica uma assinatura ECDSA DER contra a pubkey."""
+    return get_backend().verify(digest, sig_der, pub_key)
+
+
+def is_low_r(sig_der: bytes) -> bool:
+    """
+    True se r < 2^255, isto é, r cabe em 32 bytes no DER sem byte 0x00 de sinal.
+    DER: 0x30 len 0x02 len_r r... ; len_r <= 32 equivale a r < 2^255.
+    """
+    return sig_der[3] <= 32
+
+
+def sign_low_r(digest: bytes, prv: bytes) -> bytes:
+    """
+    Assina e, se R ficar alto, assina de novo com entropia extra determinística
+    (contador de 32 bytes little-endian, como o Bitcoin Core) até r < 2^255.
+    Garante DER <= 70 bytes (71 com o byte de sighash); em média 2 tentativas.
+    Continua determinístico.
+    """
+    sig = sign(digest, prv)
+    counter = 0
+    while not is_low_r(sig):
+        counter += 1
+        sig = sign(digest, prv, counter.to_bytes(32, "little"))
+    return sig
+
+
+def differential_check(n: int = 50) -> List[str]:
+    """
+    Compara todos os backends instalados entre si (pubkeys, endereços e
+    assinaturas com e sem entropia extra) e os endereços BIP32 da carteira
+    (derive_prv + pubkey do backend) contra os do btclib. Retorna a lista de
+    divergências (vazia = tudo igual).
+    """
+    from btclib import b32
+    from btclib.bip32 import rootxprv_from_seed, derive
+    from btclib.to_pub_key import pub_keyinfo_from_key
+    from wallet.keys import bip32_master_key, derive_prv
+
+    problems = []
+    backends = available_backends()
+    for i in range(n):
+        prv = os.urandom(32)
+        digest = os.urandom(32)
+        extra = i.to_bytes(32, "little")
+        results = {}
+        for name, b in backends.items():
+            pub = b.pubkey_from_privkey(prv)
+            sig = b.sign(digest, prv)
+            sig_extra = b.sign(digest, prv, extra)
+            if not (b.verify(digest, sig, pub) and b.verify(digest, sig_extra, pub)):
+                problems.append(f"{name}: assinatura inválida (caso {i})")
+            results[name] = (pub, b32.p2wpkh(pub, network="testnet"), sig, sig_extra)
+        if len(set(results.values())) > 1:
+            problems.append(f"backends divergem (caso {i}): {', '.join(results)}")
+
+        seed = os.urandom(64)
+        path = f"m/84'/1'/0'/{i % 2}/{i}"
+        rootxprv = rootxprv_from_seed(seed)
+        expected = b32.p2wpkh(pub_keyinfo_from_key(derive(rootxprv, path))[0], network="testnet")
+        prv_child, _ = derive_prv(bip32_master_key(seed), path)
+        for name, b in backends.items():
+            got = b32.p2wpkh(b.pubkey_from_privkey(prv_child), network="testnet")
+            if got != expected:
+                problems.append(f"{name}: endereço BIP32 diverge do btclib em {path}")
+    return problems
+
+
+if __name__ == "__main__":
+    import time
+
+    names = list(available_backends())
+    print(f"Backends disponíveis: {', '.join(names)} (ativo: {get_backend().name})")
+    problems = differential_check()
+    if problems:
+        for p in problems:
+            print(f"  - {p}")
+        raise SystemExit(1)
+    print("OK: backends e derivação BIP32 idênticos byte a byte.")
+
+    prv, digest = os.urandom(32), os.urandom(32)
+    for name, b in available_backends().items():
+        t0 = time.perf_counter()
+        for _ in range(200):
+            b.pubkey_from_privkey(prv)
+        t_pub = (time.perf_counter() - t0) / 200
+        t0 = time.perf_counter()
+        for _ in range(200):
+            b.sign(digest, prv, b"\x01" * 32)
+        t_sig = (time.perf_counter() - t0) / 200
+        print(f"{name:>10}: pubkey {t_pub * 1e6:8.1f} µs | sign (ndata) {t_sig * 1e6:8.1f} µs")
@@ -0,0 +1,705 @@
+"""
+Backend Electrum: protocolo Electrum (JSON-RPC, uma mensagem por linha) numa
+conexão TCP/TLS persistente.
+
+Em vez de uma requisição HTTP por endereço, as consultas de vários endereços
+(blockchain.scripthash.get_balance / listunspent / get_history) vão num único
+lote JSON-RPC: centenas de endereços custam uma ida e volta. Endereços são
+identificados pelo scripthash (sha256 do scriptPubKey, bytes invertidos).
+subscribe() usa blockchain.scripthash.subscribe: o servidor avisa quando o
+histórico de um endereço muda e a conexão é refeita (com nova inscrição) se
+cair.
+
+As respostas são convertidas para o formato da API Esplora (o mesmo de
+wallet.network). Transações são decodificadas do hex bruto; prevouts e
+horário dos blocos vêm de lotes adicionais e as transações ficam num cache
+em memória (são imutáveis).
+
+Servidor de teste local, com carteira sintética, e comparação lote vs. uma
+chamada por endereço:
+    python -m wallet.electrum [--addresses 500] [--latency-ms 20]
+    python -m wallet.electrum --serve 50001     # para usar com WOWLIE_BACKEND=electrum
+"""
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import ssl
+import struct
+import threading
+import time
+
+from btclib import b32
+
+from wallet.network import Backend
+from wallet.rawtx import decode_raw_tx, hash256, script_address, script_from_address, synthetic_funding_tx
+
+PROTOCOL_VERSION = "1.4"
+DEFAULT_PORTS = {False: 50001, True: 50002}   # tcp, ssl
+BATCH_SIZE = 500           # chamadas por lote (servidores limitam o tamanho da requisição)
+REQUEST_TIMEOUT = 30       # segundos
+RECONNECT_DELAY = 5        # segundos entre tentativas de reconexão das inscrições
+TX_CACHE_SIZE = 5000
+MEMPOOL_PAGE_SIZE = 50     # mesma paginação de /address/{a}/txs
+CHAIN_PAGE_SIZE = 25
+FEE_TARGETS = (1, 2, 3, 4, 5, 6, 10, 20, 144, 504, 1008)
+
+
+class ElectrumError(RuntimeError):
+    pass
+
+
+def scripthash(address: str) -> str:
+    """Identificador do endereço no protocolo: sha256(scriptPubKey), bytes invertidos."""
+    return hashlib.sha256(script_from_address(address)).digest()[::-1].hex()
+
+
+# ---------------------------
+# Cliente JSON-RPC
+# ---------------------------
+
+class ElectrumClient:
+    """
+    Conexão persistente com um servidor Electrum. batch() manda várias
+    chamadas numa única linha (array JSON-RPC); uma thread leitora entrega as
+    respostas por id e repassa notificações para os handlers registrados.
+    Seguro para uso por várias threads.
+    """
+
+    def __init__(self, host: str, port: int, use_ssl: bool = False, ssl_verify: bool = True,
+                 timeout: float = REQUEST_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.ssl_verify = ssl_verify
+        self.timeout = timeout
+        self.server_version = None
+        self.round_trips = 0
+        self._sock = None
+        self._next_id = 0
+        self._pending: Dict[int, dict] = {}
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._handlers: Dict[str, Callable[[list], None]] = {}
+        self._on_reconnect: List[Callable[[], None]] = []
+        self._closed = False
+
+    # conexão
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    def _connect(self) -> None:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.use_ssl:
+            ctx = ssl.create_default_context()
+            if not self.ssl_verify:
+                # muitos servidores Electrum usam certificado autoassinado
+                ctx.check_hostname = False
+                ctx.verify_mode = ssl.CERT_NONE
+            sock = ctx.wrap_socket(sock, server_hostname=self.host)
+        sock.settimeout(None)
+        self._sock = sock
+        threading.Thread(target=self._read_loop, args=(sock,), name="wowlie-electrum-reader",
+                         daemon=True).start()
+        self.server_version = self._call_now([("server.version", ["wowlie", PROTOCOL_VERSION])])[0]
+
+    def _ensure_connected(self) -> None:
+        with self._connect_lock:
+            if self._closed:
+                raise ElectrumError("Conexão Electrum fechada")
+            if self._sock is None:
+                try:
+                    self._connect()
+                except OSError as e:
+                    self._sock = None
+                    raise ElectrumError(f"Não foi possível conectar a {self.host}:{self.port}: {e}")
+
+    def close(self) -> None:
+        self._closed = True
+        self._drop_connection()
+
+    def _drop_connection(self, error: str = "Conexão Electrum encerrada") -> None:
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for waiter in {id(w): w for w in pending.values()}.values():
+            waiter["error"] = error
+            waiter["event"].set()
+
+    # leitura
+
+    def _read_loop(self, sock) -> None:
+        f = sock.makefile("rb")
+        try:
+            for line in f:
+                if not line.strip():
+                    continue
+                msg = json.loads(line)
+                for item in msg if isinstance(msg, list) else [msg]:
+                    self._dispatch(item)
+        except (OSError, ValueError):
+            pass
+        if sock is self._sock:
+            self._drop_connection()
+            if not self._closed and self._on_reconnect:
+                threading.Thread(target=self._reconnect_loop, name="wowlie-electrum-reconnect",
+                                 daemon=True).start()
+
+    def _dispatch(self, item: dict) -> None:
+        if item.get("id") is None:
+            handler = self._handlers.get(item.get("method"))
+            if handler is not None:
+                try:
+                    handler(item.get("params") or [])
+                except Exception:
+                    pass
+            return
+        with self._lock:
+            waiter = self._pending.pop(item["id"], None)
+        if waiter is None:
+            return
+        waiter["responses"][item["id"]] = item
+        if len(waiter["responses"]) == len(waiter["ids"]):
+            waiter["event"].set()
+
+    def _reconnect_loop(self) -> None:
+        while not self._closed and self._sock is None:
+            time.sleep(RECONNECT_DELAY)
+            try:
+                self._ensure_connected()
+            except ElectrumError:
+                continue
+            for cb in list(self._on_reconnect):
+                try:
+                    cb()
+                except Exception:
+                    pass
+
+    # chamadas
+
+    def _call_now(self, calls: List[Tuple[str, list]]) -> list:
+        """Envia um lote e espera todas as respostas (sem reconectar)."""
+        with self._lock:
+            ids = list(range(self._next_id, self._next_id + len(calls)))
+            self._next_id += len(calls)
+            waiter = {"ids": ids, "responses": {}, "event": threading.Event(), "error": None}
+            for i in ids:
+                self._pending[i] = waiter
+        payload = [{"jsonrpc": "2.0", "id": i, "method": m, "params": list(p)}
+                   for i, (m, p) in zip(ids, calls)]
+        data = json.dumps(payload if len(payload) > 1 else payload[0]).encode() + b"\n"
+        sock = self._sock
+        try:
+            if sock is None:
+                raise OSError("não conectado")
+            with self._write_lock:
+                sock.sendall(data)
+        except OSError as e:
+            self._drop_connection()
+            raise ElectrumError(f"Falha ao enviar para o servidor Electrum: {e}")
+        self.round_trips += 1
+        if not waiter["event"].wait(self.timeout):
+            with self._lock:
+                for i in ids:
+                    self._pending.pop(i, None)
+            raise ElectrumError(f"Servidor Electrum não respondeu em {self.timeout} s")
+        if waiter["error"]:
+            raise ElectrumError(waiter["error"])
+
+        results = []
+        for i, (method, _) in zip(ids, calls):
+            resp = waiter["responses"][i]
+            if resp.get("error"):
+                err = resp["error"]
+                message = err.get("message", err) if isinstance(err, dict) else err
+                raise ElectrumError(f"{method}: {message}")
+            results.append(resp.get("result"))
+        return results
+
+    def batch(self, calls: List[Tuple[str, list]]) -> list:
+        """Resultados de várias chamadas, na ordem, em lotes de até BATCH_SIZE."""
+        self._ensure_connected()
+        results = []
+        for i in range(0, len(calls), BATCH_SIZE):
+            results.extend(self._call_now(calls[i:i + BATCH_SIZE]))
+        return results
+
+    def call(self, method: str, *params):
+        return self.batch([(method, list(params))])[0]
+
+    def on_notification(self, method: str, handler: Callable[[list], None]) -> None:
+        self._handlers[method] = handler
+
+    def on_reconnect(self, callback: Callable[[], None]) -> None:
+        self._on_reconnect.append(callback)
+
+
+# ---------------------------
+# Backend
+# ---------------------------
+
+def _esplora_status(height: Optional[int], block_time: Optional[int] = None) -> dict:
+    if height and height > 0:
+        status = {"confirmed": True, "block_height": height}
+        if block_time is not None:
+            status["block_time"] = block_time
+        return status
+    return {"confirmed": False}
+
+
+class ElectrumBackend(Backend):
+    name = "electrum"
+    batched = True
+
+    def __init__(self, host: str, port: Optional[int] = None, use_ssl: bool = False,
+                 ssl_verify: bool = True, network: str = "testnet"):
+        self.network = network
+        self.client = ElectrumClient(host, port or DEFAULT_PORTS[use_ssl], use_ssl, ssl_verify)
+        self._tx_cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._tip: Optional[int] = None
+        self._subscribed: Dict[str, str] = {}          # scripthash -> endereço
+        self._callbacks: List[Callable[[str, Optional[str]], None]] = []
+        self.client.on_notification("blockchain.headers.subscribe", self._on_header)
+        self.client.on_notification("blockchain.scripthash.subscribe", self._on_scripthash)
+        self.client.on_reconnect(self._resubscribe)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ElectrumBackend":
+        """
+        Seção "electrum" do config.json ({"host", "port", "ssl", "ssl_verify",
+        "network"}) ou WOWLIE_ELECTRUM_SERVER=host:porta[:s|t] (s = TLS).
+        """
+        config = dict(config)
+        server = os.environ.get("WOWLIE_ELECTRUM_SERVER")
+        if server:
+            parts = server.rsplit(":", 2) if server.count(":") >= 2 else server.split(":")
+            config["host"] = parts[0]
+            if len(parts) > 1:
+                config["port"] = int(parts[1])
+            if len(parts) > 2:
+                config["ssl"] = parts[2] == "s"
+        if not config.get("host"):
+            raise RuntimeError("Backend electrum sem servidor: defina electrum.host no config.json "
+                               "ou WOWLIE_ELECTRUM_SERVER=host:porta")
+        return cls(config["host"], config.get("port"), bool(config.get("ssl", False)),
+                   bool(config.get("ssl_verify", True)), config.get("network", "testnet"))
+
+    def close(self) -> None:
+        self.client.close()
+
+    # saldos e UTXOs
+
+    def get_utxos(self, address: str) -> list:
+        return self.get_utxos_many([address])[address]
+
+    def get_utxos_many(self, addresses: List[str]) -> Dict[str, list]:
+        results = self.client.batch([("blockchain.scripthash.listunspent", [scripthash(a)])
+                                     for a in addresses])
+        return {a: [{"txid": u["tx_hash"], "vout": u["tx_pos"], "value": u["value"],
+                     "status": _esplora_status(u.get("height"))} for u in us]
+                for a, us in zip(addresses, results)}
+
+    def get_balance(self, address: str) -> dict:
+        return self.get_balances([address])[address]
+
+    def get_balances(self, addresses: List[str]) -> Dict[str, dict]:
+        results = self.client.batch([("blockchain.scripthash.get_balance", [scripthash(a)])
+                                     for a in addresses])
+        return {a: {"confirmed": int(r["confirmed"]), "unconfirmed": int(r["unconfirmed"]),
+                    "total": int(r["confirmed"]) + int(r["unconfirmed"])}
+                for a, r in zip(addresses, results)}
+
+    # transações
+
+    def _raw_txs(self, txids: List[str]) -> Dict[str, Dict]:
+        """Transações decodificadas, buscando num único lote as que não estão no cache."""
+        with self._cache_lock:
+            found = {t: self._tx_cache[t] for t in txids if t in self._tx_cache}
+        missing = list(dict.fromkeys(t for t in txids if t not in found))
+        if missing:
+            raws = self.client.batch([("blockchain.transaction.get", [t]) for t in missing])
+            with self._cache_lock:
+                for txid, raw in zip(missing, raws):
+                    tx = decode_raw_tx(bytes.fromhex(raw))
+                    found[txid] = self._tx_cache[txid] = tx
+                while len(self._tx_cache) > TX_CACHE_SIZE:
+                    self._tx_cache.popitem(last=False)
+        return found
+
+    def _block_times(self, heights: List[int]) -> Dict[int, int]:
+        heights = sorted({h for h in heights if h and h > 0})
+        headers = self.client.batch([("blockchain.block.header", [h]) for h in heights])
+        return {h: struct.unpack("<I", bytes.fromhex(hdr)[68:72])[0] for h, hdr in zip(heights, headers)}
+
+    def _esplora_txs(self, entries: List[Tuple[str, Optional[int]]]) -> List[dict]:
+        """[(txid, altura)] -> transações no formato Esplora, com prevouts e taxa."""
+        txs = self._raw_txs([t for t, _ in entries])
+        prev_ids = [vin["txid"] for t, _ in entries for vin in txs[t]["vin"] if not vin["is_coinbase"]]
+        prevs = self._raw_txs(prev_ids)
+        times = self._block_times([h for _, h in entries])
+
+        out = []
+        for txid, height in entries:
+            tx = txs[txid]
+            vouts = [self._esplora_vout(o) for o in tx["vout"]]
+            vins = []
+            for vin in tx["vin"]:
+                entry = {"txid": vin["txid"], "vout": vin["vout"], "sequence": vin["sequence"],
+                         "is_coinbase": vin["is_coinbase"]}
+                if not vin["is_coinbase"]:
+                    entry["prevout"] = self._esplora_vout(prevs[vin["txid"]]["vout"][vin["vout"]])
+                vins.append(entry)
+            fee = 0
+            if not any(v["is_coinbase"] for v in vins):
+                fee = sum(v["prevout"]["value"] for v in vins) - sum(o["value"] for o in vouts)
+            out.append({"txid": txid, "version": tx["version"], "locktime": tx["locktime"],
+                        "vin": vins, "vout": vouts, "weight": tx["weight"], "fee": fee,
+                        "status": _esplora_status(height, times.get(height))})
+        return out
+
+    def _esplora_vout(self, o: dict) -> dict:
+        entry = {"scriptpubkey": o["scriptpubkey"], "value": o["value"]}
+        addr = script_address(bytes.fromhex(o["scriptpubkey"]), self.network)
+        if addr:
+            entry["scriptpubkey_address"] = addr
+        return entry
+
+    def get_address_txs(self, address: str, last_seen_txid: Optional[str] = None) -> list:
+        """Mesma paginação do Esplora, montada sobre blockchain.scripthash.get_history."""
+        history = self.client.call("blockchain.scripthash.get_history", scripthash(address))
+        mempool = [(h["tx_hash"], None) for h in history if h["height"] <= 0]
+        chain = [(h["tx_hash"], h["height"]) for h in reversed(history) if h["height"] > 0]
+        chain.sort(key=lambda e: -e[1])   # estável: dentro do bloco, a ordem inversa do servidor
+        if last_seen_txid is None:
+            page = mempool[:MEMPOOL_PAGE_SIZE] + chain[:CHAIN_PAGE_SIZE]
+        else:
+            idx = next((i for i, (t, _) in enumerate(chain) if t == last_seen_txid), None)
+            page = [] if idx is None else chain[idx + 1:idx + 1 + CHAIN_PAGE_SIZE]
+        return self._esplora_txs(page)
+
+    def get_tx(self, txid: str) -> dict:
+        """
+        Transação no formato Esplora. O protocolo não informa a altura de uma
+        transação avulsa: ela vem do histórico do primeiro output com endereço.
+        """
+        tx = self._raw_txs([txid])[txid]
+        height = None
+        for o in tx["vout"]:
+            addr = script_address(bytes.fromhex(o["scriptpubkey"]), self.network)
+            if addr:
+                history = self.client.call("blockchain.scripthash.get_history", scripthash(addr))
+                height = next((h["height"] for h in history if h["tx_hash"] == txid), None)
+                break
+        return self._esplora_txs([(txid, height)])[0]
+
+    def get_tx_status(self, txid: str) -> Optional[dict]:
+        try:
+            return self.get_tx(txid)["status"]
+        except ElectrumError as e:
+            message = str(e).lower()
+            if "no such" in message or "not found" in message or "não encontrada" in message:
+                return None
+            raise
+
+    def get_tip_height(self) -> int:
+        if self._tip is None:
+            self._tip = int(self.client.call("blockchain.headers.subscribe")["height"])
+        return self._tip
+
+    def get_fee_estimates(self) -> dict:
+        """{alvo: sat/vB} a partir de blockchain.estimatefee (BTC/kB; -1 = sem estimativa)."""
+        results = self.client.batch([("blockchain.estimatefee", [t]) for t in FEE_TARGETS])
+        return {str(t): r * 1e8 / 1000 for t, r in zip(FEE_TARGETS, results) if r and r > 0}
+
+    def broadcast_tx(self, raw_tx_hex: str) -> str:
+        try:
+            return self.client.call("blockchain.transaction.broadcast", raw_tx_hex.strip())
+        except ElectrumError as e:
+            raise RuntimeError(f"Broadcast rejeitado pelo servidor Electrum: {e}")
+
+    # notificações
+
+    def subscribe(self, addresses: List[str], callback: Callable[[str, Optional[str]], None]) -> bool:
+        new = {scripthash(a): a for a in addresses}
+        if callback not in self._callbacks:
+            self._callbacks.append(callback)
+        self._subscribed.update(new)
+        if new:
+            self.client.batch([("blockchain.scripthash.subscribe", [sh]) for sh in new])
+        return True
+
+    def unsubscribe(self, callback: Callable[[str, Optional[str]], None]) -> None:
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def _on_header(self, params: list) -> None:
+        if params and isinstance(params[0], dict):
+            self._tip = int(params[0]["height"])
+
+    def _on_scripthash(self, params: list) -> None:
+        if len(params) < 2:
+            return
+        addr = self._subscribed.get(params[0])
+        if addr is not None:
+            for cb in list(self._callbacks):
+                cb(addr, params[1])
+
+    def _resubscribe(self) -> None:
+        # o que mudou enquanto a conexão estava fora é avisado como mudança
+        self._tip = None
+        if not self._subscribed:
+            return
+        items = list(self._subscribed.items())
+        statuses = self.client.batch([("blockchain.scripthash.subscribe", [sh]) for sh, _ in items])
+        for (_, addr), status in zip(items, statuses):
+            for cb in list(self._callbacks):
+                cb(addr, status)
+
+
+# ---------------------------
+# Servidor local de teste
+# ---------------------------
+
+class StandInServer:
+    """
+    Servidor Electrum mínimo em memória (127.0.0.1, porta livre), para testes
+    e benchmarks sem rede. fund() cria uma transação sintética pagando a um
+    endereço; notify() avisa os clientes inscritos. latency atrasa cada
+    mensagem recebida, imitando a ida e volta de um servidor remoto.
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0.0, tip_height: int = 2_500_000):
+        self.latency = latency
+        self.tip_height = tip_height
+        self.messages = 0
+        self.requests = 0
+        self.txs: Dict[str, str] = {}
+        self.history: Dict[str, List[dict]] = {}
+        self.unspent: Dict[str, List[dict]] = {}
+        self.broadcasts: List[str] = []
+        self._lock = threading.Lock()
+        self._clients = []
+        owner = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with owner._lock:
+                    owner._clients.append(self)
+                try:
+                    for line in self.rfile:
+                        if not line.strip():
+                            continue
+                        owner.messages += 1
+                        if owner.latency:
+                            time.sleep(owner.latency)
+                        msg = json.loads(line)
+                        reqs = msg if isinstance(msg, list) else [msg]
+                        owner.requests += len(reqs)
+                        resps = [owner._handle(r) for r in reqs]
+                        self.send(resps if isinstance(msg, list) else resps[0])
+                except (OSError, ValueError):
+                    pass
+                finally:
+                    with owner._lock:
+                        owner._clients.remove(self)
+
+            def send(self, obj):
+                with owner._lock:
+                    self.wfile.write(json.dumps(obj).encode() + b"\n")
+                    self.wfile.flush()
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self._server = Server(("127.0.0.1", port), Handler)
+        self.port = self._server.server_address[1]
+
+    def start(self) -> "StandInServer":
+        threading.Thread(target=self._server.serve_forever, name="wowlie-electrum-standin",
+                         daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    # dados sintéticos
+
+    def fund(self, address: str, value: int, height: int = 0) -> str:
+        """Transação sintética (input coinbase) pagando value a address; height 0 = mempool."""
+        script = script_from_address(address)
+        raw = synthetic_funding_tx([(script, value)], len(self.txs))
+        txid = hash256(raw)[::-1].hex()
+        sh = hashlib.sha256(script).digest()[::-1].hex()
+        self.txs[txid] = raw.hex()
+        self.history.setdefault(sh, []).append({"tx_hash": txid, "height": height})
+        self.unspent.setdefault(sh, []).append({"tx_hash": txid, "tx_pos": 0, "value": value, "height": height})
+        return txid
+
+    def status(self, sh: str) -> Optional[str]:
+        hist = self.history.get(sh)
+        if not hist:
+            return None
+        return hashlib.sha256("".join(f"{h['tx_hash']}:{h['height']}:" for h in hist).encode()).hexdigest()
+
+    def notify(self, address: str) -> None:
+        sh = scripthash(address)
+        msg = {"jsonrpc": "2.0", "method": "blockchain.scripthash.subscribe", "params": [sh, self.status(sh)]}
+        for client in list(self._clients):
+            try:
+                client.send(msg)
+            except OSError:
+                pass
+
+    def _handle(self, req: dict) -> dict:
+        method, params = req.get("method"), req.get("params") or []
+        try:
+            result = self._dispatch(method, params)
+            return {"jsonrpc": "2.0", "id": req.get("id"), "result": result}
+        except Exception as e:
+            return {"jsonrpc": "2.0", "id": req.get("id"), "error": {"code": 1, "message": str(e)}}
+
+    def _dispatch(self, method: str, params: list):
+        if method == "server.version":
+            return ["wowlie-standin", PROTOCOL_VERSION]
+        if method == "server.ping":
+            return None
+        if method == "blockchain.scripthash.get_balance":
+            us = self.unspent.get(params[0], [])
+            return {"confirmed": sum(u["value"] for u in us if u["height"] > 0),
+                    "unconfirmed": sum(u["value"] for u in us if u["height"] <= 0)}
+        if method == "blockchain.scripthash.listunspent":
+            return self.unspent.get(params[0], [])
+        if method == "blockchain.scripthash.get_history":
+            return self.history.get(params[0], [])
+        if method == "blockchain.scripthash.subscribe":
+            return self.status(params[0])
+        if method == "blockchain.transaction.get":
+            if params[0] not in self.txs:
+                raise ValueError(f"transação {params[0]} não encontrada")
+            return self.txs[params[0]]
+        if method == "blockchain.transaction.broadcast":
+            tx = decode_raw_tx(bytes.fromhex(params[0]))
+            self.txs[tx["txid"]] = params[0]
+            self.broadcasts.append(tx["txid"])
+            return tx["txid"]
+        if method == "blockchain.headers.subscribe":
+            return {"height": self.tip_height, "hex": "00" * 80}
+        if method == "blockchain.block.header":
+            return (b"\x00" * 68 + struct.pack("<I", 1_700_000_000 + params[0] * 600) + b"\x00" * 8).hex()
+        if method == "blockchain.estimatefee":
+            return round(0.00020 / params[0], 8)
+        raise ValueError(f"método {method} não suportado")
+
+
+def _random_addresses(n: int, network: str = "testnet") -> List[str]:
+    return [b32.address_from_witness(0, os.urandom(20), network) for _ in range(n)]
+
+
+def self_check(n_addresses: int = 500, latency: float = 0.02) -> Dict:
+    """
+    Sobe o StandInServer com n_addresses endereços sintéticos e compara um
+    lote (get_balances/get_utxos_many) com uma chamada por endereço. Confere
+    também histórico, decodificação, notificação e broadcast. Levanta
+    RuntimeError se algum resultado divergir.
+    """
+    server = StandInServer(latency=latency).start()
+    addrs = _random_addresses(n_addresses)
+    for i, a in enumerate(addrs):
+        server.fund(a, 10_000 + i, height=2_400_000 + i)
+        if i % 10 == 0:
+            server.fund(a, 500)
+    backend = ElectrumBackend("127.0.0.1", server.port)
+    try:
+        backend.get_tip_height()
+
+        before = server.messages
+        t0 = time.perf_counter()
+        balances = backend.get_balances(addrs)
+        utxos = backend.get_utxos_many(addrs)
+        batched_s = time.perf_counter() - t0
+        batched_msgs = server.messages - before
+
+        sample = addrs[:min(len(addrs), 50)]
+        before = server.messages
+        t0 = time.perf_counter()
+        single = {a: backend.get_balance(a) for a in sample}
+        single_s = (time.perf_counter() - t0) * len(addrs) / len(sample)
+        single_msgs = (server.messages - before) * len(addrs) // len(sample)
+
+        for i, a in enumerate(addrs):
+            expect_unconf = 500 if i % 10 == 0 else 0
+            if balances[a] != {"confirmed": 10_000 + i, "unconfirmed": expect_unconf,
+                               "total": 10_000 + i + expect_unconf}:
+                raise RuntimeError(f"Saldo divergente para {a}: {balances[a]}")
+            if a in single and single[a] != balances[a]:
+                raise RuntimeError(f"Saldo em lote diferente do individual para {a}")
+            if sum(u["value"] for u in utxos[a]) != balances[a]["total"]:
+                raise RuntimeError(f"UTXOs divergentes para {a}")
+
+        txs = backend.get_address_txs(addrs[0])
+        if [t["status"]["confirmed"] for t in txs] != [False, True]:
+            raise RuntimeError(f"Ordem do histórico inesperada: {txs}")
+        if txs[1]["vout"][0].get("scriptpubkey_address") != addrs[0]:
+            raise RuntimeError("Endereço do output decodificado incorretamente")
+        if backend.get_tx(txs[1]["txid"])["status"].get("block_height") != 2_400_000:
+            raise RuntimeError("Altura de get_tx incorreta")
+
+        seen = threading.Event()
+        backend.subscribe(addrs[:3], lambda addr, status: seen.set() if addr == addrs[1] else None)
+        server.fund(addrs[1], 777)
+        server.notify(addrs[1])
+        if not seen.wait(5):
+            raise RuntimeError("Notificação de subscribe não recebida")
+
+        raw = server.txs[txs[1]["txid"]]
+        if backend.broadcast_tx(raw) != txs[1]["txid"]:
+            raise RuntimeError("broadcast retornou txid diferente")
+
+        return {"addresses": n_addresses, "latency_ms": latency * 1000,
+                "batched_round_trips": batched_msgs, "batched_s": batched_s,
+                "single_round_trips": single_msgs, "single_s_estimated": single_s}
+    finally:
+        backend.close()
+        server.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Servidor Electrum local de teste e comparação lote vs. individual")
+    parser.add_argument("--addresses", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--serve", type=int, metavar="PORTA",
+                        help="só sobe o servidor de teste (vazio; use WOWLIE_ELECTRUM_SERVER=127.0.0.1:PORTA)")
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        srv = StandInServer(port=args.serve, latency=args.latency_ms / 1000).start()
+        print(f"Servidor Electrum de teste em 127.0.0.1:{srv.port} (Ctrl+C para sair)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            srv.stop()
+    else:
+        r = self_check(args.addresses, args.latency_ms / 1000)
+        print(f"{r['addresses']} endereços, latência simulada {r['latency_ms']:.0f} ms")
+        print(f"  lote (saldos + UTXOs): {r['batched_round_trips']} idas e voltas, {r['batched_s'] * 1000:.0f} ms")
+        print(f"  um por endereço (saldos): {r['single_round_trips']} idas e voltas, "
+              f"~{r['single_s_estimated'] * 1000:.0f} ms (estimado)")
+        print("OK: resultados do lote iguais aos individuais; histórico, subscribe e broadcast conferidos")
@@ -0,0 +1,692 @@
+"""
+Servidor Esplora local (stand-in) para testes de carga e benchmarks sem rede.
+
+Implementa o subconjunto da API que a carteira usa (/address/{a},
+/address/{a}/utxo, /address/{a}/txs[/chain/{último}], /tx/{txid}[/hex|/status],
+POST /tx, /blocks/tip/height|hash, /block-height/{h}, /block/{hash}/raw,
+/fee-estimates) sobre um estado em memória:
+  - carteiras sintéticas: fund() cria transações com quantos UTXOs se queira
+  - POST /tx decodifica a transação, confere os inputs (e RBF) e atualiza os
+    UTXOs, então envios seguidos enxergam o troco uns dos outros
+  - mine() confirma o mempool num bloco novo e reorg() desfaz os últimos
+    blocos (os cabeçalhos se encadeiam pelo hash, como numa chain real)
+  - latência configurável (fixa + jitter, e uma cauda: tail_rate das
+    respostas demoram tail_latency a mais) e injeção de erros (HTTP 429/503)
+    com semente fixa, para execuções reprodutíveis
+  - limite de taxa (rate_limit req/s, balde de fichas): o excesso recebe 429
+    com Retry-After, como a API pública
+  - record: repassa as requisições a uma API real e grava as respostas num
+    arquivo de fixtures; replay: responde só a partir das fixtures
+
+Aponte a carteira para ele com WOWLIE_ESPLORA_URL=http://127.0.0.1:PORTA (ou
+"esplora": {"url": ...} no config.json):
+    python -m wallet.esplora_standin --serve 3002 --synthetic 20x50
+    python -m wallet.esplora_standin --serve 3002 --record fixtures.json
+    python -m wallet.esplora_standin --serve 3002 --replay fixtures.json
+
+Benchmark/carga dos caminhos de saldo e de envio (carteira temporária em
+HOME próprio, nada é gravado na carteira real):
+    python -m wallet.esplora_standin --bench [--addresses 20 --utxos 50 --sends 20
+                                               --concurrency 8 --duration 5 --latency-ms 30 --error-rate 0.02]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple, Union
+import hashlib
+import json
+import os
+import random
+import struct
+import threading
+import time
+
+from wallet.rawtx import (decode_raw_tx, hash256, script_address, script_from_address, synthetic_funding_tx,
+                          write_varint)
+
+DEFAULT_FEE_ESTIMATES = {"1": 25.0, "2": 20.0, "3": 15.0, "6": 8.0, "12": 4.0, "25": 2.0, "144": 1.0, "1008": 1.0}
+DEFAULT_UPSTREAM = "https://blockstream.info/testnet/api"
+MEMPOOL_PAGE_SIZE = 50
+CHAIN_PAGE_SIZE = 25
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, body: str):
+        super().__init__(body)
+        self.status = status
+        self.body = body
+
+
+class ChainState:
+    """Transações, UTXOs e altura do topo simulados (thread-safe)."""
+
+    def __init__(self, tip_height: int = 2_500_000, network: str = "testnet"):
+        self.tip_height = tip_height
+        self.base_height = tip_height       # blocos abaixo daqui não têm conteúdo
+        self.network = network
+        self._salt: Dict[int, int] = {}     # muda o hash dos blocos refeitos por reorg()
+        self._hashes: Dict[int, str] = {}
+        self.txs: Dict[str, dict] = {}             # txid -> {"decoded", "raw", "height"}
+        self.address_txs: Dict[str, List[str]] = {}
+        self.outputs: Dict[Tuple[str, int], dict] = {}   # outpoint -> {"address", "value", "script"}
+        self.spent_by: Dict[Tuple[str, int], str] = {}
+        self._nonce = 0
+        self.lock = threading.RLock()
+
+    # criação de saldo
+
+    def fund(self, address: str, values: List[int], confirmed: bool = True) -> str:
+        """Uma transação sintética pagando cada valor de values a address."""
+        script = script_from_address(address)
+        with self.lock:
+            self._nonce += 1
+            raw = synthetic_funding_tx([(script, v) for v in values], self._nonce)
+            return self._add(raw, self.tip_height if confirmed else None, {})
+
+    def synthetic_wallet(self, addresses: List[str], utxos_per_address: int, seed: int = 0,
+                         min_value: int = 1_000, max_value: int = 200_000, unconfirmed_ratio: float = 0.0) -> None:
+        rng = random.Random(seed)
+        for addr in addresses:
+            values = [rng.randint(min_value, max_value) for _ in range(utxos_per_address)]
+            n_unconf = int(len(values) * unconfirmed_ratio)
+            if n_unconf:
+                self.fund(addr, values[:n_unconf], confirmed=False)
+            if values[n_unconf:]:
+                self.fund(addr, values[n_unconf:])
+
+    def mine(self, n: int = 1) -> None:
+        """Avança n blocos; as transações do mempool entram no primeiro."""
+        with self.lock:
+            for entry in self.txs.values():
+                if entry["height"] is None:
+                    entry["height"] = self.tip_height + 1
+            self.tip_height += n
+            self._hashes.clear()
+
+    def reorg(self, depth: int, drop: Tuple[str, ...] = ()) -> None:
+        """
+        Desfaz os últimos depth blocos: as transações deles voltam ao mempool
+        (as de drop somem, como se um gasto conflitante tivesse vencido) e os
+        próximos blocos minerados nessas alturas terão outro hash.
+        """
+        with self.lock:
+            first = self.tip_height - depth + 1
+            for txid in drop:
+                self._remove(txid)
+            for entry in self.txs.values():
+                if entry["height"] is not None and entry["height"] >= first:
+                    entry["height"] = None
+            for h in range(first, self.tip_height + 1):
+                self._salt[h] = self._salt.get(h, 0) + 1
+            self.tip_height = first - 1
+            self._hashes.clear()
+
+    # blocos
+
+    def block_txids(self, height: int) -> List[str]:
+        return [t for t, e in self.txs.items() if e["height"] == height]
+
+    def _header(self, height: int, prev_hash: str) -> bytes:
+        merkle = hash256(b"".join(bytes.fromhex(t)[::-1] for t in self.block_txids(height)))
+        return (struct.pack("<I", 0x20000000) + bytes.fromhex(prev_hash)[::-1] + merkle
+                + struct.pack("<III", 1_600_000_000 + height * 600, 0x1d00ffff, self._salt.get(height, 0)))
+
+    def block_hash(self, height: int) -> str:
+        if height < self.base_height:
+            return hashlib.sha256(str(height).encode()).hexdigest()
+        with self.lock:
+            if height not in self._hashes:
+                h = max([k for k in self._hashes if k < height], default=self.base_height - 1)
+                prev = self.block_hash(h)
+                for k in range(h + 1, height + 1):
+                    prev = self._hashes[k] = hash256(self._header(k, prev))[::-1].hex()
+            return self._hashes[height]
+
+    def block_height(self, block_hash: str) -> Optional[int]:
+        with self.lock:
+            for h in range(self.tip_height, self.base_height - 1, -1):
+                if self.block_hash(h) == block_hash:
+                    return h
+        return None
+
+    def block_raw(self, height: int) -> bytes:
+        with self.lock:
+            txids = self.block_txids(height)
+            return (self._header(height, self.block_hash(height - 1)) + write_varint(len(txids))
+                    + b"".join(bytes.fromhex(self.txs[t]["raw"]) for t in txids))
+
+    # transações
+
+    def _add(self, raw: bytes, height: Optional[int], prevouts: Dict[Tuple[str, int], dict]) -> str:
+        tx = decode_raw_tx(raw)
+        txid = tx["txid"]
+        self.txs[txid] = {"decoded": tx, "raw": raw.hex(), "height": height, "prevouts": prevouts}
+        if height is not None:
+            self._hashes.clear()
+        touched = set()
+        for vin in tx["vin"]:
+            if not vin["is_coinbase"]:
+                op = (vin["txid"], vin["vout"])
+                self.spent_by[op] = txid
+                touched.add(self.outputs[op]["address"])
+        for n, o in enumerate(tx["vout"]):
+            addr = script_address(bytes.fromhex(o["scriptpubkey"]), self.network)
+            self.outputs[(txid, n)] = {"address": addr, "value": o["value"], "script": o["scriptpubkey"]}
+            touched.add(addr)
+        for addr in touched - {None}:
+            self.address_txs.setdefault(addr, []).append(txid)
+        return txid
+
+    def _remove(self, txid: str) -> None:
+        entry = self.txs.pop(txid)
+        self._hashes.clear()
+        tx = entry["decoded"]
+        for vin in tx["vin"]:
+            if not vin["is_coinbase"]:
+                self.spent_by.pop((vin["txid"], vin["vout"]), None)
+        for n in range(len(tx["vout"])):
+            self.outputs.pop((txid, n), None)
+        for txids in self.address_txs.values():
+            if txid in txids:
+                txids.remove(txid)
+
+    def submit(self, raw_hex: str) -> str:
+        """
+        Aceita uma transação no mempool, como o POST /tx. Inputs precisam
+        existir e estar livres, exceto se gastos só por transações do mempool
+        que sinalizam RBF, sem filhos e com taxa menor (nesse caso são
+        substituídas).
+        """
+        try:
+            tx = decode_raw_tx(bytes.fromhex(raw_hex.strip()))
+        except ValueError as e:
+            raise HTTPError(400, f"sendrawtransaction RPC error: {{\"code\":-22,\"message\":\"TX decode failed: {e}\"}}")
+        with self.lock:
+            if tx["txid"] in self.txs:
+                return tx["txid"]
+            prevouts, conflicts = {}, set()
+            for vin in tx["vin"]:
+                op = (vin["txid"], vin["vout"])
+                if vin["is_coinbase"] or op not in self.outputs:
+                    raise HTTPError(400, "sendrawtransaction RPC error: {\"code\":-25,\"message\":\"bad-txns-inputs-missingorspent\"}")
+                prevouts[op] = self.outputs[op]
+                if op in self.spent_by:
+                    conflicts.add(self.spent_by[op])
+
+            fee = sum(p["value"] for p in prevouts.values()) - sum(o["value"] for o in tx["vout"])
+            if fee < 0:
+                raise HTTPError(400, "sendrawtransaction RPC error: {\"code\":-26,\"message\":\"bad-txns-in-belowout\"}")
+            vsize = (tx["weight"] + 3) // 4
+            if fee < vsize:
+                raise HTTPError(400, "sendrawtransaction RPC error: {\"code\":-26,\"message\":\"min relay fee not met\"}")
+            for c in conflicts:
+                old = self.txs[c]
+                replaceable = (old["height"] is None
+                               and any(v["sequence"] < 0xfffffffe for v in old["decoded"]["vin"])
+                               and not any((c, n) in self.spent_by for n in range(len(old["decoded"]["vout"]))))
+                if not replaceable or fee <= self._fee(c):
+                    raise HTTPError(400, "sendrawtransaction RPC error: {\"code\":-26,\"message\":\"txn-mempool-conflict\"}")
+            for c in conflicts:
+                self._remove(c)
+            return self._add(bytes.fromhex(raw_hex.strip()), None, prevouts)
+
+    def _fee(self, txid: str) -> int:
+        entry = self.txs[txid]
+        if not entry["prevouts"]:
+            return 0
+        return sum(p["value"] for p in entry["prevouts"].values()) - sum(o["value"] for o in entry["decoded"]["vout"])
+
+    # respostas no formato Esplora
+
+    def _status(self, height: Optional[int]) -> dict:
+        if height is None:
+            return {"confirmed": False}
+        return {"confirmed": True, "block_height": height,
+                "block_hash": self.block_hash(height),
+                "block_time": 1_600_000_000 + height * 600}
+
+    def _vout_json(self, script_hex: str, value: int) -> dict:
+        entry = {"scriptpubkey": script_hex, "value": value}
+        addr = script_address(bytes.fromhex(script_hex), self.network)
+        if addr:
+            entry["scriptpubkey_address"] = addr
+        return entry
+
+    def tx_json(self, txid: str) -> dict:
+        entry = self.txs.get(txid)
+        if entry is None:
+            raise HTTPError(404, "Transaction not found")
+        tx = entry["decoded"]
+        vins = []
+        for vin in tx["vin"]:
+            item = {"txid": vin["txid"], "vout": vin["vout"], "sequence": vin["sequence"],
+                    "is_coinbase": vin["is_coinbase"]}
+            if not vin["is_coinbase"]:
+                prev = entry["prevouts"][(vin["txid"], vin["vout"])]
+                item["prevout"] = self._vout_json(prev["script"], prev["value"])
+            vins.append(item)
+        return {"txid": txid, "version": tx["version"], "locktime": tx["locktime"], "vin": vins,
+                "vout": [self._vout_json(o["scriptpubkey"], o["value"]) for o in tx["vout"]],
+                "weight": tx["weight"], "size": len(entry["raw"]) // 2, "fee": self._fee(txid),
+                "status": self._status(entry["height"])}
+
+    def address_stats(self, address: str) -> dict:
+        stats = {k: {"funded_txo_count": 0, "funded_txo_sum": 0, "spent_txo_count": 0,
+                     "spent_txo_sum": 0, "tx_count": 0} for k in ("chain_stats", "mempool_stats")}
+        for txid in self.address_txs.get(address, []):
+            entry = self.txs[txid]
+            bucket = stats["chain_stats" if entry["height"] is not None else "mempool_stats"]
+            bucket["tx_count"] += 1
+            for o in entry["decoded"]["vout"]:
+                if script_address(bytes.fromhex(o["scriptpubkey"]), self.network) == address:
+                    bucket["funded_txo_count"] += 1
+                    bucket["funded_txo_sum"] += o["value"]
+            for prev in entry["prevouts"].values():
+                if prev["address"] == address:
+                    bucket["spent_txo_count"] += 1
+                    bucket["spent_txo_sum"] += prev["value"]
+        return {"address": address, **stats}
+
+    def utxos(self, address: str) -> list:
+        out = []
+        for txid in self.address_txs.get(address, []):
+            for n, o in enumerate(self.txs[txid]["decoded"]["vout"]):
+                op = (txid, n)
+                if op not in self.spent_by and self.outputs.get(op, {}).get("address") == address:
+                    out.append({"txid": txid, "vout": n, "value": o["value"],
+                                "status": self._status(self.txs[txid]["height"])})
+        return out
+
+    def address_txs_page(self, address: str, last_seen_txid: Optional[str] = None) -> list:
+        txids = list(reversed(self.address_txs.get(address, [])))
+        mempool = [t for t in txids if self.txs[t]["height"] is None]
+        chain = sorted((t for t in txids if self.txs[t]["height"] is not None),
+                       key=lambda t: -self.txs[t]["height"])
+        if last_seen_txid is None:
+            page = mempool[:MEMPOOL_PAGE_SIZE] + chain[:CHAIN_PAGE_SIZE]
+        elif last_seen_txid in chain:
+            i = chain.index(last_seen_txid)
+            page = chain[i + 1:i + 1 + CHAIN_PAGE_SIZE]
+        else:
+            page = []
+        return [self.tx_json(t) for t in page]
+
+
+class EsploraStandIn:
+    """
+    Servidor HTTP (127.0.0.1) sobre um ChainState. Em modo record repassa
+    tudo para upstream e grava as respostas; em modo replay só responde a
+    partir das fixtures gravadas.
+    """
+
+    def __init__(self, state: Optional[ChainState] = None, port: int = 0, latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, seed: int = 0,
+                 fee_estimates: Optional[Dict[str, float]] = None, rate_limit: Optional[float] = None,
+                 retry_after: Optional[float] = 1.0, tail_rate: float = 0.0, tail_latency: float = 1.0,
+                 record: Optional[str] = None, replay: Optional[str] = None, upstream: str = DEFAULT_UPSTREAM):
+        self.state = state or ChainState()
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.fee_estimates = dict(fee_estimates or DEFAULT_FEE_ESTIMATES)
+        self.record_path = record
+        self.upstream = upstream.rstrip("/")
+        self.fixtures: Dict[str, dict] = {}
+        if replay:
+            with open(replay) as f:
+                self.fixtures = json.load(f)
+        self.replay = bool(replay)
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self._tokens = rate_limit or 0.0
+        self._tokens_at = time.monotonic()
+        self.requests = 0
+        self.injected_errors = 0
+        self.rate_limited = 0
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._fixtures_lock = threading.Lock()
+        self._upstream_session = None
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True   # cabeçalho e corpo saem em writes separados
+
+            def do_GET(self):
+                owner._serve(self, "GET", b"")
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                owner._serve(self, "POST", body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self._server = Server(("127.0.0.1", port), Handler)
+        self.port = self._server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> "EsploraStandIn":
+        threading.Thread(target=self._server.serve_forever, name="wowlie-esplora-standin", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    # atendimento
+
+    def _serve(self, handler, method: str, body: bytes) -> None:
+        self.requests += 1
+        with self._rng_lock:
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0)
+            if self.tail_rate and self._rng.random() < self.tail_rate:
+                delay += self.tail_latency
+            inject = self.error_rate and self._rng.random() < self.error_rate
+            inject_status = self._rng.choice((429, 503)) if inject else None
+            limited = False
+            if self.rate_limit:
+                now = time.monotonic()
+                self._tokens = min(self.rate_limit, self._tokens + (now - self._tokens_at) * self.rate_limit)
+                self._tokens_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                else:
+                    limited = True
+        headers = {}
+        if not limited and delay:
+            time.sleep(delay)
+        if limited:
+            self.rate_limited += 1
+            status, text = 429, "Too Many Requests"
+            if self.retry_after is not None:
+                headers["Retry-After"] = f"{self.retry_after:g}"
+        elif inject:
+            self.injected_errors += 1
+            status, text = inject_status, "erro injetado pelo stand-in"
+        else:
+            try:
+                status, text = self._respond(method, handler.path, body)
+            except HTTPError as e:
+                status, text = e.status, e.body
+            except Exception as e:
+                status, text = 500, f"erro interno do stand-in: {e}"
+        if isinstance(text, bytes):
+            data, ctype = text, "application/octet-stream"
+        else:
+            data, ctype = text.encode(), "application/json" if text[:1] in "[{" else "text/plain"
+        handler.send_response(status)
+        handler.send_header("Content-Type", ctype)
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _fixture_key(self, method: str, path: str, body: bytes) -> str:
+        if method == "POST":
+            return f"POST {path} {hashlib.sha256(body).hexdigest()}"
+        return f"GET {path}"
+
+    def _respond(self, method: str, path: str, body: bytes) -> Tuple[int, Union[str, bytes]]:
+        if self.replay:
+            fixture = self.fixtures.get(self._fixture_key(method, path, body))
+            if fixture is None:
+                raise HTTPError(404, f"fixture ausente: {method} {path}")
+            if "body_hex" in fixture:
+                return fixture["status"], bytes.fromhex(fixture["body_hex"])
+            return fixture["status"], fixture["body"]
+        if self.record_path:
+            return self._record(method, path, body)
+        return self._route(method, path, body)
+
+    def _record(self, method: str, path: str, body: bytes) -> Tuple[int, Union[str, bytes]]:
+        import requests
+        if self._upstream_session is None:
+            self._upstream_session = requests.Session()
+        if method == "POST":
+            r = self._upstream_session.post(self.upstream + path, data=body, timeout=30,
+                                            headers={"Content-Type": "text/plain"})
+        else:
+            r = self._upstream_session.get(self.upstream + path, timeout=30)
+        with self._fixtures_lock:
+            binary = r.headers.get("Content-Type", "").startswith("application/octet-stream")
+            self.fixtures[self._fixture_key(method, path, body)] = (
+                {"status": r.status_code, "body_hex": r.content.hex()} if binary
+                else {"status": r.status_code, "body": r.text})
+            tmp = self.record_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.fixtures, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.record_path)
+        return r.status_code, r.content if binary else r.text
+
+    def _route(self, method: str, path: str, body: bytes) -> Tuple[int, Union[str, bytes]]:
+        parts = [p for p in path.split("?")[0].split("/") if p]
+        st = self.state
+        with st.lock:
+            if method == "POST" and parts == ["tx"]:
+                return 200, st.submit(body.decode())
+            if method != "GET":
+                raise HTTPError(405, "Method not allowed")
+            if parts[:1] == ["address"] and len(parts) >= 2:
+                addr = parts[1]
+                if len(parts) == 2:
+                    return 200, json.dumps(st.address_stats(addr))
+                if parts[2:] == ["utxo"]:
+                    return 200, json.dumps(st.utxos(addr))
+                if parts[2:] == ["txs"]:
+                    return 200, json.dumps(st.address_txs_page(addr))
+                if parts[2:4] == ["txs", "chain"]:
+                    return 200, json.dumps(st.address_txs_page(addr, parts[4] if len(parts) > 4 else None))
+            if parts[:1] == ["tx"] and len(parts) >= 2:
+                if len(parts) == 2:
+                    return 200, json.dumps(st.tx_json(parts[1]))
+                if parts[2:] == ["hex"]:
+                    if parts[1] not in st.txs:
+                        raise HTTPError(404, "Transaction not found")
+                    return 200, st.txs[parts[1]]["raw"]
+                if parts[2:] == ["status"]:
+                    return 200, json.dumps(st.tx_json(parts[1])["status"])
+            if parts == ["blocks", "tip", "height"]:
+                return 200, str(st.tip_height)
+            if parts == ["blocks", "tip", "hash"]:
+                return 200, st.block_hash(st.tip_height)
+            if parts[:1] == ["block-height"] and len(parts) == 2:
+                height = int(parts[1])
+                if not st.base_height <= height <= st.tip_height:
+                    raise HTTPError(404, "Block not found")
+                return 200, st.block_hash(height)
+            if parts[:1] == ["block"] and parts[2:] == ["raw"]:
+                height = st.block_height(parts[1])
+                if height is None:
+                    raise HTTPError(404, "Block not found")
+                return 200, st.block_raw(height)
+            if parts == ["fee-estimates"]:
+                return 200, json.dumps(self.fee_estimates)
+        raise HTTPError(404, "Not found")
+
+
+# ---------------------------
+# Benchmark / carga
+# ---------------------------
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def _latency_summary(name: str, latencies: List[float], errors: int, elapsed: float) -> Dict:
+    return {"name": name, "ok": len(latencies), "errors": errors,
+            "per_sec": len(latencies) / elapsed if elapsed else float("inf"),
+            "p50_ms": _percentile(latencies, 50) * 1000, "p95_ms": _percentile(latencies, 95) * 1000,
+            "p99_ms": _percentile(latencies, 99) * 1000}
+
+
+def benchmark(n_addresses: int = 20, utxos_per_address: int = 50, sends: int = 20, concurrency: int = 8,
+              duration: float = 5.0, latency: float = 0.03, jitter: float = 0.01, error_rate: float = 0.0,
+              seed: int = 0, password: str = "Bench!Passw0rd") -> List[Dict]:
+    """
+    Cria uma carteira (no HOME atual — use um HOME temporário), financia seus
+    endereços no stand-in e mede:
+      - saldo: todos os endereços em sequência, e em paralelo (pool do BalanceRefresher)
+      - envio: send_transaction completo (UTXOs, seleção, assinatura, POST /tx)
+      - carga: concurrency threads consultando saldos por duration segundos
+    """
+    from wallet import network
+    from wallet.keys import init_wallet, next_address
+    from wallet.transactions import KeyIndex, send_transaction
+    from wallet.utils import load_addresses, wallet_exists
+
+    if wallet_exists():
+        raise RuntimeError("Benchmark deve rodar com um HOME temporário (já existe carteira neste HOME)")
+    init_wallet(password)
+    for _ in range(n_addresses - 1):
+        next_address(password)
+    addrs = load_addresses()[1]
+
+    state = ChainState()
+    state.synthetic_wallet(addrs, utxos_per_address, seed=seed)
+    server = EsploraStandIn(state, latency=latency, jitter=jitter, error_rate=error_rate, seed=seed).start()
+    network.use_backend(network.EsploraBackend(server.url))
+    results = []
+    try:
+        # saldo: sequencial e paralelo
+        for name, workers in (("saldo (sequencial)", 1), (f"saldo (paralelo x{concurrency})", concurrency)):
+            lat, errors = [], 0
+            t0 = time.perf_counter()
+
+            def one(addr):
+                t = time.perf_counter()
+                network.get_balance(addr)
+                return time.perf_counter() - t
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for fut in [pool.submit(one, a) for a in addrs]:
+                    try:
+                        lat.append(fut.result())
+                    except Exception:
+                        errors += 1
+            results.append(_latency_summary(name, lat, errors, time.perf_counter() - t0))
+
+        # envio completo
+        sink = "tb1qw508d6qejxtdg4y5r3zarvary0c5xw7kxpjzsx"
+        lat, errors = [], 0
+        t0 = time.perf_counter()
+        with KeyIndex(password) as keys:
+            for _ in range(sends):
+                t = time.perf_counter()
+                try:
+                    send_transaction(None, sink, 5_000, password=None, fee_rate=2, keys=keys)
+                    lat.append(time.perf_counter() - t)
+                except Exception:
+                    errors += 1
+        results.append(_latency_summary("envio (send_transaction)", lat, errors, time.perf_counter() - t0))
+
+        # carga: saldos concorrentes por duration segundos
+        lat, errs = [], []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+        rng = random.Random(seed)
+
+        def worker(worker_seed):
+            r = random.Random(worker_seed)
+            while time.perf_counter() < deadline:
+                t = time.perf_counter()
+                try:
+                    network.get_balance(r.choice(addrs))
+                    with lock:
+                        lat.append(time.perf_counter() - t)
+                except Exception:
+                    with lock:
+                        errs.append(1)
+
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(rng.random(),)) for _ in range(concurrency)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        results.append(_latency_summary(f"carga (saldo, {concurrency} threads)", lat, len(errs),
+                                        time.perf_counter() - t0))
+    finally:
+        network.use_backend(network.EsploraBackend())
+        server.stop()
+    return results
+
+
+def _bench_in_temp_home(argv: List[str]) -> int:
+    """Reexecuta o benchmark num processo com HOME temporário (WALLET_DIR é lido na importação)."""
+    import subprocess
+    import sys
+    import tempfile
+    with tempfile.TemporaryDirectory() as home:
+        env = {**os.environ, "HOME": home, "USERPROFILE": home, "WOWLIE_BACKEND": "esplora",
+               "WOWLIE_BENCH_CHILD": "1"}
+        return subprocess.call([sys.executable, "-m", "wallet.esplora_standin", *argv], env=env)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    p = argparse.ArgumentParser(description="Servidor Esplora local, record/replay e benchmark")
+    p.add_argument("--serve", type=int, metavar="PORTA", help="sobe o servidor e fica esperando")
+    p.add_argument("--synthetic", metavar="ENDxUTXOS",
+                   help="com --serve: carteira sintética com endereços aleatórios, ex.: 20x50")
+    p.add_argument("--record", metavar="ARQUIVO", help="repassa para --upstream e grava as respostas")
+    p.add_argument("--replay", metavar="ARQUIVO", help="responde só a partir das fixtures gravadas")
+    p.add_argument("--upstream", default=DEFAULT_UPSTREAM)
+    p.add_argument("--bench", action="store_true", help="benchmark/carga dos caminhos de saldo e envio")
+    p.add_argument("--addresses", type=int, default=20)
+    p.add_argument("--utxos", type=int, default=50, help="UTXOs sintéticos por endereço")
+    p.add_argument("--sends", type=int, default=20)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--duration", type=float, default=5.0, help="segundos do teste de carga")
+    p.add_argument("--latency-ms", type=float, default=30.0)
+    p.add_argument("--jitter-ms", type=float, default=10.0)
+    p.add_argument("--error-rate", type=float, default=0.0, help="fração de respostas 429/503 injetadas")
+    p.add_argument("--rate-limit", type=float, metavar="REQ/S", help="com --serve: excesso recebe 429")
+    p.add_argument("--retry-after", type=float, default=1.0, metavar="SEG", help="Retry-After das respostas 429")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+
+    if args.bench:
+        if not os.environ.get("WOWLIE_BENCH_CHILD"):
+            sys.exit(_bench_in_temp_home(sys.argv[1:]))
+        print(f"Stand-in: {args.addresses} endereços x {args.utxos} UTXOs, latência {args.latency_ms:.0f}"
+              f"±{args.jitter_ms:.0f} ms, erros injetados {args.error_rate:.0%}")
+        print(f"{'caminho':<32} {'ok':>6} {'erros':>6} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for r in benchmark(args.addresses, args.utxos, args.sends, args.concurrency, args.duration,
+                           args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate, args.seed):
+            print(f"{r['name']:<32} {r['ok']:>6} {r['errors']:>6} {r['per_sec']:>8.1f} "
+                  f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+    elif args.serve is not None:
+        state = ChainState()
+        if args.synthetic:
+            from btclib import b32
+            n_addr, n_utxos = (int(x) for x in args.synthetic.lower().split("x"))
+            rng = random.Random(args.seed)
+            addrs = [b32.address_from_witness(0, rng.randbytes(20), "testnet") for _ in range(n_addr)]
+            state.synthetic_wallet(addrs, n_utxos, seed=args.seed)
+            print("\n".join(addrs))
+        srv = EsploraStandIn(state, port=args.serve, latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                             error_rate=args.error_rate, seed=args.seed, record=args.record,
+                             replay=args.replay, upstream=args.upstream, rate_limit=args.rate_limit,
+                             retry_after=args.retry_after).start()
+        mode = "record" if args.record else "replay" if args.replay else "simulado"
+        print(f"Esplora stand-in ({mode}) em {srv.url} — use WOWLIE_ESPLORA_URL={srv.url} (Ctrl+C para sair)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            srv.stop()
+    else:
+        p.print_help()
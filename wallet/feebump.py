@@ -0,0 +1,245 @@
+"""
+Aumento de taxa de transações presas no mempool.
+
+  - RBF (BIP125): reassina a transação com os mesmos inputs e menos troco.
+    Exige que a original sinalize RBF (nSequence < 0xfffffffe, padrão do send)
+    e que todos os inputs sejam da carteira.
+  - CPFP: gasta o output de troco da transação original numa transação filha
+    com taxa suficiente para o pacote (pai + filha) atingir a taxa alvo.
+
+bump_fee(method="auto") usa RBF quando possível e CPFP caso contrário.
+"""
+from typing import Dict, List, Optional, Tuple
+
+from wallet.ledger import load_ledger, pending_descendants, pending_spenders, record_broadcast
+from wallet.network import get_tx
+from wallet.transactions import (
+    DUST_P2WPKH, SEQUENCE_FINAL, SEQUENCE_RBF, KeyIndex, _signed_tx_summary,
+    broadcast_tx_hex, build_signed_segwit_tx, estimate_vbytes, load_address_index,
+)
+
+# incremento mínimo de taxa exigido pelo BIP125 (incrementalRelayFee do Core)
+INCREMENTAL_RELAY_FEE = 1  # sat/vB
+
+
+def _load_unconfirmed(txid: str) -> dict:
+    tx = get_tx(txid)
+    if tx.get("status", {}).get("confirmed"):
+        raise RuntimeError(f"Transação {txid} já confirmada; não há taxa para aumentar.")
+    return tx
+
+
+def signals_rbf(tx: dict) -> bool:
+    """True se algum input tem nSequence < 0xfffffffe (opt-in RBF, BIP125)."""
+    return any(vin["sequence"] < SEQUENCE_FINAL - 1 for vin in tx["vin"])
+
+
+def _vsize(tx: dict) -> int:
+    """vsize de uma transação no formato da API (weight / 4, arredondado para cima)."""
+    return (tx["weight"] + 3) // 4
+
+
+def _owned_inputs(tx: dict, index: Dict[str, str]) -> Optional[List[dict]]:
+    """Inputs da transação no formato de prepare_tx, ou None se algum não for da carteira."""
+    inputs = []
+    for vin in tx["vin"]:
+        addr = vin["prevout"].get("scriptpubkey_address")
+        if addr not in index:
+            return None
+        inputs.append({"txid": vin["txid"], "vout": vin["vout"], "value": vin["prevout"]["value"],
+                       "address": addr, "path": index[addr], "sequence": SEQUENCE_RBF})
+    return inputs
+
+
+def _descendant_fees(txids: List[str]) -> int:
+    """Soma das taxas das descendentes pendentes, consultadas na rede."""
+    total = 0
+    for child in txids:
+        try:
+            total += get_tx(child)["fee"]
+        except Exception as e:
+            raise RuntimeError(f"Não foi possível obter a taxa da descendente {child} ({e}); "
+                               "sem ela não há como calcular a taxa mínima do RBF.") from e
+    return total
+
+
+def find_change_output(tx: dict, index: Dict[str, str],
+                       change_address: Optional[str] = None) -> Optional[Tuple[int, str, int]]:
+    """
+    (vout, endereço, valor) do troco: o output em change_address, ou o último
+    output para um endereço da carteira (o send sempre põe o troco por último).
+    Com um único output não há troco (seria o próprio pagamento).
+    """
+    vouts = tx["vout"]
+    for n in range(len(vouts) - 1, -1, -1):
+        addr = vouts[n].get("scriptpubkey_address")
+        if change_address is not None:
+            if addr == change_address:
+                return n, addr, vouts[n]["value"]
+        elif addr in index and len(vouts) > 1:
+            return n, addr, vouts[n]["value"]
+    return None
+
+
+def bump_fee_rbf(txid: str, fee_rate: int, password: Optional[str] = None,
+                 keys: Optional[KeyIndex] = None, change_address: Optional[str] = None,
+                 low_r: bool = False, workers: Optional[int] = None) -> Dict:
+    """
+    Substitui a transação por outra com os mesmos inputs, os mesmos pagamentos e
+    menos troco, pagando fee_rate sat/vB. Pelas regras do BIP125 a nova taxa
+    absoluta cobre a da antiga e a das descendentes pendentes que saem junto
+    do mempool (ledger), mais INCREMENTAL_RELAY_FEE * vsize da substituta.
+    Se o troco restante ficar abaixo do dust, ele é descartado (vai para a taxa).
+    """
+    tx = _load_unconfirmed(txid)
+    if not signals_rbf(tx):
+        raise RuntimeError(f"Transação {txid} não sinaliza RBF; use CPFP.")
+
+    index = load_address_index()
+    inputs = _owned_inputs(tx, index)
+    if inputs is None:
+        raise ValueError("RBF exige que todos os inputs sejam desta carteira.")
+
+    change = find_change_output(tx, index, change_address)
+    if change is None:
+        raise ValueError("Transação sem output de troco para reduzir.")
+    _, change_addr, change_value = change
+
+    outputs: Dict[str, int] = {}
+    for vout in tx["vout"]:
+        addr = vout.get("scriptpubkey_address")
+        if addr is None or addr in outputs:
+            raise ValueError("Só transações com outputs para endereços distintos podem ser refeitas.")
+        outputs[addr] = vout["value"]
+
+    old_fee = tx["fee"]
+    descendants = pending_descendants(txid)
+    replaced_fee = old_fee + _descendant_fees(descendants)
+    total_in = sum(inp["value"] for inp in inputs)
+    payments = sum(outputs.values()) - change_value
+
+    vbytes = estimate_vbytes(len(inputs), len(outputs), low_r)
+    new_fee = max(fee_rate * vbytes, replaced_fee + INCREMENTAL_RELAY_FEE * vbytes)
+    new_change = total_in - payments - new_fee
+    if new_change < DUST_P2WPKH:
+        del outputs[change_addr]
+        vbytes = estimate_vbytes(len(inputs), len(outputs), low_r)
+        new_fee = total_in - payments
+        if new_fee < max(fee_rate * vbytes, replaced_fee + INCREMENTAL_RELAY_FEE * vbytes):
+            raise RuntimeError(f"Troco insuficiente para taxa de {fee_rate} sat/vB; use CPFP "
+                               "ou uma taxa menor.")
+        change_addr = None
+    else:
+        outputs[change_addr] = new_change
+
+    signed_hex = build_signed_segwit_tx(inputs, outputs, password, keys, workers=workers, low_r=low_r)
+
+    to_address = next((a for a in outputs if a != change_addr), change_addr)
+    tx_data = _signed_tx_summary(signed_hex, inputs, outputs, None, to_address,
+                                 payments, change_addr, low_r)
+    tx_data.update({"method": "rbf", "replaces": txid, "old_fee_sats": old_fee,
+                    "replaced_fee_sats": replaced_fee, "tx_inputs": inputs, "tx_outputs": outputs,
+                    "invalidates": descendants})
+    return tx_data
+
+
+def cpfp(txid: str, fee_rate: int, password: Optional[str] = None,
+         keys: Optional[KeyIndex] = None, change_address: Optional[str] = None,
+         to_address: Optional[str] = None, low_r: bool = False) -> Dict:
+    """
+    Gasta o troco da transação pai numa filha (1 input, 1 output para
+    to_address, padrão o próprio endereço de troco) com taxa
+        fee_rate * (vsize_pai + vsize_filha) - taxa_pai
+    para que o pacote atinja fee_rate. A filha paga no mínimo o próprio vsize.
+    """
+    tx = _load_unconfirmed(txid)
+    index = load_address_index()
+
+    change = find_change_output(tx, index, change_address)
+    if change is None:
+        raise ValueError("Transação sem output da carteira para CPFP.")
+    vout, addr, value = change
+    spenders = pending_spenders(f"{txid}:{vout}")
+    if spenders:
+        # a filha sinaliza RBF e substituiria o envio que já gasta este troco
+        raise RuntimeError(f"O troco {txid}:{vout} já é gasto pela transação pendente {spenders[0]}; "
+                           f"aumente a taxa dela (bump-fee {spenders[0]}) em vez de criar outra filha.")
+
+    parent_vsize = _vsize(tx)
+    parent_fee = tx["fee"]
+    child_vsize = estimate_vbytes(1, 1, low_r)
+    child_fee = max(fee_rate * (parent_vsize + child_vsize) - parent_fee,
+                    INCREMENTAL_RELAY_FEE * child_vsize)
+
+    dest = to_address or addr
+    amount = value - child_fee
+    if amount < DUST_P2WPKH:
+        raise RuntimeError(f"Output de {value:,} sats não cobre a taxa do CPFP ({child_fee:,} sats).")
+
+    inputs = [{"txid": txid, "vout": vout, "value": value, "address": addr,
+               "path": index[addr], "sequence": SEQUENCE_RBF}]
+    outputs = {dest: amount}
+    signed_hex = build_signed_segwit_tx(inputs, outputs, password, keys, low_r=low_r)
+
+    tx_data = _signed_tx_summary(signed_hex, inputs, outputs, addr, dest, amount, None, low_r)
+    tx_data.update({
+        "method": "cpfp",
+        "parent_txid": txid,
+        "parent_fee_sats": parent_fee,
+        "parent_vbytes": parent_vsize,
+        "package_fee_rate": (parent_fee + tx_data["fee_sats"]) / (parent_vsize + tx_data["vbytes"]),
+        "tx_inputs": inputs,
+        "tx_outputs": outputs,
+    })
+    return tx_data
+
+
+def bump_fee(txid: str, fee_rate: int, password: str, method: str = "auto",
+             change_address: Optional[str] = None, broadcast: bool = True,
+             low_r: bool = False, workers: Optional[int] = None,
+             replace_descendants: bool = False) -> Dict:
+    """
+    Aumenta a taxa da transação para fee_rate sat/vB.
+    method: "rbf", "cpfp" ou "auto" (RBF se a transação sinaliza RBF e todos os
+    inputs são da carteira; senão CPFP sobre o troco).
+    Um RBF derruba as descendentes pendentes (envios que gastam o troco): sem
+    replace_descendants=True ele é recusado, sugerindo CPFP na mais nova delas.
+    """
+    if method not in ("auto", "rbf", "cpfp"):
+        raise ValueError(f"Método inválido: {method}")
+
+    if method == "auto":
+        tx = _load_unconfirmed(txid)
+        index = load_address_index()
+        rbf_ok = (signals_rbf(tx) and _owned_inputs(tx, index) is not None
+                  and find_change_output(tx, index, change_address) is not None)
+        method = "rbf" if rbf_ok else "cpfp"
+
+    if method == "rbf" and not replace_descendants:
+        descendants = pending_descendants(txid)
+        if descendants:
+            txs = load_ledger()["txs"]
+            youngest = max(descendants, key=lambda t: (txs.get(t, {}).get("created_at", 0), descendants.index(t)))
+            raise RuntimeError(f"{len(descendants)} transação(ões) pendente(s) gastam outputs de {txid} e "
+                               f"seriam descartadas pelo RBF ({', '.join(descendants)}). Acelere com CPFP na "
+                               f"mais nova (bump-fee {youngest} --cpfp) ou confirme a substituição com "
+                               "--replace-descendants.")
+
+    with KeyIndex(password) as keys:
+        if method == "rbf":
+            tx_data = bump_fee_rbf(txid, fee_rate, keys=keys, change_address=change_address,
+                                   low_r=low_r, workers=workers)
+        else:
+            tx_data = cpfp(txid, fee_rate, keys=keys, change_address=change_address, low_r=low_r)
+
+    if broadcast:
+        new_txid = broadcast_tx_hex(tx_data["signed_tx_hex"])
+        dropped = record_broadcast(new_txid, tx_data["tx_inputs"], tx_data["tx_outputs"], load_address_index(),
+                                   replaces=tx_data.get("replaces"))
+        if dropped:
+            tx_data["invalidates"] = dropped
+        tx_data["txid_broadcast"] = new_txid
+        tx_data["broadcast"] = True
+    else:
+        tx_data["broadcast"] = False
+    return tx_data
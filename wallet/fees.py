@@ -0,0 +1,109 @@
+"""
+Estimativa de taxa (sat/vB) a partir do /fee-estimates da API.
+
+A resposta ({"1": 87.8, "2": 87.8, "3": 80.1, ..., "144": 1.0}, alvo em blocos
+-> sat/vB) é guardada em ~/.wowlie/fee_cache.json por FEE_CACHE_TTL segundos,
+então vários comandos seguidos fazem uma única consulta. Entre dois alvos
+publicados a taxa é interpolada linearmente; o resultado é arredondado para
+cima e limitado por [MIN_FEE_RATE, MAX_FEE_RATE].
+"""
+from typing import Dict, Optional
+import json
+import math
+import os
+import time
+
+from wallet.network import get_fee_estimates
+from wallet.utils import WALLET_DIR, ensure_dirs
+
+FEE_CACHE_FILE = WALLET_DIR / "fee_cache.json"
+FEE_CACHE_TTL = 60              # segundos
+FEE_CACHE_MAX_STALE = 30 * 60   # usar cache antigo se a API estiver fora do ar
+
+DEFAULT_TARGET_BLOCKS = 6
+MIN_FEE_RATE = 1                # mínimo de relay
+MAX_FEE_RATE = 500              # proteção contra estimativa absurda
+
+
+def _read_cache() -> Optional[dict]:
+    try:
+        with open(FEE_CACHE_FILE) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_cache(estimates: Dict[int, float]) -> None:
+    try:
+        ensure_dirs()
+        tmp = FEE_CACHE_FILE.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"fetched_at": time.time(), "estimates": estimates}, f)
+        os.replace(tmp, FEE_CACHE_FILE)
+    except Exception:
+        pass
+
+
+def fee_estimates(max_age: int = FEE_CACHE_TTL) -> Dict[int, float]:
+    """
+    {alvo_em_blocos: sat/vB}, do cache se tiver menos de max_age segundos.
+    Se a consulta falhar, usa um cache de até FEE_CACHE_MAX_STALE segundos.
+    """
+    cached = _read_cache()
+    age = time.time() - cached["fetched_at"] if cached else None
+    if cached and age < max_age:
+        return {int(k): float(v) for k, v in cached["estimates"].items()}
+
+    try:
+        estimates = {int(k): float(v) for k, v in get_fee_estimates().items()}
+    except Exception as e:
+        if cached and age < FEE_CACHE_MAX_STALE:
+            return {int(k): float(v) for k, v in cached["estimates"].items()}
+        raise RuntimeError(f"Não foi possível obter estimativas de taxa: {e}")
+    if not estimates:
+        raise RuntimeError("API não retornou estimativas de taxa.")
+
+    _write_cache(estimates)
+    return estimates
+
+
+def interpolate_fee_rate(estimates: Dict[int, float], target_blocks: int) -> float:
+    """
+    Taxa para confirmar em target_blocks: o alvo exato se publicado, senão
+    interpolação linear entre os alvos vizinhos. Fora da faixa usa o extremo.
+    """
+    if target_blocks < 1:
+        raise ValueError("target_blocks deve ser >= 1")
+    targets = sorted(estimates)
+    if target_blocks in estimates:
+        return estimates[target_blocks]
+    if target_blocks < targets[0]:
+        return estimates[targets[0]]
+    if target_blocks > targets[-1]:
+        return estimates[targets[-1]]
+
+    hi = next(t for t in targets if t > target_blocks)
+    lo = max(t for t in targets if t < target_blocks)
+    frac = (target_blocks - lo) / (hi - lo)
+    return estimates[lo] + (estimates[hi] - estimates[lo]) * frac
+
+
+def estimate_fee_rate(target_blocks: int = DEFAULT_TARGET_BLOCKS,
+                      min_rate: int = MIN_FEE_RATE, max_rate: int = MAX_FEE_RATE) -> int:
+    """Taxa inteira (sat/vB) para confirmar em até target_blocks blocos."""
+    rate = math.ceil(interpolate_fee_rate(fee_estimates(), target_blocks))
+    return max(min_rate, min(max_rate, rate))
+
+
+def resolve_fee_rate(fee_rate: Optional[int] = None, target_blocks: Optional[int] = None) -> int:
+    """
+    Taxa manual (se informada, validada contra os limites) ou estimada para
+    target_blocks (padrão DEFAULT_TARGET_BLOCKS).
+    """
+    if fee_rate is not None:
+        if fee_rate < MIN_FEE_RATE:
+            raise ValueError(f"Taxa mínima é {MIN_FEE_RATE} sat/vB.")
+        if fee_rate > MAX_FEE_RATE:
+            raise ValueError(f"Taxa de {fee_rate} sat/vB acima do limite de {MAX_FEE_RATE} sat/vB.")
+        return fee_rate
+    return estimate_fee_rate(target_blocks or DEFAULT_TARGET_BLOCKS)
@@ -0,0 +1,75 @@
+"""
+Tabela de custo de um pagamento para vários fee rates de uma vez.
+
+Reproduz a seleção de select_utxos (confirmados primeiro, valor ascendente,
+para no primeiro prefixo que cobre valor + taxa com 2 outputs) para um vetor
+de fee rates usando somas cumulativas em numpy: ordenamos os UTXOs uma vez e,
+para cada taxa, o número de inputs é o primeiro k com
+    soma(valores[:k]) >= amount + vbytes(k, 2) * fee_rate
+"""
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from wallet.transactions import DUST_P2WPKH, estimate_vbytes, estimate_weight
+
+DEFAULT_FEE_RATES = (1, 2, 3, 5, 8, 10, 15, 20, 30, 50, 75, 100, 150, 200)
+
+
+def _vbytes_by_inputs(n: int, n_outputs: int, low_r: bool = False) -> np.ndarray:
+    """vbytes[k-1] == estimate_vbytes(k, n_outputs, low_r) para k = 1..n."""
+    k = np.arange(1, n + 1, dtype=np.int64)
+    per_input = estimate_weight(1, n_outputs, low_r) - estimate_weight(0, n_outputs, low_r)
+    varint_extra = np.where(k < 0xfd, 0, np.where(k <= 0xffff, 2, 4))
+    weight = estimate_weight(0, n_outputs, low_r) + k * per_input + 4 * varint_extra
+    return (weight + 3) // 4
+
+
+def fee_table(utxos: List[dict], amount_sats: int, fee_rates: Sequence[int] = DEFAULT_FEE_RATES,
+              low_r: bool = False) -> List[Dict]:
+    """
+    Para cada fee rate: inputs usados, vsize, taxa paga, troco e se o troco
+    caiu abaixo do dust (e foi somado à taxa). Mesmo resultado de prepare_tx
+    com os mesmos UTXOs. Linhas com "inputs": 0 são saldo insuficiente.
+    """
+    rates = np.asarray(fee_rates, dtype=np.int64)
+    rows = []
+    if not utxos:
+        return [{"fee_rate": int(r), "inputs": 0, "vbytes": 0, "fee_sats": 0, "change_sats": 0,
+                 "dust_dropped": False, "sufficient": False} for r in rates]
+
+    confirmed = np.array([bool(u.get("status", {}).get("confirmed", False)) for u in utxos])
+    values = np.array([u["value"] for u in utxos], dtype=np.int64)
+    order = np.lexsort((values, ~confirmed))   # confirmados primeiro, depois valor
+    cumsum = np.cumsum(values[order])
+
+    vb2 = _vbytes_by_inputs(len(values), 2, low_r)
+    fee2 = vb2[None, :] * rates[:, None]                         # (taxas, k)
+    covers = cumsum[None, :] >= amount_sats + fee2
+    found = covers.any(axis=1)
+    k_idx = covers.argmax(axis=1)                                # primeiro prefixo que cobre
+
+    rows_i = np.arange(len(rates))
+    total = cumsum[k_idx]
+    fee_est = fee2[rows_i, k_idx]
+    change = total - amount_sats - fee_est
+    dust = (change > 0) & (change < DUST_P2WPKH)
+    change = np.where(dust, 0, change)
+
+    for i, r in enumerate(rates):
+        if not found[i]:
+            rows.append({"fee_rate": int(r), "inputs": 0, "vbytes": 0, "fee_sats": 0, "change_sats": 0,
+                         "dust_dropped": False, "sufficient": False})
+            continue
+        n_in = int(k_idx[i]) + 1
+        n_out = 2 if change[i] > 0 else 1
+        rows.append({
+            "fee_rate": int(r),
+            "inputs": n_in,
+            "vbytes": estimate_vbytes(n_in, n_out, low_r),
+            "fee_sats": int(total[i] - amount_sats - change[i]),
+            "change_sats": int(change[i]),
+            "dust_dropped": bool(dust[i]),
+            "sufficient": True,
+        })
+    return rows
@@ -0,0 +1,233 @@
+"""
+Histórico de transações da carteira, sincronizado de forma incremental.
+
+As transações ficam em ~/.wowlie/history.sqlite, uma linha por
+(endereço, txid) com o quanto aquele endereço recebeu e gastou. A sincronização
+de cada endereço pagina /address/{a}/txs e /address/{a}/txs/chain/{último}
+(mais novas primeiro) e para na primeira transação confirmada já conhecida;
+as do mempool são substituídas a cada sincronização. Se uma sincronização for
+interrompida, a próxima continua a paginação de onde parou (sync_state).
+
+Reorganizações: sync_state guarda a maior altura sincronizada de cada
+endereço; as confirmadas nos últimos REORG_DEPTH blocos até ela são apagadas
+e buscadas de novo a cada sincronização. Uma transação que saiu da chain
+(reorg, ou descartada depois de confirmada) some do histórico, e uma
+substituta confirmada abaixo da mais nova conhecida é encontrada.
+
+A leitura (iter_history) é um gerador sobre o cursor do sqlite: o histórico
+nunca é carregado inteiro em memória.
+"""
+from contextlib import closing
+from typing import Dict, Iterator, List, Optional, Set
+import sqlite3
+
+from wallet.network import get_address_txs
+from wallet.utils import WALLET_DIR, ensure_dirs, load_addresses
+
+HISTORY_DB = WALLET_DIR / "history.sqlite"
+CHAIN_PAGE_SIZE = 25   # transações confirmadas por página na API
+REORG_DEPTH = 6        # blocos abaixo da maior altura sincronizada que são conferidos de novo
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS address_txs (
+    address      TEXT NOT NULL,
+    txid         TEXT NOT NULL,
+    received     INTEGER NOT NULL,
+    sent         INTEGER NOT NULL,
+    fee          INTEGER NOT NULL,
+    confirmed    INTEGER NOT NULL,
+    block_height INTEGER,
+    block_time   INTEGER,
+    PRIMARY KEY (address, txid)
+);
+CREATE INDEX IF NOT EXISTS address_txs_order ON address_txs (confirmed, block_height, txid);
+CREATE TABLE IF NOT EXISTS sync_state (
+    address     TEXT PRIMARY KEY,
+    complete     INTEGER NOT NULL DEFAULT 0,
+    resume_txid  TEXT,
+    block_height INTEGER
+);
+"""
+
+
+def connect(path=None) -> sqlite3.Connection:
+    ensure_dirs()
+    conn = sqlite3.connect(str(path or HISTORY_DB))
+    conn.executescript(_SCHEMA)
+    # bancos criados antes da coluna (maior altura sincronizada)
+    if "block_height" not in {row[1] for row in conn.execute("PRAGMA table_info(sync_state)")}:
+        conn.execute("ALTER TABLE sync_state ADD COLUMN block_height INTEGER")
+        conn.commit()
+    return conn
+
+
+def decode_tx(tx: dict, address: str) -> Dict:
+    """Efeito de uma transação (formato da API) sobre um endereço."""
+    received = sum(o["value"] for o in tx["vout"] if o.get("scriptpubkey_address") == address)
+    sent = sum(i["prevout"]["value"] for i in tx["vin"]
+               if i.get("prevout") and i["prevout"].get("scriptpubkey_address") == address)
+    status = tx.get("status", {})
+    return {
+        "address": address,
+        "txid": tx["txid"],
+        "received": received,
+        "sent": sent,
+        "fee": tx.get("fee", 0),
+        "confirmed": 1 if status.get("confirmed") else 0,
+        "block_height": status.get("block_height"),
+        "block_time": status.get("block_time"),
+    }
+
+
+def _store(conn: sqlite3.Connection, rows: List[Dict]) -> None:
+    conn.executemany(
+        "INSERT OR REPLACE INTO address_txs VALUES "
+        "(:address, :txid, :received, :sent, :fee, :confirmed, :block_height, :block_time)", rows)
+
+
+def _max_height(conn: sqlite3.Connection, address: str) -> Optional[int]:
+    return conn.execute("SELECT MAX(block_height) FROM address_txs WHERE address = ? AND confirmed = 1",
+                        (address,)).fetchone()[0]
+
+
+def _confirmed_txids(conn: sqlite3.Connection, address: Optional[str] = None) -> Set[str]:
+    if address is None:
+        rows = conn.execute("SELECT DISTINCT txid FROM address_txs WHERE confirmed = 1")
+    else:
+        rows = conn.execute("SELECT txid FROM address_txs WHERE address = ? AND confirmed = 1", (address,))
+    with closing(rows):
+        return {txid for (txid,) in rows}
+
+
+def _known_confirmed(conn: sqlite3.Connection, address: str, txid: str) -> bool:
+    row = conn.execute("SELECT 1 FROM address_txs WHERE address = ? AND txid = ? AND confirmed = 1",
+                       (address, txid)).fetchone()
+    return row is not None
+
+
+def _page_chain(conn: sqlite3.Connection, address: str, chain: List[dict],
+                stop_at_known: bool, recheck_from: Optional[int] = None) -> Optional[str]:
+    """
+    Grava páginas de confirmadas até acabar o histórico (retorna None) ou,
+    com stop_at_known, até achar uma já conhecida (retorna "known").
+    Sem stop_at_known cada página é gravada com o ponto de retomada, então uma
+    interrupção não perde o progresso. Com stop_at_known tudo é gravado numa
+    única transação ao encontrar a conhecida, para não deixar lacunas; as
+    confirmadas a partir da altura recheck_from são apagadas antes, então a
+    paginação só para abaixo dela e a API decide quais continuam na chain.
+    """
+    if stop_at_known and recheck_from is not None:
+        conn.execute("DELETE FROM address_txs WHERE address = ? AND confirmed = 1 AND block_height >= ?",
+                     (address, recheck_from))
+    try:
+        while chain:
+            new = []
+            for tx in chain:
+                if stop_at_known and _known_confirmed(conn, address, tx["txid"]):
+                    _store(conn, new)
+                    conn.commit()
+                    return "known"
+                new.append(decode_tx(tx, address))
+            _store(conn, new)
+            if len(chain) < CHAIN_PAGE_SIZE:
+                conn.commit()
+                return None
+            last = chain[-1]["txid"]
+            if not stop_at_known:
+                conn.execute("UPDATE sync_state SET resume_txid = ? WHERE address = ?", (last, address))
+                conn.commit()
+            chain = get_address_txs(address, last)
+        conn.commit()
+        return None
+    except BaseException:
+        conn.rollback()   # a janela apagada volta: nada de lacunas
+        raise
+
+
+def sync_address(conn: sqlite3.Connection, address: str) -> Set[str]:
+    """
+    Sincroniza um endereço: mempool atual, confirmadas novas até a primeira
+    conhecida e, se a última sincronização não terminou, o restante do
+    histórico antigo. Retorna os txids confirmados que o endereço não tinha antes.
+    """
+    before = _confirmed_txids(conn, address)
+    conn.execute("INSERT OR IGNORE INTO sync_state (address) VALUES (?)", (address,))
+    complete, resume, synced_height = conn.execute(
+        "SELECT complete, resume_txid, block_height FROM sync_state WHERE address = ?", (address,)).fetchone()
+    if synced_height is None:
+        synced_height = _max_height(conn, address)
+
+    first_page = get_address_txs(address)
+    mempool = [tx for tx in first_page if not tx.get("status", {}).get("confirmed")]
+    chain = [tx for tx in first_page if tx.get("status", {}).get("confirmed")]
+
+    conn.execute("DELETE FROM address_txs WHERE address = ? AND confirmed = 0", (address,))
+    _store(conn, [decode_tx(tx, address) for tx in mempool])
+    conn.commit()
+
+    if complete or resume:
+        # as novas (acima da última conhecida) e as da janela de reorganização
+        recheck_from = synced_height - REORG_DEPTH + 1 if synced_height is not None else None
+        _page_chain(conn, address, chain, stop_at_known=True, recheck_from=recheck_from)
+        if not complete:
+            _page_chain(conn, address, get_address_txs(address, resume), stop_at_known=False)
+    else:
+        _page_chain(conn, address, chain, stop_at_known=False)
+
+    conn.execute("UPDATE sync_state SET complete = 1, resume_txid = NULL, block_height = ? WHERE address = ?",
+                 (_max_height(conn, address), address))
+    conn.commit()
+    return _confirmed_txids(conn, address) - before
+
+
+def sync_history(addresses: Optional[List[str]] = None, conn: Optional[sqlite3.Connection] = None) -> int:
+    """
+    Sincroniza os endereços informados (padrão: todos da carteira). Retorna
+    quantas transações confirmadas distintas são novas no histórico (uma
+    transação que toca vários endereços da carteira conta uma vez).
+    """
+    if addresses is None:
+        addresses = load_addresses()[1]
+    own = conn is None
+    conn = conn or connect()
+    try:
+        before = _confirmed_txids(conn)
+        new: Set[str] = set()
+        for addr in addresses:
+            new |= sync_address(conn, addr)
+        return len(new - before)
+    finally:
+        if own:
+            conn.close()
+
+
+def iter_history(conn: Optional[sqlite3.Connection] = None, limit: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Transações da carteira (pendentes primeiro, depois da mais recente para a
+    mais antiga), agregando todos os endereços: net = recebido - gasto (uma
+    transferência entre endereços próprios aparece como -taxa).
+    """
+    own = conn is None
+    conn = conn or connect()
+    sql = ("SELECT txid, SUM(received), SUM(sent), MAX(fee), MIN(confirmed), MAX(block_height), "
+           "MAX(block_time), GROUP_CONCAT(address) FROM address_txs GROUP BY txid "
+           "ORDER BY MIN(confirmed), MAX(block_height) DESC, txid")
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    try:
+        with closing(conn.execute(sql)) as cur:
+            for txid, received, sent, fee, confirmed, height, btime, addrs in cur:
+                yield {
+                    "txid": txid,
+                    "net_sats": received - sent,
+                    "received_sats": received,
+                    "sent_sats": sent,
+                    "fee_sats": fee if sent else 0,
+                    "confirmed": bool(confirmed),
+                    "block_height": height,
+                    "block_time": btime,
+                    "addresses": addrs.split(","),
+                }
+    finally:
+        if own:
+            conn.close()
@@ -1,12 +1,108 @@
+from typing import List, Tuple
 from btclib.mnemonic.bip39 import mnemonic_from_entropy, seed_from_mnemonic
-from btclib.bip32 import rootxprv_from_seed, derive
 from btclib import b32
-from btclib.to_pub_key import pub_keyinfo_from_key
+from btclib.bip32 import BIP32KeyData, derive, rootxprv_from_seed, xpub_from_xprv
+from btclib.hashes import hash160
+from btclib.network import NETWORKS
 from wallet.utils import save_wallet, load_wallet
 from wallet.crypto import encrypt_mnemonic, decrypt_mnemonic
+from wallet import ec
 import os
 
 
+# ---------------------------
+# BIP32 (derivação privada)
+# ---------------------------
+
+HARDENED = 0x80000000
+
+
+def bip32_master_key(seed: bytes) -> Tuple[bytes, bytes]:
+    """
+    Nó mestre BIP32 a partir da seed: retorna (chave privada, chain code).
+    """
+    xkey = BIP32KeyData.b58decode(rootxprv_from_seed(seed))
+    return xkey.key[1:], xkey.chain_code
+
+
+def parse_path(path: str) -> List[int]:
+    """
+    Converte "m/84'/1'/0'/0/5" em [84|H, 1|H, 0|H, 0, 5].
+    """
+    parts = path.strip().split("/")
+    if parts[0] != "m":
+        raise ValueError(f"Derivation path inválido: {path}")
+    indexes = []
+    for p in parts[1:]:
+        hardened = p.endswith("'") or p.lower().endswith("h")
+        n = int(p[:-1] if hardened else p)
+        if not 0 <= n < HARDENED:
+            raise ValueError(f"Derivation path inválido: {path}")
+        indexes.append(n + HARDENED if hardened else n)
+    return indexes
+
+
+def derive_prv(node: Tuple[bytes, bytes], path: str) -> Tuple[bytes, bytes]:
+    """
+    Deriva o nó (chave privada, chain code) do path, relativo a node (o
+    mestre para paths absolutos). A derivação é a do btclib.
+    """
+    prv, chain_code = node
+    parent = BIP32KeyData(version=NETWORKS["mainnet"].bip32_prv, depth=0, parent_fingerprint=b"\x00" * 4,
+                          index=0, chain_code=bytes(chain_code), key=b"\x00" + bytes(prv))
+    child = BIP32KeyData.b58decode(derive(parent, parse_path(path)))
+    return child.key[1:], child.chain_code
+
+
+def account_watch_only(node: Tuple[bytes, bytes], account_path: str) -> dict:
+    """
+    Dados públicos da conta a partir do nó mestre: xpub (tpub) de account_path
+    e fingerprint do mestre. Ficam no wallet.json para montar as derivações
+    BIP32 de um PSBT sem pedir a senha.
+    """
+    prv, chain_code = node
+    root = BIP32KeyData(version=NETWORKS["testnet"].bip32_prv, depth=0, parent_fingerprint=b"\x00" * 4,
+                        index=0, chain_code=bytes(chain_code), key=b"\x00" + bytes(prv))
+    return {
+        "account_xpub": xpub_from_xprv(derive(root, parse_path(account_path))),
+        "master_fingerprint": hash160(ec.pubkey_from_privkey(bytes(prv)))[:4].hex(),
+    }
+
+
+def store_watch_only(node: Tuple[bytes, bytes]) -> None:
+    """
+    Grava account_xpub/master_fingerprint no wallet.json se ainda não
+    existirem (carteiras criadas antes desses campos; chamado no unlock).
+    """
+    w = load_wallet()
+    if w.get("account_xpub") and w.get("master_fingerprint"):
+        return
+    w.update(account_watch_only(node, w.get("account_path", "m/84'/1'/0'")))
+    save_wallet(w)
+
+
+def watch_only_pubkey(account_xpub: str, account_path: str, path: str) -> bytes:
+    """
+    Pubkey do path derivada só da xpub da conta (sem chave privada). O path
+    precisa estar abaixo de account_path e sem índices hardened depois dele.
+    """
+    prefix = account_path.rstrip("/") + "/"
+    if not path.startswith(prefix):
+        raise ValueError(f"O path {path} não está na conta {account_path}")
+    try:
+        return BIP32KeyData.b58decode(derive(account_xpub, parse_path("m/" + path[len(prefix):]))).key
+    except Exception as e:
+        raise ValueError(f"Não foi possível derivar {path} da xpub da conta: {e}") from e
+
+
+def address_from_seed(seed: bytes, path: str) -> str:
+    """
+    Endereço P2WPKH testnet do path (BIP84) derivado da seed.
+    """
+    prv, _ = derive_prv(bip32_master_key(seed), path)
+    return b32.p2wpkh(ec.pubkey_from_privkey(prv), network="testnet")
+
+
 def init_wallet(password: str) -> dict:
 
     if not isinstance(password, str) or not password:
@@ -18,15 +114,11 @@ def init_wallet(password: str) -> dict:
     encrypted_mnemonic = encrypt_mnemonic(mnemonic, password)
         
     seed = seed_from_mnemonic(mnemonic, passphrase="")
-    rootxprv = rootxprv_from_seed(seed)
     
     # Derivar primeiro endereço BIP84 (native segwit) para testnet
     receive_path = "m/84'/1'/0'/0/0"
-    child_xprv = derive(rootxprv, receive_path)
-    
-    # Obter chave pública e gerar endereço
-    pub_key = pub_keyinfo_from_key(child_xprv)[0]
-    addr = b32.p2wpkh(pub_key, network="testnet")
+    addr = address_from_seed(seed, receive_path)
+    watch_only = account_watch_only(bip32_master_key(seed), "m/84'/1'/0'")
     
 
     data = {
@@ -39,12 +131,13 @@ def init_wallet(password: str) -> dict:
                 "address": addr
             }
         },
-        "next_index": 1
+        "next_index": 1,
+        **watch_only,
     }
     
     save_wallet(data)
     
-    del seed, rootxprv, child_xprv
+    del seed
 
     return {
         "wallet": data,
@@ -66,23 +159,20 @@ def next_address(password: str) -> str:
         return None
     
     seed = seed_from_mnemonic(mnemonic, passphrase="")
-    rootxprv = rootxprv_from_seed(seed)
     
     index = w["next_index"]
     path = f"m/84'/1'/0'/0/{index}"
     
-    # Derivar nova chave
-    child_xprv = derive(rootxprv, path)
-    
-    # Obter chave pública e gerar endereço
-    pub_key = pub_keyinfo_from_key(child_xprv)[0]
-    addr = b32.p2wpkh(pub_key, network="testnet")
+    # Derivar nova chave e gerar endereço
+    addr = address_from_seed(seed, path)
  
     w["addresses"][str(index)] = {"path": path, "address": addr}
     w["next_index"] = index + 1
+    if not (w.get("account_xpub") and w.get("master_fingerprint")):
+        w.update(account_watch_only(bip32_master_key(seed), w.get("account_path", "m/84'/1'/0'")))
     save_wallet(w)
     
-    del seed, rootxprv, child_xprv, mnemonic
+    del seed, mnemonic
     
     return addr
 
@@ -143,15 +233,10 @@ def import_wallet(mnemonic: str, password: str) -> dict:
     # Criptografar a mnemonic com a senha fornecida
     encrypted_mnemonic = encrypt_mnemonic(mnemonic, password)
     
-    rootxprv = rootxprv_from_seed(seed)
-    
     # Derivar primeiro endereço BIP84 (native segwit) para testnet
     receive_path = "m/84'/1'/0'/0/0"
-    child_xprv = derive(rootxprv, receive_path)
-    
-    # Obter chave pública e gerar endereço
-    pub_key = pub_keyinfo_from_key(child_xprv)[0]
-    addr = b32.p2wpkh(pub_key, network="testnet")
+    addr = address_from_seed(seed, receive_path)
+    watch_only = account_watch_only(bip32_master_key(seed), "m/84'/1'/0'")
     
     data = {
         "encrypted_mnemonic": encrypted_mnemonic,  
@@ -163,12 +248,13 @@ def import_wallet(mnemonic: str, password: str) -> dict:
                 "address": addr
             }
         },
-        "next_index": 1
+        "next_index": 1,
+        **watch_only,
     }
     
     save_wallet(data)
     
-    del seed, rootxprv, child_xprv
+    del seed
     
     return {
         "wallet": data,
@@ -0,0 +1,242 @@
+"""
+Ledger local de transações pendentes (~/.wowlie/pending.json).
+
+Toda transação nossa transmitida é registrada aqui com os outpoints que ela
+gasta e os outputs que voltam para a carteira (troco). Ao listar UTXOs:
+  - outpoints gastos por transações pendentes são removidos, mesmo que a API
+    ainda os mostre (o mempool da API pode estar atrasado);
+  - nossos outputs pendentes entram como UTXOs não confirmados, para que o
+    próximo envio possa gastar o troco sem esperar um bloco.
+
+Reservas: durante a seleção de moedas os outpoints escolhidos ficam reservados
+(com validade), e a seleção só enxerga o que não está reservado. Tudo sob um
+lock de arquivo, então CLI, Streamlit e outros processos nunca escolhem a
+mesma moeda ao mesmo tempo.
+"""
+from contextlib import contextmanager
+from typing import Callable, Collection, Dict, Iterable, List, Optional, Set, Tuple, Union
+import json
+import os
+import threading
+import time
+
+from wallet.utils import WALLET_DIR, ensure_dirs, file_lock
+
+PENDING_FILE = WALLET_DIR / "pending.json"
+LOCK_FILE = WALLET_DIR / "pending.lock"
+
+RESERVATION_TTL = 10 * 60        # reserva de uma seleção ainda não transmitida
+PENDING_TTL = 3 * 24 * 3600      # descartar pendentes que nunca apareceram na rede
+
+_thread_lock = threading.RLock()
+_depth = 0
+
+
+@contextmanager
+def ledger_lock():
+    """
+    Lock exclusivo entre processos (arquivo) e threads. Reentrante na mesma
+    thread, para que seleção + reserva possam rodar sob um único lock.
+    """
+    global _depth
+    with _thread_lock:
+        if _depth:
+            _depth += 1
+            try:
+                yield
+            finally:
+                _depth -= 1
+            return
+        with file_lock(LOCK_FILE):
+            _depth = 1
+            try:
+                yield
+            finally:
+                _depth = 0
+
+
+def _outpoint(u: dict) -> str:
+    return f"{u['txid']}:{u['vout']}"
+
+
+def load_ledger() -> dict:
+    """{"txs": {txid: {...}}, "reservations": {outpoint: expira_em}} (vazio se não existir)."""
+    try:
+        with open(PENDING_FILE) as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        data = {}
+    data.setdefault("txs", {})
+    data.setdefault("reservations", {})
+    return data
+
+
+def _save_ledger(data: dict) -> None:
+    ensure_dirs()
+    tmp = PENDING_FILE.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, PENDING_FILE)
+
+
+def _active_reservations(data: dict) -> Dict[str, float]:
+    now = time.time()
+    return {op: exp for op, exp in data["reservations"].items() if exp > now}
+
+
+def reserved_outpoints() -> Set[str]:
+    """Outpoints ("txid:vout") reservados por seleções em andamento."""
+    return set(_active_reservations(load_ledger()))
+
+
+def unreserved(utxos: List[dict]) -> List[dict]:
+    """UTXOs que não estão reservados por outra seleção em andamento."""
+    taken = reserved_outpoints()
+    return [u for u in utxos if _outpoint(u) not in taken]
+
+
+def reserve_outpoints(utxos: Iterable[dict], ttl: int = RESERVATION_TTL) -> None:
+    """Reserva os outpoints por ttl segundos (chame dentro de ledger_lock junto com a seleção)."""
+    with ledger_lock():
+        data = load_ledger()
+        data["reservations"] = _active_reservations(data)
+        expires = time.time() + ttl
+        for u in utxos:
+            data["reservations"][_outpoint(u)] = expires
+        _save_ledger(data)
+
+
+def release_outpoints(utxos: Iterable[dict]) -> None:
+    """Libera reservas (envio abortado ou falho)."""
+    with ledger_lock():
+        data = load_ledger()
+        for u in utxos:
+            data["reservations"].pop(_outpoint(u), None)
+        _save_ledger(data)
+
+
+def pending_spenders(outpoint: str) -> List[str]:
+    """Txids das transações pendentes que gastam o outpoint ("txid:vout")."""
+    return [txid for txid, e in load_ledger()["txs"].items() if outpoint in e["spent"]]
+
+
+def _descendants(data: dict, txid: str) -> List[str]:
+    """Pendentes que gastam outputs de txid, direta ou indiretamente (ordem de descoberta)."""
+    found, frontier = [], [txid]
+    while frontier:
+        parent = frontier.pop()
+        for child, e in data["txs"].items():
+            if child not in found and child != txid and any(op.startswith(parent + ":") for op in e["spent"]):
+                found.append(child)
+                frontier.append(child)
+    return found
+
+
+def pending_descendants(txid: str) -> List[str]:
+    """
+    Transações pendentes que gastam outputs de txid (e as que gastam as
+    delas): uma substituição (RBF) de txid as invalida na rede.
+    """
+    return _descendants(load_ledger(), txid)
+
+
+def record_broadcast(txid: str, inputs: List[dict],
+                     outputs: Union[Dict[str, int], List[Tuple[Optional[str], int]]],
+                     owned: Iterable[str], replaces: Optional[str] = None) -> List[str]:
+    """
+    Registra uma transação nossa transmitida: os inputs passam a gastos e os
+    outputs para endereços em owned viram UTXOs pendentes. outputs é o dict de
+    prepare_tx ou a lista [(endereço, valor)] na ordem dos vouts. replaces
+    remove a entrada da transação substituída (RBF) e as das pendentes que
+    gastavam os outputs dela, já inválidas. As reservas dos inputs são liberadas.
+    Retorna os txids dessas descendentes removidas.
+    """
+    owned = set(owned)
+    items = list(outputs.items()) if isinstance(outputs, dict) else list(outputs)
+    dropped: List[str] = []
+    with ledger_lock():
+        data = load_ledger()
+        if replaces:
+            dropped = _descendants(data, replaces)
+            for old in [replaces] + dropped:
+                data["txs"].pop(old, None)
+        spent = [_outpoint(inp) for inp in inputs]
+        data["txs"][txid] = {
+            "created_at": int(time.time()),
+            "spent": spent,
+            "spent_addresses": sorted({inp["address"] for inp in inputs if inp.get("address")}),
+            "outputs": [{"txid": txid, "vout": n, "value": value, "address": addr}
+                        for n, (addr, value) in enumerate(items) if addr in owned],
+        }
+        for op in spent:
+            data["reservations"].pop(op, None)
+        _save_ledger(data)
+    return dropped
+
+
+def _reconcile(data: dict, addresses: Collection[str], on_network: Callable[[str], bool]
+               ) -> Tuple[set, List[Tuple[str, dict]]]:
+    """
+    Remove do ledger as transações que a rede já reflete (ou expiradas) e
+    retorna (outpoints gastos por pendentes, [(endereço, UTXO pendente)]).
+    addresses: endereços consultados; on_network(outpoint): veio da rede.
+    """
+    spent = {op for e in data["txs"].values() for op in e["spent"]}
+    now = time.time()
+
+    stale = []
+    for txid, entry in data["txs"].items():
+        outs = {_outpoint(o) for o in entry["outputs"]}
+        addrs = set(entry.get("spent_addresses", [])) | {o["address"] for o in entry["outputs"]}
+        # a rede já reflete a transação: inputs sumiram e outputs apareceram (ou foram gastos)
+        seen = (addrs.issubset(addresses)
+                and not any(on_network(op) for op in entry["spent"])
+                and all(on_network(op) or op in spent for op in outs))
+        if seen or now - entry["created_at"] > PENDING_TTL:
+            stale.append(txid)
+    if stale:
+        for txid in stale:
+            del data["txs"][txid]
+        _save_ledger(data)
+
+    pending = []
+    for entry in data["txs"].values():
+        for o in entry["outputs"]:
+            op = _outpoint(o)
+            if o["address"] in addresses and not on_network(op) and op not in spent:
+                pending.append((o["address"], {"txid": o["txid"], "vout": o["vout"], "value": o["value"],
+                                               "status": {"confirmed": False}, "pending": True}))
+    return spent, pending
+
+
+def apply_ledger(utxos_by_address: Dict[str, List[dict]]) -> Dict[str, List[dict]]:
+    """
+    Ajusta os UTXOs vindos da rede ({endereço: [utxos]}) pelo ledger: remove os
+    gastos por transações pendentes e acrescenta nossos outputs pendentes.
+    Entradas que a rede já reflete (ou expiradas) são removidas do ledger.
+    """
+    with ledger_lock():
+        data = load_ledger()
+        if not data["txs"]:
+            return utxos_by_address
+
+        network = {_outpoint(u) for us in utxos_by_address.values() for u in us}
+        spent, pending = _reconcile(data, utxos_by_address.keys(), network.__contains__)
+        result = {}
+        for addr, us in utxos_by_address.items():
+            result[addr] = [u for u in us if _outpoint(u) not in spent]
+        for addr, u in pending:
+            result[addr].append(u)
+        return result
+
+
+def apply_ledger_spool(spool) -> None:
+    """Como apply_ledger, direto num UtxoSpool (sem montar as listas em memória)."""
+    with ledger_lock():
+        data = load_ledger()
+        if not data["txs"]:
+            return
+        spent, pending = _reconcile(data, spool.addresses, spool.__contains__)
+        spool.discard(spent)
+        for addr, u in pending:
+            spool.add(addr, [u])
@@ -0,0 +1,206 @@
+"""
+Controle adaptativo de concorrência para consultas HTTP (AIMD).
+
+Um AdaptiveLimiter decide quantas requisições podem estar em voo ao mesmo
+tempo para um servidor, como o controle de congestionamento do TCP:
+  - partida lenta: até a primeira redução, cada resposta rápida soma 1 ao
+    limite (dobra a cada tempo de resposta)
+  - aumento aditivo: cada resposta rápida soma increase/limite, ou seja, +1
+    no limite a cada "janela" de respostas boas
+  - redução multiplicativa: um 429/503 multiplica o limite por decrease
+    (no máximo uma redução por tempo de resposta, para que uma rajada de
+    429 da mesma janela não derrube o limite a 1) e pausa novas requisições
+    pelo Retry-After do servidor (ou por um backoff exponencial, sem ele)
+  - latência: se a resposta demora mais que latency_factor vezes a linha de
+    base (menor latência recente), o servidor está enfileirando; o limite
+    cai por latency_decrease
+
+O limitador é por backend (network.EsploraBackend) e portanto compartilhado
+por tudo que consulta a rede no processo: saldos, UTXOs de todos os
+endereços, histórico, pagamentos e acompanhamento de transações.
+
+Comparação com concorrência fixa num Esplora local com limite de taxa:
+    python -m wallet.limiter --bench [--addresses 300 --rate-limit 100 --latency-ms 30]
+"""
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+import threading
+import time
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Segundos de um cabeçalho Retry-After (número ou data HTTP), ou None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial: float = 4, min_limit: float = 1, max_limit: float = 32,
+                 increase: float = 1.0, decrease: float = 0.5, latency_factor: float = 3.0,
+                 latency_decrease: float = 0.9, max_pause: float = 60.0):
+        self.limit = float(initial)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.latency_decrease = latency_decrease
+        self.max_pause = max_pause
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._pause_until = 0.0
+        self._backoff = 0.0
+        self._last_decrease = 0.0
+        self._slow_start = True
+        self._srtt: Optional[float] = None      # latência média (EWMA)
+        self._base: Optional[float] = None      # linha de base: menor latência recente
+        self.stats = {"requests": 0, "throttled": 0, "latency_cuts": 0, "waited": 0.0}
+
+    def acquire(self) -> None:
+        """Espera uma vaga (limite e pausa de Retry-After)."""
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                pause = self._pause_until - now
+                if pause <= 0 and self.in_flight < max(1, int(self.limit)):
+                    self.in_flight += 1
+                    self.stats["requests"] += 1
+                    self.stats["waited"] += now - start
+                    return
+                self._cond.wait(pause if pause > 0 else None)
+
+    def release(self, latency: Optional[float] = None, throttled: bool = False,
+                retry_after: Optional[float] = None) -> None:
+        """
+        Devolve a vaga. throttled: o servidor respondeu 429/503. latency=None
+        (falha de conexão) não altera o limite.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.stats["throttled"] += 1
+                self._backoff = min(self.max_pause, self._backoff * 2 if self._backoff else 1.0)
+                pause = min(self.max_pause, retry_after if retry_after is not None else self._backoff)
+                self._pause_until = max(self._pause_until, now + pause)
+                self._cut(now, self.decrease)
+            elif latency is not None:
+                self._backoff = 0.0
+                self._srtt = latency if self._srtt is None else 0.8 * self._srtt + 0.2 * latency
+                # a linha de base sobe devagar, para acompanhar um servidor que ficou mais lento
+                self._base = latency if self._base is None else min(self._base * 1.01, latency)
+                if latency > self.latency_factor * self._base and self._srtt > self.latency_factor * self._base:
+                    if self._cut(now, self.latency_decrease):
+                        self.stats["latency_cuts"] += 1
+                else:
+                    step = self.increase if self._slow_start else self.increase / max(self.limit, 1.0)
+                    self.limit = min(self.max_limit, self.limit + step)
+            self._cond.notify_all()
+
+    def _cut(self, now: float, factor: float) -> bool:
+        """Redução multiplicativa, no máximo uma por tempo de resposta."""
+        if now - self._last_decrease < max(self._srtt or 0.0, 0.05):
+            return False
+        self.limit = max(self.min_limit, self.limit * factor)
+        self._last_decrease = now
+        self._slow_start = False
+        return True
+
+    @contextmanager
+    def slot(self):
+        """with limiter.slot() as done: ...; done(status, retry_after) para informar o resultado."""
+        self.acquire()
+        start = time.monotonic()
+        outcome = {"throttled": False, "retry_after": None, "ok": True}
+
+        def done(throttled: bool = False, retry_after: Optional[float] = None) -> None:
+            outcome.update(throttled=throttled, retry_after=retry_after)
+
+        try:
+            yield done
+        except Exception:
+            outcome["ok"] = False
+            raise
+        finally:
+            latency = time.monotonic() - start if outcome["ok"] else None
+            self.release(latency, outcome["throttled"], outcome["retry_after"])
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {"limit": round(self.limit, 2), "in_flight": self.in_flight,
+                    "paused_for": max(0.0, self._pause_until - time.monotonic()),
+                    "srtt_ms": None if self._srtt is None else self._srtt * 1000,
+                    "base_ms": None if self._base is None else self._base * 1000, **self.stats}
+
+
+def benchmark(n_addresses: int = 300, rate_limit: float = 100.0, retry_after: float = 1.0,
+              latency: float = 0.03, fixed=(4, 32), seed: int = 0):
+    """
+    Consulta os UTXOs de n_addresses endereços (get_utxos_many) num Esplora
+    local limitado a rate_limit req/s, com concorrência fixa e com o
+    limitador adaptativo. Retorna uma linha por configuração.
+    """
+    import random
+
+    from btclib import b32
+
+    from wallet.esplora_standin import ChainState, EsploraStandIn
+    from wallet.network import FANOUT_WORKERS, EsploraBackend
+
+    rng = random.Random(seed)
+    addrs = [b32.address_from_witness(0, rng.randbytes(20), "testnet") for _ in range(n_addresses)]
+    state = ChainState()
+    state.synthetic_wallet(addrs, 2, seed=seed)
+    configs = [(f"fixo x{n}", AdaptiveLimiter(initial=n, min_limit=n, max_limit=n)) for n in fixed]
+    configs.append((f"adaptativo (1..{FANOUT_WORKERS})", AdaptiveLimiter(max_limit=FANOUT_WORKERS)))
+    results = []
+    for name, limiter in configs:
+        # servidor novo por configuração: o balde de fichas começa cheio para todas
+        server = EsploraStandIn(state, latency=latency, rate_limit=rate_limit, retry_after=retry_after,
+                                seed=seed).start()
+        backend = EsploraBackend(server.url, limiter=limiter, max_retries=10)
+        try:
+            t0 = time.perf_counter()
+            try:
+                backend.get_utxos_many(addrs)
+                ok = True
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - t0
+        finally:
+            server.stop()
+        results.append({"name": name, "ok": ok, "seconds": elapsed, "per_sec": n_addresses / elapsed,
+                        "requests": server.requests, "throttled": server.rate_limited,
+                        "final_limit": limiter.limit})
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    p = argparse.ArgumentParser(description="Benchmark do limitador adaptativo contra um Esplora com limite de taxa")
+    p.add_argument("--bench", action="store_true")
+    p.add_argument("--addresses", type=int, default=300)
+    p.add_argument("--rate-limit", type=float, default=100.0, help="req/s aceitas pelo servidor")
+    p.add_argument("--retry-after", type=float, default=1.0)
+    p.add_argument("--latency-ms", type=float, default=30.0)
+    args = p.parse_args()
+    if not args.bench:
+        p.print_help()
+    else:
+        print(f"{args.addresses} endereços, servidor a {args.rate_limit:g} req/s "
+              f"(Retry-After {args.retry_after:g}s), latência {args.latency_ms:.0f} ms")
+        print(f"{'concorrência':<24} {'ok':>4} {'seg':>7} {'end/s':>7} {'reqs':>6} {'429':>6} {'limite':>7}")
+        for r in benchmark(args.addresses, args.rate_limit, args.retry_after, args.latency_ms / 1000):
+            print(f"{r['name']:<24} {'sim' if r['ok'] else 'não':>4} {r['seconds']:>7.2f} {r['per_sec']:>7.1f} "
+                  f"{r['requests']:>6} {r['throttled']:>6} {r['final_limit']:>7.1f}")
@@ -0,0 +1,306 @@
+"""
+Vários servidores Esplora (espelhos) com hedging e pontuação de saúde.
+
+MirroredBackend usa um EsploraBackend por espelho (cada um com seu limitador
+e seu single-flight):
+  - leituras vão ao espelho de melhor pontuação (latência mediana, pior a
+    cada falha recente); se ele não responde dentro do seu p95, a mesma
+    consulta vai ao próximo (hedging) e vale a primeira resposta
+  - falha de conexão, 429 ou 5xx passa a consulta ao próximo na hora;
+    FAIL_LIMIT falhas seguidas tiram o espelho da rotação por DOWN_BASE
+    segundos, tempo que dobra a cada nova falha (até DOWN_MAX). Erros 4xx
+    (endereço ou transação inválidos) são a resposta, não falha do servidor
+  - broadcast vai a todos os espelhos no ar em paralelo; vale o primeiro que
+    aceitar
+  - metrics(): latência, erros, vitórias e estado de cada espelho
+    (python cli.py endpoints)
+
+Config: "esplora": {"urls": ["https://blockstream.info/testnet/api",
+"https://mempool.space/testnet/api"]} no config.json, ou
+WOWLIE_ESPLORA_URL=url1,url2. "hedge_after_ms" fixa o atraso do hedging (sem
+ele, o p95 de cada espelho). Comparação com um único servidor:
+    python -m wallet.mirrors --bench [--reads 200 --tail-rate 0.02]
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Dict, Iterator, List, Optional
+import threading
+import time
+
+from wallet.network import FANOUT_WORKERS, Backend, EsploraBackend, _fanout_or_raise
+from wallet.rawtx import decode_raw_tx
+
+HEDGE_DEFAULT = 0.5    # atraso do hedging enquanto o espelho tem poucas amostras de latência
+HEDGE_MIN = 0.05
+HEDGE_MAX = 3.0
+MIN_SAMPLES = 10
+FAIL_LIMIT = 3
+DOWN_BASE = 10.0
+DOWN_MAX = 300.0
+
+
+def _definitive(error: BaseException) -> bool:
+    """Erro 4xx (exceto 429): outro espelho responderia igual."""
+    response = getattr(error, "response", None)
+    return response is not None and 400 <= response.status_code < 500 and response.status_code != 429
+
+
+def _already_known(error: BaseException) -> bool:
+    """Broadcast recusado porque o espelho já tem a transação (mempool ou bloco)."""
+    response = getattr(error, "response", None)
+    return response is not None and "already" in response.text.lower()
+
+
+class MirroredBackend(Backend):
+    name = "esplora"
+
+    def __init__(self, urls: List[str], hedge_after: Optional[float] = None):
+        urls = list(dict.fromkeys(u.rstrip("/") for u in urls))
+        if not urls:
+            raise ValueError("Nenhum servidor Esplora configurado")
+        self.mirrors = [EsploraBackend(u) for u in urls]
+        self.hedge_after = hedge_after
+        self._health: Dict[str, dict] = {m.url: {"failures": 0, "down_until": 0.0, "wins": 0, "last_error": None}
+                                         for m in self.mirrors}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=FANOUT_WORKERS * len(self.mirrors),
+                                        thread_name_prefix="wowlie-mirror")
+        self.stats = {"reads": 0, "hedged": 0, "failovers": 0}
+
+    # saúde
+
+    def _record(self, mirror: EsploraBackend, error: Optional[BaseException]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            h = self._health[mirror.url]
+            if error is None or _definitive(error):
+                h["failures"], h["down_until"] = 0, 0.0
+                return
+            if now < h["down_until"]:
+                return          # requisição iniciada antes de o espelho sair da rotação
+            h["failures"] += 1
+            h["last_error"] = str(error)[:200]
+            if h["failures"] >= FAIL_LIMIT:
+                h["down_until"] = now + min(DOWN_MAX, DOWN_BASE * 2 ** (h["failures"] - FAIL_LIMIT))
+
+    def _score(self, mirror: EsploraBackend) -> float:
+        p50 = mirror.latency(50)
+        return (p50 if p50 is not None else HEDGE_DEFAULT) * (1 + self._health[mirror.url]["failures"])
+
+    def _ranked(self) -> List[EsploraBackend]:
+        """Espelhos no ar por pontuação, depois os fora da rotação (último recurso)."""
+        now = time.monotonic()
+        up = [m for m in self.mirrors if self._health[m.url]["down_until"] <= now]
+        down = sorted((m for m in self.mirrors if m not in up), key=lambda m: self._health[m.url]["down_until"])
+        return sorted(up, key=self._score) + down
+
+    def _hedge_delay(self, mirror: EsploraBackend) -> float:
+        if self.hedge_after is not None:
+            return self.hedge_after
+        p95 = mirror.latency(95, min_samples=MIN_SAMPLES)
+        return HEDGE_DEFAULT if p95 is None else min(HEDGE_MAX, max(HEDGE_MIN, p95))
+
+    def _submit(self, mirror: EsploraBackend, method: str, *args):
+        fut = self._pool.submit(getattr(mirror, method), *args)
+        fut.add_done_callback(lambda f: self._record(mirror, f.exception()))
+        return fut
+
+    def _read(self, method: str, *args):
+        """Primeira resposta entre os espelhos, com hedging pelo p95 e failover."""
+        ranked = self._ranked()
+        self.stats["reads"] += 1
+        pending = {self._submit(ranked[0], method, *args): ranked[0]}
+        launched, last_error = 1, None
+        while pending:
+            more = launched < len(ranked)
+            done, _ = wait(pending, timeout=self._hedge_delay(ranked[launched - 1]) if more else None,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                # o espelho passou do seu p95: a mesma consulta vai ao próximo
+                self.stats["hedged"] += 1
+                pending[self._submit(ranked[launched], method, *args)] = ranked[launched]
+                launched += 1
+                continue
+            for fut in done:
+                mirror = pending.pop(fut)
+                error = fut.exception()
+                if error is None:
+                    with self._lock:
+                        self._health[mirror.url]["wins"] += 1
+                    return fut.result()
+                if _definitive(error):
+                    raise error
+                last_error = error
+                if launched < len(ranked):
+                    self.stats["failovers"] += 1
+                    pending[self._submit(ranked[launched], method, *args)] = ranked[launched]
+                    launched += 1
+        raise last_error
+
+    # leituras
+
+    def get_address_info(self, address: str) -> dict:
+        return self._read("get_address_info", address)
+
+    def get_utxos(self, address: str) -> list:
+        return self._read("get_utxos", address)
+
+    def get_balance(self, address: str) -> dict:
+        return self._read("get_balance", address)
+
+    def iter_utxos(self, address: str) -> Iterator[dict]:
+        """Stream sem hedging: o melhor espelho, com failover enquanto nada foi entregue."""
+        last_error = None
+        for mirror in self._ranked():
+            delivered = False
+            try:
+                for u in mirror.iter_utxos(address):
+                    delivered = True
+                    yield u
+            except Exception as e:
+                self._record(mirror, e)
+                if delivered or _definitive(e):
+                    raise
+                last_error = e
+                continue
+            self._record(mirror, None)
+            return
+        raise last_error
+
+    def get_utxos_many(self, addresses: List[str]) -> Dict[str, list]:
+        return _fanout_or_raise(self.get_utxos, addresses)
+
+    def get_balances(self, addresses: List[str]) -> Dict[str, dict]:
+        return _fanout_or_raise(self.get_balance, addresses)
+
+    def get_address_txs(self, address: str, last_seen_txid: Optional[str] = None) -> list:
+        return self._read("get_address_txs", address, last_seen_txid)
+
+    def get_tx(self, txid: str) -> dict:
+        return self._read("get_tx", txid)
+
+    def get_tx_status(self, txid: str) -> Optional[dict]:
+        return self._read("get_tx_status", txid)
+
+    def get_tip_height(self) -> int:
+        return self._read("get_tip_height")
+
+    def get_fee_estimates(self) -> dict:
+        return self._read("get_fee_estimates")
+
+    def get_block_hash(self, height: int) -> str:
+        return self._read("get_block_hash", height)
+
+    def get_block_raw(self, block_hash: str) -> bytes:
+        return self._read("get_block_raw", block_hash)
+
+    # envio
+
+    def broadcast_tx(self, raw_tx_hex: str) -> str:
+        """Envia a todos os espelhos no ar; retorna o TXID do primeiro que aceitar."""
+        now = time.monotonic()
+        targets = [m for m in self.mirrors if self._health[m.url]["down_until"] <= now] or self.mirrors
+        futures = {self._submit(m, "broadcast_tx", raw_tx_hex): m for m in targets}
+        errors = []
+        for fut in as_completed(futures):
+            error = fut.exception()
+            if error is None:
+                return fut.result()
+            if _already_known(error):
+                return decode_raw_tx(bytes.fromhex(raw_tx_hex.strip()))["txid"]
+            errors.append(error)
+        # a recusa de um espelho (4xx) explica mais que uma falha de conexão
+        raise next((e for e in errors if _definitive(e)), errors[0])
+
+    def metrics(self) -> List[dict]:
+        now = time.monotonic()
+        rows = []
+        for m in self.mirrors:
+            h = self._health[m.url]
+            row = m.metrics()[0]
+            row.update(state="down" if h["down_until"] > now else "up", score_ms=self._score(m) * 1000,
+                       wins=h["wins"], last_error=h["last_error"])
+            rows.append(row)
+        return rows
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+
+
+def benchmark(reads: int = 200, latency: float = 0.03, tail_rate: float = 0.02, tail_latency: float = 1.0,
+              seed: int = 0) -> List[dict]:
+    """
+    Dois Esplora locais com a mesma chain e uma cauda de respostas lentas
+    (tail_rate delas demoram tail_latency a mais). Mede leituras de saldo
+    com um único servidor e com os dois espelhos, e depois com o primeiro
+    fora do ar.
+    """
+    import random
+    import socket
+
+    from btclib import b32
+
+    from wallet.esplora_standin import ChainState, EsploraStandIn, _percentile
+
+    rng = random.Random(seed)
+    addrs = [b32.address_from_witness(0, rng.randbytes(20), "testnet") for _ in range(50)]
+    state = ChainState()
+    state.synthetic_wallet(addrs, 2, seed=seed)
+    a = EsploraStandIn(state, latency=latency, jitter=latency / 3, tail_rate=tail_rate,
+                       tail_latency=tail_latency, seed=seed).start()
+    b = EsploraStandIn(state, latency=latency * 1.5, jitter=latency / 3, tail_rate=tail_rate,
+                       tail_latency=tail_latency, seed=seed + 1).start()
+
+    def run(name, backend, n):
+        lat, errors = [], 0
+        before = a.requests + b.requests
+        for i in range(n):
+            t = time.perf_counter()
+            try:
+                backend.get_balance(addrs[i % len(addrs)])
+                lat.append(time.perf_counter() - t)
+            except Exception:
+                errors += 1
+        backend.close()
+        return {"name": name, "ok": len(lat), "errors": errors, "requests": a.requests + b.requests - before,
+                "p50_ms": _percentile(lat, 50) * 1000, "p95_ms": _percentile(lat, 95) * 1000,
+                "p99_ms": _percentile(lat, 99) * 1000}
+
+    results = []
+    try:
+        # coalesce=False: cada leitura vai ao servidor, mesmo repetindo o endereço
+        results.append(run("um servidor", EsploraBackend(a.url, coalesce=False), reads))
+        mirrored = MirroredBackend([a.url, b.url])
+        for m in mirrored.mirrors:
+            m.flight = None
+        results.append(run("2 espelhos (hedging)", mirrored, reads))
+        # fora do ar: porta sem servidor (conexão recusada)
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            dead = f"http://127.0.0.1:{s.getsockname()[1]}"
+        results.append(run("um servidor, fora do ar", EsploraBackend(dead, coalesce=False), reads // 4))
+        results.append(run("2 espelhos, 1º fora do ar", MirroredBackend([dead, b.url]), reads // 4))
+    finally:
+        a.stop()
+        b.stop()
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    p = argparse.ArgumentParser(description="Benchmark de leituras com hedging entre espelhos Esplora")
+    p.add_argument("--bench", action="store_true")
+    p.add_argument("--reads", type=int, default=200)
+    p.add_argument("--latency-ms", type=float, default=30.0)
+    p.add_argument("--tail-rate", type=float, default=0.02, help="fração de respostas lentas em cada servidor")
+    p.add_argument("--tail-ms", type=float, default=1000.0, help="atraso extra das respostas lentas")
+    args = p.parse_args()
+    if not args.bench:
+        p.print_help()
+    else:
+        print(f"{args.reads} leituras, latência {args.latency_ms:.0f} ms, {args.tail_rate:.0%} das respostas "
+              f"com +{args.tail_ms:.0f} ms")
+        print(f"{'configuração':<28} {'ok':>5} {'erros':>6} {'reqs':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for r in benchmark(args.reads, args.latency_ms / 1000, args.tail_rate, args.tail_ms / 1000):
+            print(f"{r['name']:<28} {r['ok']:>5} {r['errors']:>6} {r['requests']:>6} "
+                  f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}")
@@ -1,31 +1,502 @@
+"""
+Acesso à rede: saldos, UTXOs, histórico, taxas e broadcast.
+
+As funções deste módulo delegam para o backend ativo:
+  - esplora (padrão): API REST da Blockstream, uma requisição HTTP por
+    endereço e tipo de consulta; com vários servidores em "esplora": {"urls":
+    [...]}, leituras com hedging e broadcast em todos (wallet/mirrors.py)
+  - electrum: protocolo Electrum numa conexão TCP persistente
+    (wallet/electrum.py), com consultas de centenas de endereços num único
+    lote e notificações de mudança (subscribe) no lugar de polling
+  - bitcoind: JSON-RPC de um nó Bitcoin Core próprio (wallet/bitcoind.py),
+    com lotes, scantxoutset e testmempoolaccept
+
+Todos devolvem os dados no formato da API Esplora, então o resto da carteira
+não depende do backend. Seleção: WOWLIE_BACKEND=esplora|electrum|bitcoind ou a chave
+"backend" em ~/.wowlie/config.json, ex.:
+    {"backend": "electrum", "electrum": {"host": "127.0.0.1", "port": 50001, "ssl": false}}
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import codecs
+import json
+import os
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from wallet.cache import update_utxo_cache, update_utxo_cache_many
+from wallet.limiter import AdaptiveLimiter, parse_retry_after
+from wallet.singleflight import SingleFlight
+from wallet.utils import load_config
 
 API = "https://blockstream.info/testnet/api"
+FANOUT_WORKERS = 32    # threads das consultas em paralelo; quantas ficam em voo é o limitador que decide
+LATENCY_WINDOW = 200   # latências recentes guardadas por servidor (p50/p95 das métricas e do hedging)
+STREAM_CHUNK = 64 * 1024
+CACHE_MAX_UTXOS = 5000   # endereços com mais UTXOs que isso ficam fora do utxo_cache.json
+
+
+def new_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=FANOUT_WORKERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# uma sessão HTTP por processo: reaproveita conexões (keep-alive/TLS) entre consultas
+_session = new_session()
+
+def get_session() -> requests.Session:
+    return _session
+
+def use_session(session: requests.Session) -> None:
+    """Troca a sessão HTTP usada pelo módulo (ex.: a compartilhada pelo Streamlit)."""
+    global _session
+    _session = session
+
+
+def fanout(fn: Callable, items: Iterable, workers: Optional[int] = None) -> Iterator[Tuple[object, object]]:
+    """
+    Aplica fn a cada item em paralelo e gera (item, resultado ou exceção) na
+    ordem em que ficam prontos. O número de threads é só um teto: no esplora
+    o limitador adaptativo do backend decide quantas requisições ficam em voo.
+    """
+    items = list(items)
+    if not items:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(workers or FANOUT_WORKERS, len(items)))) as pool:
+        futures = {pool.submit(fn, item): item for item in items}
+        for fut in as_completed(futures):
+            try:
+                yield futures[fut], fut.result()
+            except Exception as e:
+                yield futures[fut], e
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator:
+    """
+    Elementos de um array JSON lido em pedaços (resposta HTTP em stream), cada
+    um decodificado assim que chega inteiro: a memória fica em um pedaço e um
+    elemento, não no array.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, opened = "", 0, False
+    for chunk in chunks:
+        buf = buf[pos:] + utf8.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if not opened:
+                if buf[pos] != "[":
+                    raise ValueError("Resposta não é um array JSON")
+                opened, pos = True, pos + 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break       # elemento incompleto: espera o próximo pedaço
+            if end >= len(buf):
+                break       # pode estar cortado (ex.: número no fim do pedaço)
+            yield item
+            pos = end
+    raise ValueError("Array JSON incompleto na resposta")
+
+
+def _fanout_or_raise(fn: Callable, items: Iterable) -> dict:
+    results = {}
+    for item, result in fanout(fn, items):
+        if isinstance(result, Exception):
+            raise result
+        results[item] = result
+    return results
+
+
+class Backend:
+    """
+    Interface dos backends. As versões *_many têm implementação padrão
+    endereço a endereço; backends com consulta em lote as sobrescrevem.
+    """
+    name = "base"
+    batched = False     # True se get_*_many custam uma única ida e volta
+
+    def get_utxos(self, address: str) -> list:
+        raise NotImplementedError
+
+    def get_balance(self, address: str) -> dict:
+        raise NotImplementedError
+
+    def get_address_txs(self, address: str, last_seen_txid: Optional[str] = None) -> list:
+        raise NotImplementedError
+
+    def get_tx(self, txid: str) -> dict:
+        raise NotImplementedError
+
+    def get_tip_height(self) -> int:
+        raise NotImplementedError
+
+    def get_fee_estimates(self) -> dict:
+        raise NotImplementedError
+
+    def broadcast_tx(self, raw_tx_hex: str) -> str:
+        raise NotImplementedError
+
+    def get_tx_status(self, txid: str) -> Optional[dict]:
+        """{"confirmed", "block_height", ...} da transação, ou None se a rede não a conhece."""
+        return self.get_tx(txid).get("status", {})
+
+    def get_tx_statuses(self, txids: List[str]) -> Dict[str, Optional[dict]]:
+        return {t: self.get_tx_status(t) for t in txids}
+
+    def get_block_hash(self, height: int) -> str:
+        raise NotImplementedError
+
+    def get_block_raw(self, block_hash: str) -> bytes:
+        """Bloco serializado inteiro (cabeçalho + transações)."""
+        raise NotImplementedError
+
+    def get_utxos_many(self, addresses: List[str]) -> Dict[str, list]:
+        return {a: self.get_utxos(a) for a in addresses}
+
+    def iter_utxos(self, address: str) -> Iterator[dict]:
+        """UTXOs do endereço à medida que chegam; por padrão, a lista de get_utxos."""
+        return iter(self.get_utxos(address))
+
+    def get_balances(self, addresses: List[str]) -> Dict[str, dict]:
+        return {a: self.get_balance(a) for a in addresses}
+
+    def subscribe(self, addresses: List[str], callback: Callable[[str, Optional[str]], None]) -> bool:
+        """
+        Chama callback(endereço, status) quando o histórico de um endereço
+        mudar. Retorna False se o backend não tem notificações (use polling).
+        """
+        return False
+
+    def unsubscribe(self, callback: Callable[[str, Optional[str]], None]) -> None:
+        pass
+
+    def metrics(self) -> List[dict]:
+        """Métricas por servidor (latência, erros, saúde); vazio se o backend não as coleta."""
+        return []
+
+    def close(self) -> None:
+        pass
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class EsploraBackend(Backend):
+    """
+    API REST Esplora (Blockstream ou instância própria). Todas as requisições
+    passam pelo limitador adaptativo (wallet/limiter.py): o número em voo se
+    ajusta a 429/Retry-After e à latência, e respostas 429/503 são repetidas
+    depois da pausa pedida pelo servidor. GETs idênticos simultâneos viram uma
+    única requisição (wallet/singleflight.py), com cache negativo curto para
+    erros de conexão e de servidor.
+    """
+    name = "esplora"
+
+    def __init__(self, url: str = API, limiter: Optional[AdaptiveLimiter] = None, max_retries: int = 3,
+                 coalesce: bool = True, error_ttl: float = 2.0):
+        self.url = url.rstrip("/")
+        self.limiter = limiter or AdaptiveLimiter()
+        self.max_retries = max_retries
+        self.flight = SingleFlight(error_ttl) if coalesce else None
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {"requests": 0, "errors": 0, "throttled": 0}
+
+    def latency(self, pct: float, min_samples: int = 1) -> Optional[float]:
+        """Percentil da latência das respostas recentes (segundos), ou None com menos de min_samples."""
+        samples = list(self._latencies)
+        return _percentile(samples, pct) if len(samples) >= min_samples else None
+
+    def _timed(self, method: str, path: str, timeout: float, **kwargs) -> requests.Response:
+        self.counters["requests"] += 1
+        start = time.monotonic()
+        try:
+            r = _session.request(method, self.url + path, timeout=timeout, **kwargs)
+        except requests.RequestException:
+            self.counters["errors"] += 1
+            raise
+        self._latencies.append(time.monotonic() - start)
+        if r.status_code in (429, 503):
+            self.counters["throttled"] += 1
+        elif r.status_code >= 500:
+            self.counters["errors"] += 1
+        return r
+
+    def _request(self, method: str, path: str, timeout: float = 20, **kwargs) -> requests.Response:
+        for attempt in range(self.max_retries + 1):
+            with self.limiter.slot() as done:
+                r = self._timed(method, path, timeout, **kwargs)
+                if r.status_code in (429, 503):
+                    done(throttled=True, retry_after=parse_retry_after(r.headers.get("Retry-After")))
+                    if attempt < self.max_retries:
+                        r.close()
+                        continue
+            return r
+
+    def _fetch(self, path: str, timeout: float = 20) -> requests.Response:
+        """
+        GET compartilhado entre chamadas simultâneas do mesmo path. 429 e 5xx
+        (depois das repetições) viram exceção e entram no cache negativo; os
+        demais status voltam na resposta para cada chamador tratar.
+        """
+        def call():
+            r = self._request("GET", path, timeout)
+            if r.status_code == 429 or r.status_code >= 500:
+                r.raise_for_status()
+            return r
+
+        return self.flight.do(path, call) if self.flight else call()
+
+    def _get(self, path: str, timeout: float = 20) -> requests.Response:
+        r = self._fetch(path, timeout)
+        r.raise_for_status()
+        return r
+
+    def get_address_info(self, address: str) -> dict:
+        return self._get(f"/address/{address}").json()
+
+    def get_utxos(self, address: str) -> list:
+        return self._get(f"/address/{address}/utxo").json()
+
+    def get_balance(self, address: str) -> dict:
+        info = self.get_address_info(address)
+        chain = info.get("chain_stats", {})
+        mem = info.get("mempool_stats", {})
+        confirmed = int(chain.get("funded_txo_sum", 0)) - int(chain.get("spent_txo_sum", 0))
+        unconfirmed = int(mem.get("funded_txo_sum", 0)) - int(mem.get("spent_txo_sum", 0))
+        return {
+            "confirmed": confirmed,
+            "unconfirmed": unconfirmed,
+            "total": confirmed + unconfirmed,
+        }
+
+    def get_utxos_many(self, addresses: List[str]) -> Dict[str, list]:
+        return _fanout_or_raise(self.get_utxos, addresses)
+
+    def iter_utxos(self, address: str) -> Iterator[dict]:
+        # stream: o limitador só segura a vaga até os cabeçalhos; o corpo é lido aos pedaços
+        r = self._request("GET", f"/address/{address}/utxo", stream=True)
+        with r:
+            r.raise_for_status()
+            yield from iter_json_array(r.iter_content(STREAM_CHUNK))
+
+    def get_balances(self, addresses: List[str]) -> Dict[str, dict]:
+        return _fanout_or_raise(self.get_balance, addresses)
+
+    def get_address_txs(self, address: str, last_seen_txid: Optional[str] = None) -> list:
+        path = f"/address/{address}/txs"
+        if last_seen_txid:
+            path += f"/chain/{last_seen_txid}"
+        return self._get(path).json()
+
+    def get_tx(self, txid: str) -> dict:
+        return self._get(f"/tx/{txid}").json()
+
+    def get_tx_status(self, txid: str) -> Optional[dict]:
+        r = self._fetch(f"/tx/{txid}/status")
+        if r.status_code in (400, 404):
+            return None
+        r.raise_for_status()
+        return r.json()
+
+    def get_tip_height(self) -> int:
+        return int(self._get("/blocks/tip/height").text)
+
+    def get_fee_estimates(self) -> dict:
+        return self._get("/fee-estimates").json()
+
+    def broadcast_tx(self, raw_tx_hex: str) -> str:
+        # repetir o POST é seguro: a mesma transação não é aceita duas vezes
+        r = self._request("POST", "/tx", timeout=30, data=raw_tx_hex, headers={"Content-Type": "text/plain"})
+        r.raise_for_status()
+        return r.text.strip()
+
+    def get_block_hash(self, height: int) -> str:
+        return self._get(f"/block-height/{height}").text.strip()
+
+    def get_block_raw(self, block_hash: str) -> bytes:
+        return self._get(f"/block/{block_hash}/raw", timeout=60).content
+
+    def metrics(self) -> List[dict]:
+        p50, p95 = self.latency(50), self.latency(95)
+        return [{"url": self.url, **self.counters,
+                 "p50_ms": None if p50 is None else p50 * 1000, "p95_ms": None if p95 is None else p95 * 1000,
+                 "limit": round(self.limiter.limit, 1),
+                 "coalesced": self.flight.stats["shared"] if self.flight else 0}]
+
+
+BACKENDS = ("esplora", "electrum", "bitcoind")
+
+def make_backend(name: str, config: Optional[dict] = None) -> Backend:
+    """Cria um backend pelo nome, com a seção correspondente do config.json."""
+    config = config or {}
+    if name == "esplora":
+        section = config.get("esplora", {})
+        env = os.environ.get("WOWLIE_ESPLORA_URL")
+        urls = env.split(",") if env else section.get("urls") or [section.get("url", API)]
+        urls = [u.strip() for u in urls if u.strip()]
+        if len(urls) > 1:
+            from wallet.mirrors import MirroredBackend
+            hedge_ms = section.get("hedge_after_ms")
+            return MirroredBackend(urls, hedge_after=None if hedge_ms is None else hedge_ms / 1000)
+        return EsploraBackend(urls[0] if urls else API)
+    if name == "electrum":
+        from wallet.electrum import ElectrumBackend
+        return ElectrumBackend.from_config(config.get("electrum", {}))
+    if name == "bitcoind":
+        from wallet.bitcoind import BitcoindBackend
+        return BitcoindBackend.from_config(config.get("bitcoind", {}))
+    raise RuntimeError(f"Backend de rede '{name}' desconhecido (opções: {', '.join(BACKENDS)})")
+
+
+_backend: Optional[Backend] = None
+_backend_lock = threading.Lock()
+
+def get_backend() -> Backend:
+    """
+    Backend ativo (criado no primeiro uso). WOWLIE_BACKEND tem prioridade
+    sobre o config.json.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            config = load_config()
+            name = os.environ.get("WOWLIE_BACKEND") or config.get("backend", "esplora")
+            _backend = make_backend(name, config)
+        return _backend
+
+def use_backend(backend) -> None:
+    """Troca o backend ativo: um nome de BACKENDS ou uma instância (útil para testes e benchmarks)."""
+    global _backend
+    if isinstance(backend, str):
+        backend = make_backend(backend, load_config())
+    with _backend_lock:
+        old, _backend = _backend, backend
+    if old is not None and old is not backend:
+        old.close()
+
 
 def get_address_info(address: str) -> dict:
-    r = requests.get(f"{API}/address/{address}", timeout=20)
-    r.raise_for_status()
-    return r.json()
+    backend = get_backend()
+    if not hasattr(backend, "get_address_info"):
+        raise RuntimeError(f"get_address_info não é suportado pelo backend {backend.name}")
+    return backend.get_address_info(address)
 
 def get_utxos(address: str) -> list:
-    r = requests.get(f"{API}/address/{address}/utxo", timeout=20)
-    r.raise_for_status()
-    return r.json()
+    utxos = get_backend().get_utxos(address)
+    update_utxo_cache(address, utxos)
+    return utxos
+
+def get_utxos_many(addresses: List[str]) -> Dict[str, list]:
+    """{endereço: UTXOs}; no backend electrum é uma única ida e volta."""
+    by_address = get_backend().get_utxos_many(list(addresses))
+    update_utxo_cache_many(by_address)
+    return by_address
+
+def _caching(address: str, utxos: Iterable[dict], kept: Dict[str, Optional[list]]) -> Iterator[dict]:
+    """Repassa os UTXOs e guarda a lista em kept[address] (None se passar de CACHE_MAX_UTXOS)."""
+    keep = []
+    for u in utxos:
+        if keep is not None:
+            keep.append(u)
+            if len(keep) > CACHE_MAX_UTXOS:
+                keep = None
+        yield u
+    kept[address] = keep
+
+def _store_kept(kept: Dict[str, Optional[list]]) -> None:
+    update_utxo_cache_many({a: us for a, us in kept.items() if us is not None},
+                           forget=[a for a, us in kept.items() if us is None])
+
+def iter_utxos(address: str) -> Iterator[dict]:
+    """
+    UTXOs do endereço à medida que chegam (no esplora o array JSON é lido do
+    stream, sem montar a lista). O cache é atualizado no fim, se o endereço
+    tiver até CACHE_MAX_UTXOS UTXOs.
+    """
+    kept = {}
+    yield from _caching(address, get_backend().iter_utxos(address), kept)
+    _store_kept(kept)
+
+def stream_utxos_many(addresses: List[str], consume: Callable[[str, Iterator[dict]], object]) -> None:
+    """
+    Entrega a consume(endereço, iterador de UTXOs) o stream de cada endereço,
+    em paralelo (fanout; consume precisa aceitar várias threads). Nos
+    backends em lote é uma única ida e volta, como get_utxos_many.
+    """
+    if get_backend().batched:
+        for address, utxos in get_utxos_many(addresses).items():
+            consume(address, iter(utxos))
+        return
+    kept = {}
+    for _, error in fanout(lambda a: consume(a, _caching(a, get_backend().iter_utxos(a), kept)), addresses):
+        if isinstance(error, Exception):
+            raise error
+    _store_kept(kept)
 
 def get_balance(address: str) -> dict:
-    info = get_address_info(address)
-    chain = info.get("chain_stats", {})
-    mem = info.get("mempool_stats", {})
-    confirmed = int(chain.get("funded_txo_sum", 0)) - int(chain.get("spent_txo_sum", 0))
-    unconfirmed = int(mem.get("funded_txo_sum", 0)) - int(mem.get("spent_txo_sum", 0))
-    return {
-        "confirmed": confirmed,
-        "unconfirmed": unconfirmed,
-        "total": confirmed + unconfirmed,
-    }
+    return get_backend().get_balance(address)
+
+def get_balances(addresses: List[str]) -> Dict[str, dict]:
+    """{endereço: {"confirmed", "unconfirmed", "total"}} de vários endereços."""
+    return get_backend().get_balances(list(addresses))
+
+def get_address_txs(address: str, last_seen_txid: str = None) -> list:
+    """
+    Sem last_seen_txid: até 50 transações do mempool + as 25 confirmadas mais
+    recentes. Com last_seen_txid: as 25 confirmadas seguintes (mais antigas).
+    """
+    return get_backend().get_address_txs(address, last_seen_txid)
+
+def get_tx(txid: str) -> dict:
+    return get_backend().get_tx(txid)
+
+def get_tx_status(txid: str) -> Optional[dict]:
+    return get_backend().get_tx_status(txid)
+
+def get_tx_statuses(txids: List[str]) -> Dict[str, Optional[dict]]:
+    """{txid: status ou None (desconhecida)}; nos backends em lote é uma única ida e volta."""
+    return get_backend().get_tx_statuses(list(txids))
+
+def get_tip_height() -> int:
+    return get_backend().get_tip_height()
+
+def get_fee_estimates() -> dict:
+    return get_backend().get_fee_estimates()
 
 def broadcast_tx(raw_tx_hex: str) -> str:
-    r = requests.post(f"{API}/tx", data=raw_tx_hex, timeout=30,
-                      headers={"Content-Type": "text/plain"})
-    r.raise_for_status()
-    return r.text.strip()  
+    return get_backend().broadcast_tx(raw_tx_hex)
+
+def get_block_hash(height: int) -> str:
+    return get_backend().get_block_hash(height)
+
+def get_block_raw(block_hash: str) -> bytes:
+    return get_backend().get_block_raw(block_hash)
+
+def subscribe(addresses: List[str], callback: Callable[[str, Optional[str]], None]) -> bool:
+    """Notificações de mudança por endereço; False se o backend só suporta polling."""
+    return get_backend().subscribe(list(addresses), callback)
+
+def unsubscribe(callback: Callable[[str, Optional[str]], None]) -> None:
+    get_backend().unsubscribe(callback)
+
+def metrics() -> List[dict]:
+    """Latência, erros e saúde de cada servidor do backend ativo (neste processo)."""
+    return get_backend().metrics()
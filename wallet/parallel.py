@@ -0,0 +1,130 @@
+"""
+Assinatura ECDSA paralela num pool de processos.
+
+Depois que os sighashes de uma transação estão calculados, as assinaturas dos
+inputs são independentes entre si. Aqui elas são distribuídas entre processos:
+as chaves privadas trafegam apenas por um bloco de memória compartilhada
+(multiprocessing.shared_memory), que é zeroizado e removido ao final. Os
+workers recebem só (índice, sighash, slot da chave).
+
+O nonce é determinístico (RFC6979), então o resultado é idêntico ao da
+assinatura serial, independente do número de processos.
+
+Benchmark de escalonamento:
+    python -m wallet.parallel --inputs 500 --workers 1 2 4 8
+"""
+from typing import List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import os
+import time
+
+from wallet import ec
+
+KEY_SIZE = 32
+
+
+def _sign_chunk(shm_name: str, jobs: List[Tuple[int, bytes, int]],
+                low_r: bool = False) -> List[Tuple[int, bytes]]:
+    """
+    Executado no worker: lê cada chave do slot na memória compartilhada e assina.
+    """
+    sign = ec.sign_low_r if low_r else ec.sign
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = []
+        for idx, digest, slot in jobs:
+            off = slot * KEY_SIZE
+            out.append((idx, sign(digest, bytes(shm.buf[off:off + KEY_SIZE]))))
+        return out
+    finally:
+        shm.close()
+
+
+def sign_digests_parallel(digests: List[bytes], key_ids: List[int], keys: List[bytearray],
+                          workers: Optional[int] = None, low_r: bool = False) -> List[bytes]:
+    """
+    Assina digests[i] com keys[key_ids[i]] num pool de processos.
+    Retorna as assinaturas DER (sem o byte de sighash) na mesma ordem de digests.
+    low_r=True usa ec.sign_low_r (assinaturas com r < 2^255).
+    """
+    if len(digests) != len(key_ids):
+        raise ValueError("digests e key_ids devem ter o mesmo tamanho")
+    if not digests:
+        return []
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(digests)))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(keys) * KEY_SIZE))
+    try:
+        for slot, prv in enumerate(keys):
+            if len(prv) != KEY_SIZE:
+                raise ValueError("Chave privada deve ter 32 bytes")
+            shm.buf[slot * KEY_SIZE:(slot + 1) * KEY_SIZE] = prv
+
+        jobs = [(i, d, k) for i, (d, k) in enumerate(zip(digests, key_ids))]
+        # um bloco contíguo por worker: menos mensagens entre processos
+        size = (len(jobs) + workers - 1) // workers
+        chunks = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+
+        sigs: List[Optional[bytes]] = [None] * len(digests)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(_sign_chunk, [shm.name] * len(chunks), chunks,
+                                   [low_r] * len(chunks)):
+                for idx, sig in result:
+                    sigs[idx] = sig
+        return sigs
+    finally:
+        shm.buf[:] = b"\x00" * shm.size
+        shm.close()
+        shm.unlink()
+
+
+def benchmark(n_inputs: int = 500, worker_counts: Tuple[int, ...] = (1, 2, 4, 8),
+              n_keys: int = 20) -> List[dict]:
+    """
+    Mede o tempo de assinar n_inputs digests com diferentes números de processos.
+    workers=1 é a assinatura serial (sem pool), usada como referência; todas as
+    configurações precisam produzir as mesmas assinaturas. Usa o backend
+    ativo de wallet.ec.
+    """
+    keys = [bytearray(os.urandom(KEY_SIZE)) for _ in range(n_keys)]
+    digests = [os.urandom(32) for _ in range(n_inputs)]
+    key_ids = [i % n_keys for i in range(n_inputs)]
+
+    t0 = time.perf_counter()
+    reference = [ec.sign(d, bytes(keys[k])) for d, k in zip(digests, key_ids)]
+    serial = time.perf_counter() - t0
+
+    results = []
+    for w in worker_counts:
+        if w <= 1:
+            elapsed, same = serial, True
+        else:
+            t0 = time.perf_counter()
+            sigs = sign_digests_parallel(digests, key_ids, keys, w)
+            elapsed = time.perf_counter() - t0
+            same = sigs == reference
+        results.append({
+            "workers": w,
+            "seconds": elapsed,
+            "sigs_per_sec": n_inputs / elapsed if elapsed else float("inf"),
+            "speedup": serial / elapsed if elapsed else float("inf"),
+            "identical": same,
+        })
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    p = argparse.ArgumentParser(description="Benchmark de assinatura paralela")
+    p.add_argument("--inputs", type=int, default=500, help="Número de inputs a assinar")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Números de processos a testar")
+    args = p.parse_args()
+
+    print(f"Assinando {args.inputs} inputs com {ec.get_backend().name} (CPUs disponíveis: {os.cpu_count()})")
+    print(f"{'workers':>8} {'segundos':>10} {'sigs/s':>10} {'speedup':>8} {'idêntico':>9}")
+    for r in benchmark(args.inputs, tuple(args.workers)):
+        print(f"{r['workers']:>8} {r['seconds']:>10.3f} {r['sigs_per_sec']:>10.0f} "
+              f"{r['speedup']:>8.2f} {str(r['identical']):>9}")
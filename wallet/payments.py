@@ -0,0 +1,385 @@
+"""
+Acompanhamento de pagamentos de pedidos (um endereço de recebimento por fatura).
+
+PaymentWatcher mantém em memória o índice endereço -> fatura e consulta só
+as faturas em aberto, cada endereço no seu próprio ritmo:
+  - fatura nova ou que acabou de mudar: min_interval
+  - sem novidade: o intervalo dobra a cada consulta, até max_interval
+  - paga, esperando confirmações: paid_interval (escala de blocos)
+  - backend com notificações (electrum): o endereço é consultado quando o
+    servidor avisa, e o polling vira só um fallback espaçado (max_interval)
+
+Cada txid visto é registrado na fatura e processado uma única vez (consultas
+seguintes só atualizam a altura do bloco). Mudanças de estado viram eventos:
+  - "underpaid": recebeu menos que o valor (a cada novo pagamento parcial)
+  - "paid": recebeu o valor (ainda sem as confirmações exigidas)
+  - "confirmed": o valor tem confirmations confirmações; a fatura sai do índice
+  - "dropped": um pagamento sumiu do mempool (RBF/expirou) e a fatura voltou atrás
+  - "expired": passou de expires_at sem ser paga; a fatura sai do índice
+entregues a um callback (on_event) e/ou anexados a um arquivo JSON lines.
+
+O estado (faturas, txids vistos, status) fica em ~/.wowlie/payments.json,
+então reiniciar o serviço não repete eventos já emitidos.
+"""
+from typing import Callable, Dict, Iterable, List, Optional
+import csv
+import heapq
+import json
+import os
+import threading
+import time
+
+from wallet import network
+from wallet.history import decode_tx
+from wallet.utils import WALLET_DIR, ensure_dirs
+
+PAYMENTS_FILE = WALLET_DIR / "payments.json"
+
+OPEN_STATUSES = ("pending", "underpaid", "paid")
+
+
+def load_invoices(path: str) -> List[dict]:
+    """
+    Faturas de um arquivo JSON (lista), JSON lines ou CSV, cada uma com
+    id, address, amount (sats) e opcionalmente confirmations e expires_at (epoch).
+    """
+    with open(path, newline="") as f:
+        if str(path).lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            text = f.read().strip()
+            if text.startswith("["):
+                rows = json.loads(text)
+            else:
+                rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    invoices = []
+    for n, row in enumerate(rows, 1):
+        try:
+            inv = {"id": str(row["id"]), "address": row["address"].strip(), "amount": int(row["amount"])}
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Fatura inválida na linha {n} de {path}: {e}")
+        if row.get("confirmations") not in (None, ""):
+            inv["confirmations"] = int(row["confirmations"])
+        if row.get("expires_at") not in (None, ""):
+            inv["expires_at"] = float(row["expires_at"])
+        invoices.append(inv)
+    return invoices
+
+
+class JsonLinesSink:
+    """Anexa cada evento como uma linha JSON (flush a cada evento); path "-" = saída padrão."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._f = None if path == "-" else open(path, "a")
+
+    def __call__(self, event: dict) -> None:
+        import sys
+        line = json.dumps(event, sort_keys=True) + "\n"
+        with self._lock:
+            out = self._f or sys.stdout
+            out.write(line)
+            out.flush()
+
+    def close(self) -> None:
+        if self._f:
+            self._f.close()
+
+
+class PaymentWatcher:
+    def __init__(self, confirmations: int = 1, on_event: Optional[Callable[[dict], None]] = None,
+                 state_file=PAYMENTS_FILE, min_interval: float = 5, max_interval: float = 300,
+                 paid_interval: float = 60, tip_interval: float = 30, workers: Optional[int] = None,
+                 tolerance: int = 0):
+        self.confirmations = confirmations
+        self.on_event = on_event
+        self.state_file = state_file
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.paid_interval = paid_interval
+        self.tip_interval = tip_interval
+        self.workers = workers
+        self.tolerance = tolerance            # sats de diferença aceitos como "pago"
+        self.invoices: Dict[str, dict] = {}   # id -> fatura (com status e txs vistos)
+        self._by_address: Dict[str, dict] = {}
+        self._interval: Dict[str, float] = {}
+        self._due: List[tuple] = []           # heap (quando, endereço); vale só o de _next
+        self._next: Dict[str, float] = {}
+        self._dirty = set()
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._tip: Optional[int] = None
+        self._tip_at = 0.0
+        self._subscribed = False
+        self.stats = {"polls": 0, "errors": 0, "events": 0}
+        self._load_state()
+
+    # estado
+
+    def _load_state(self) -> None:
+        try:
+            with open(self.state_file) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            data = {}
+        for inv in data.get("invoices", {}).values():
+            self.invoices[inv["id"]] = inv
+            if inv["status"] in OPEN_STATUSES:
+                self._index(inv)
+
+    def _save_state(self) -> None:
+        ensure_dirs()
+        tmp = str(self.state_file) + ".tmp"
+        with self._lock:
+            data = json.dumps({"invoices": self.invoices})
+        with open(tmp, "w") as f:
+            f.write(data)
+        os.replace(tmp, self.state_file)
+
+    def _index(self, inv: dict) -> None:
+        self._by_address[inv["address"]] = inv
+        self._interval[inv["address"]] = self.min_interval
+        self._push(inv["address"], time.time())
+
+    def _push(self, address: str, when: float) -> None:
+        self._next[address] = when
+        heapq.heappush(self._due, (when, address))
+
+    def add_invoices(self, invoices: Iterable[dict]) -> int:
+        """Passa a acompanhar as faturas ainda não conhecidas; retorna quantas eram novas."""
+        added = []
+        with self._lock:
+            for item in invoices:
+                if item["id"] in self.invoices:
+                    continue
+                other = self._by_address.get(item["address"])
+                if other is not None:
+                    raise ValueError(f"Endereço {item['address']} já está na fatura {other['id']} "
+                                     f"(use um endereço por pedido)")
+                inv = {"id": item["id"], "address": item["address"], "amount": int(item["amount"]),
+                       "confirmations": int(item.get("confirmations", self.confirmations)),
+                       "expires_at": item.get("expires_at"), "created_at": time.time(),
+                       "status": "pending", "received": 0, "received_confirmed": 0, "txs": {}}
+                self.invoices[inv["id"]] = inv
+                self._index(inv)
+                added.append(inv["address"])
+        if added:
+            if self._subscribed:
+                self._subscribe(added)
+            self._save_state()
+            self._wake.set()
+        return len(added)
+
+    def outstanding(self) -> List[dict]:
+        with self._lock:
+            return [dict(inv) for inv in self._by_address.values()]
+
+    # notificações do backend
+
+    def _subscribe(self, addresses: List[str]) -> None:
+        try:
+            self._subscribed = network.subscribe(addresses, self._on_change) or self._subscribed
+        except Exception:
+            pass
+
+    def _on_change(self, address: str, status: Optional[str]) -> None:
+        with self._lock:
+            if address in self._by_address:
+                self._dirty.add(address)
+        self._wake.set()
+
+    # ciclo
+
+    def _tip_height(self) -> Optional[int]:
+        if self._tip is None or time.time() - self._tip_at > self.tip_interval:
+            try:
+                self._tip = network.get_tip_height()
+                self._tip_at = time.time()
+            except Exception:
+                self.stats["errors"] += 1
+        return self._tip
+
+    def _take_due(self) -> List[str]:
+        now = time.time()
+        with self._lock:
+            due, self._dirty = set(self._dirty), set()
+            while self._due and self._due[0][0] <= now:
+                when, addr = heapq.heappop(self._due)
+                if self._next.get(addr) == when:
+                    due.add(addr)
+            return [a for a in due if a in self._by_address]
+
+    def _schedule(self, address: str, interval: float, notified: bool = True) -> None:
+        """notified=False: mudanças esperadas não geram aviso do servidor (novas confirmações)."""
+        with self._lock:
+            if address not in self._by_address:
+                return
+            self._interval[address] = interval
+            if self._subscribed and notified:
+                interval = max(interval, self.max_interval)
+            self._push(address, time.time() + interval)
+
+    def step(self) -> float:
+        """
+        Uma rodada: consulta os endereços vencidos (ou avisados), atualiza as
+        faturas e emite eventos. Retorna em quantos segundos vence o próximo.
+        """
+        addresses = self._take_due()
+        self._expire()
+        changed = False
+        if addresses:
+            results = list(network.fanout(self._fetch, addresses, self.workers))
+            waiting = any(self._by_address.get(a, {}).get("status") == "paid" for a, _ in results)
+            tip = self._tip_height() if waiting or any(txs for _, txs in results) else self._tip
+            for addr, txs in results:
+                with self._lock:
+                    inv = self._by_address.get(addr)
+                if inv is None:
+                    continue
+                if txs is None:
+                    self._schedule(addr, min(self._interval[addr] * 2, self.max_interval))
+                    continue
+                updated = self._update(inv, txs, tip)
+                changed = changed or updated
+                if inv["status"] == "paid":
+                    self._schedule(addr, self.paid_interval, notified=inv["confirmations"] <= 1)
+                elif updated:
+                    self._schedule(addr, self.min_interval)
+                else:
+                    self._schedule(addr, min(self._interval[addr] * 2, self.max_interval))
+        if changed:
+            self._save_state()
+        with self._lock:
+            if self._dirty:
+                return 0.0
+            while self._due and self._next.get(self._due[0][1]) != self._due[0][0]:
+                heapq.heappop(self._due)
+            return max(0.0, self._due[0][0] - time.time()) if self._due else self.max_interval
+
+    def _fetch(self, address: str) -> Optional[list]:
+        self.stats["polls"] += 1
+        try:
+            return network.get_address_txs(address)
+        except Exception:
+            self.stats["errors"] += 1
+            return None
+
+    def _update(self, inv: dict, txs: list, tip: Optional[int]) -> bool:
+        """Aplica a lista de transações do endereço à fatura; True se algo mudou."""
+        current = {}
+        for tx in txs:
+            d = decode_tx(tx, inv["address"])
+            if d["received"] > 0:
+                current[d["txid"]] = {"value": d["received"],
+                                      "height": d["block_height"] if d["confirmed"] else None}
+
+        seen = inv["txs"]
+        new = [t for t in current if t not in seen]
+        # a listagem traz todo o mempool: pagamento não confirmado que sumiu foi descartado
+        dropped = [t for t, e in seen.items() if t not in current and e["height"] is None]
+        heights_changed = any(current[t]["height"] != e["height"] for t, e in seen.items() if t in current)
+        for t in dropped:
+            del seen[t]
+        for t in new:
+            seen[t] = current[t]
+        for t, e in current.items():
+            seen[t]["height"] = e["height"]
+        return self._evaluate(inv, tip, new, dropped) or bool(new or dropped or heights_changed)
+
+    def _confirmations(self, height: Optional[int], tip: Optional[int]) -> int:
+        if height is None or tip is None:
+            return 0
+        return max(0, tip - height + 1)
+
+    def _evaluate(self, inv: dict, tip: Optional[int], new: List[str] = (), dropped: List[str] = ()) -> bool:
+        txs = inv["txs"]
+        received = sum(e["value"] for e in txs.values())
+        received_confirmed = sum(e["value"] for e in txs.values()
+                                 if self._confirmations(e["height"], tip) >= inv["confirmations"])
+        target = inv["amount"] - self.tolerance
+        if received_confirmed >= target:
+            status = "confirmed"
+        elif received >= target:
+            status = "paid"
+        elif received > 0:
+            status = "underpaid"
+        else:
+            status = "pending"
+
+        old = inv["status"]
+        inv.update(received=received, received_confirmed=received_confirmed, status=status)
+        events = []
+        if dropped and (status != old or status == "underpaid"):
+            events.append("dropped")
+        if status == "underpaid" and (old != "underpaid" or new):
+            events.append("underpaid")
+        if status in ("paid", "confirmed") and old not in ("paid", "confirmed"):
+            events.append("paid")
+        if status == "confirmed":
+            events.append("confirmed")
+        for kind in events:
+            self._emit(kind, inv, tip, new, dropped)
+        if status == "confirmed":
+            with self._lock:
+                self._by_address.pop(inv["address"], None)
+                self._next.pop(inv["address"], None)
+        return status != old
+
+    def _expire(self) -> None:
+        now = time.time()
+        with self._lock:
+            expired = [inv for inv in self._by_address.values()
+                       if inv.get("expires_at") and now > inv["expires_at"] and inv["status"] != "paid"]
+            for inv in expired:
+                inv["status"] = "expired"
+                del self._by_address[inv["address"]]
+                self._next.pop(inv["address"], None)
+        for inv in expired:
+            self._emit("expired", inv, self._tip)
+        if expired:
+            self._save_state()
+
+    def _emit(self, kind: str, inv: dict, tip: Optional[int], new: List[str] = (), dropped: List[str] = ()) -> None:
+        confs = [self._confirmations(e["height"], tip) for e in inv["txs"].values()]
+        event = {"event": kind, "invoice": inv["id"], "address": inv["address"], "amount": inv["amount"],
+                 "received": inv["received"], "received_confirmed": inv["received_confirmed"],
+                 "missing": max(0, inv["amount"] - inv["received"]),
+                 "overpaid": max(0, inv["received"] - inv["amount"]),
+                 "confirmations": min(confs) if confs else 0, "txids": sorted(inv["txs"]),
+                 "new_txids": list(new), "dropped_txids": list(dropped), "time": int(time.time())}
+        self.stats["events"] += 1
+        if self.on_event:
+            try:
+                self.on_event(event)
+            except Exception as e:
+                print(f"Erro no callback de pagamento ({kind} {inv['id']}): {e}")
+
+    def run(self, stop: Optional[threading.Event] = None, reload: Optional[Callable[[], None]] = None,
+            reload_interval: float = 5, until_settled: bool = False) -> None:
+        """
+        Laço principal até stop ser sinalizado (ou, com until_settled, até não
+        restar fatura em aberto). reload é chamado a cada reload_interval
+        segundos (ex.: reler o arquivo de faturas).
+        """
+        stop = stop or threading.Event()
+        with self._lock:
+            addresses = list(self._by_address)
+        self._subscribe(addresses)
+        last_reload = time.time()
+        try:
+            while not stop.is_set():
+                self._wake.clear()
+                delay = self.step()
+                if until_settled and not self._by_address:
+                    break
+                if reload and time.time() - last_reload >= reload_interval:
+                    reload()
+                    last_reload = time.time()
+                timeout = min(delay, reload_interval) if reload else delay
+                if timeout > 0:
+                    self._wake.wait(timeout)
+        finally:
+            if self._subscribed:
+                network.unsubscribe(self._on_change)
+                self._subscribed = False
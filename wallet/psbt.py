@@ -0,0 +1,408 @@
+"""
+PSBT (BIP174, versão 0) para os planos de transação da carteira.
+
+Permite exportar um plano (build_tx_plan) como PSBT com os dados de
+witness UTXO e a derivação BIP32 de cada input (e do troco, derivada da xpub da
+conta, sem senha), importar PSBTs de outras ferramentas, assinar os
+inputs P2WPKH que pertencem à carteira, finalizar e extrair a transação.
+
+Os campos que não interpretamos são preservados como estão (key -> value).
+"""
+from typing import Dict, List, Optional, Tuple
+import base64
+import io
+import struct
+
+from btclib import b32
+from btclib.hashes import hash160
+
+from wallet.keys import parse_path, watch_only_pubkey, HARDENED
+from wallet.transactions import (
+    KeyIndex, build_unsigned_tx, hash256, load_address_index, segwit_sighash,
+    serialize_script_pubkey, varint_encode,
+)
+from wallet.utils import load_wallet
+from wallet import ec
+
+PSBT_MAGIC = b"psbt\xff"
+
+# tipos de chave (BIP174)
+PSBT_GLOBAL_UNSIGNED_TX = 0x00
+PSBT_IN_WITNESS_UTXO = 0x01
+PSBT_IN_PARTIAL_SIG = 0x02
+PSBT_IN_SIGHASH_TYPE = 0x03
+PSBT_IN_BIP32_DERIVATION = 0x06
+PSBT_IN_FINAL_SCRIPTSIG = 0x07
+PSBT_IN_FINAL_SCRIPTWITNESS = 0x08
+PSBT_OUT_BIP32_DERIVATION = 0x02
+
+SIGHASH_ALL = 1
+
+
+def _read_varint(s: io.BytesIO) -> int:
+    b = s.read(1)
+    if not b:
+        raise ValueError("PSBT truncado")
+    n = b[0]
+    if n < 0xfd:
+        return n
+    size = {0xfd: 2, 0xfe: 4, 0xff: 8}[n]
+    data = s.read(size)
+    if len(data) != size:
+        raise ValueError("PSBT truncado")
+    return int.from_bytes(data, "little")
+
+
+def _read_exact(s: io.BytesIO, n: int) -> bytes:
+    data = s.read(n)
+    if len(data) != n:
+        raise ValueError("PSBT truncado")
+    return data
+
+
+def _read_map(s: io.BytesIO) -> Dict[bytes, bytes]:
+    m: Dict[bytes, bytes] = {}
+    while True:
+        key_len = _read_varint(s)
+        if key_len == 0:
+            return m
+        key = _read_exact(s, key_len)
+        if key in m:
+            raise ValueError("PSBT com chave duplicada")
+        m[key] = _read_exact(s, _read_varint(s))
+
+
+def _write_map(m: Dict[bytes, bytes]) -> bytes:
+    out = b""
+    for key, value in m.items():
+        out += varint_encode(len(key)) + key + varint_encode(len(value)) + value
+    return out + b"\x00"
+
+
+def parse_unsigned_tx(raw: bytes) -> Dict:
+    """
+    Decodifica uma transação sem witness: {"version", "inputs", "outputs", "locktime"}.
+    inputs: [{"txid", "vout", "sequence"}]; outputs: [(script_pubkey, amount)].
+    """
+    s = io.BytesIO(raw)
+    version = struct.unpack("<I", _read_exact(s, 4))[0]
+    inputs = []
+    for _ in range(_read_varint(s)):
+        txid = _read_exact(s, 32)[::-1].hex()
+        vout = struct.unpack("<I", _read_exact(s, 4))[0]
+        if _read_varint(s) != 0:
+            raise ValueError("Transação não assinada deve ter scriptSig vazio")
+        sequence = struct.unpack("<I", _read_exact(s, 4))[0]
+        inputs.append({"txid": txid, "vout": vout, "sequence": sequence})
+    outputs = []
+    for _ in range(_read_varint(s)):
+        amount = struct.unpack("<Q", _read_exact(s, 8))[0]
+        script = _read_exact(s, _read_varint(s))
+        outputs.append((script, amount))
+    locktime = struct.unpack("<I", _read_exact(s, 4))[0]
+    if s.read(1):
+        raise ValueError("Bytes extras após a transação")
+    return {"version": version, "inputs": inputs, "outputs": outputs, "locktime": locktime}
+
+
+class Psbt:
+    """
+    PSBT v0: transação não assinada + mapas key/value globais, por input e por output.
+    """
+    def __init__(self, unsigned_tx: bytes, global_map: Optional[Dict[bytes, bytes]] = None,
+                 input_maps: Optional[List[Dict[bytes, bytes]]] = None,
+                 output_maps: Optional[List[Dict[bytes, bytes]]] = None):
+        self.unsigned_tx = unsigned_tx
+        self.tx = parse_unsigned_tx(unsigned_tx)
+        self.global_map = dict(global_map or {})
+        self.global_map[bytes([PSBT_GLOBAL_UNSIGNED_TX])] = unsigned_tx
+        self.input_maps = input_maps or [{} for _ in self.tx["inputs"]]
+        self.output_maps = output_maps or [{} for _ in self.tx["outputs"]]
+        if len(self.input_maps) != len(self.tx["inputs"]) or len(self.output_maps) != len(self.tx["outputs"]):
+            raise ValueError("PSBT com número de mapas diferente do número de inputs/outputs")
+
+    # ---------- serialização ----------
+
+    def serialize(self) -> bytes:
+        out = PSBT_MAGIC + _write_map(self.global_map)
+        for m in self.input_maps:
+            out += _write_map(m)
+        for m in self.output_maps:
+            out += _write_map(m)
+        return out
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.serialize()).decode()
+
+    @classmethod
+    def parse(cls, data: bytes) -> "Psbt":
+        """
+        Aceita o formato binário ou o texto base64 (como o bitcoin-cli gera).
+        """
+        if not data.startswith(PSBT_MAGIC):
+            try:
+                data = base64.b64decode(data.strip(), validate=True)
+            except Exception:
+                raise ValueError("Arquivo não é um PSBT (binário ou base64)")
+            if not data.startswith(PSBT_MAGIC):
+                raise ValueError("Arquivo não é um PSBT (binário ou base64)")
+        s = io.BytesIO(data[len(PSBT_MAGIC):])
+        global_map = _read_map(s)
+        unsigned_tx = global_map.get(bytes([PSBT_GLOBAL_UNSIGNED_TX]))
+        if unsigned_tx is None:
+            raise ValueError("PSBT sem transação não assinada")
+        tx = parse_unsigned_tx(unsigned_tx)
+        input_maps = [_read_map(s) for _ in tx["inputs"]]
+        output_maps = [_read_map(s) for _ in tx["outputs"]]
+        return cls(unsigned_tx, global_map, input_maps, output_maps)
+
+    # ---------- acesso aos campos ----------
+
+    def witness_utxo(self, i: int) -> Optional[Tuple[int, bytes]]:
+        """(amount, script_pubkey) do UTXO gasto pelo input i, se presente."""
+        value = self.input_maps[i].get(bytes([PSBT_IN_WITNESS_UTXO]))
+        if value is None:
+            return None
+        s = io.BytesIO(value)
+        amount = struct.unpack("<Q", _read_exact(s, 8))[0]
+        return amount, _read_exact(s, _read_varint(s))
+
+    def bip32_paths(self, i: int) -> Dict[bytes, str]:
+        """{pubkey: path} das derivações BIP32 declaradas no input i."""
+        paths = {}
+        for key, value in self.input_maps[i].items():
+            if key[0] == PSBT_IN_BIP32_DERIVATION and len(value) >= 4 and (len(value) - 4) % 4 == 0:
+                idxs = struct.unpack(f"<{(len(value) - 4) // 4}I", value[4:])
+                parts = [f"{n - HARDENED}'" if n >= HARDENED else str(n) for n in idxs]
+                paths[key[1:]] = "/".join(["m"] + parts)
+        return paths
+
+    def is_finalized(self, i: int) -> bool:
+        m = self.input_maps[i]
+        return bytes([PSBT_IN_FINAL_SCRIPTWITNESS]) in m or bytes([PSBT_IN_FINAL_SCRIPTSIG]) in m
+
+    def fee(self) -> Optional[int]:
+        """Taxa (inputs - outputs), se todos os inputs tiverem witness UTXO."""
+        total_in = 0
+        for i in range(len(self.input_maps)):
+            utxo = self.witness_utxo(i)
+            if utxo is None:
+                return None
+            total_in += utxo[0]
+        return total_in - sum(amount for _, amount in self.tx["outputs"])
+
+    def txid(self) -> str:
+        return hash256(self.unsigned_tx)[::-1].hex()
+
+
+def _bip32_derivation(wallet: Dict, path: str) -> Tuple[bytes, bytes]:
+    """(pubkey, fingerprint mestre + índices do path) de um registro de derivação BIP32."""
+    pub_key = watch_only_pubkey(wallet["account_xpub"], wallet["account_path"], path)
+    idxs = parse_path(path)
+    return pub_key, bytes.fromhex(wallet["master_fingerprint"]) + struct.pack(f"<{len(idxs)}I", *idxs)
+
+
+def psbt_from_plan(plan: Dict, address_index: Optional[Dict[str, str]] = None,
+                   wallet: Optional[Dict] = None) -> Psbt:
+    """
+    Converte um plano (build_tx_plan / tx_plan.json) em PSBT com witness UTXO
+    de cada input, para ser assinado por qualquer ferramenta compatível.
+    Inclui também a derivação BIP32 (fingerprint + path) de cada input e dos
+    outputs da carteira (troco), derivada da xpub da conta gravada no
+    wallet.json (sem senha): carteiras de hardware e outros assinantes
+    precisam dela para achar a chave e conferir o troco. Se a carteira ainda
+    não tem a xpub (só é gravada no primeiro unlock), o PSBT sai sem as
+    derivações; confira com has_bip32_derivations.
+    """
+    inputs = plan["inputs"]
+    outputs = {addr: int(v) for addr, v in plan["outputs"].items()}
+    psbt = Psbt(build_unsigned_tx(inputs, outputs))
+    for i, inp in enumerate(inputs):
+        if not inp.get("address"):
+            raise ValueError(f"Input {i} do plano sem endereço (necessário para o witness UTXO)")
+        script = serialize_script_pubkey(inp["address"])
+        psbt.input_maps[i][bytes([PSBT_IN_WITNESS_UTXO])] = (
+            struct.pack("<Q", inp["value"]) + varint_encode(len(script)) + script
+        )
+    if wallet is None:
+        wallet = load_wallet()
+    if not (wallet.get("account_xpub") and wallet.get("master_fingerprint")):
+        return psbt
+
+    wallet = {"account_path": "m/84'/1'/0'", **wallet}
+    if address_index is None:
+        address_index = load_address_index()
+    for i, inp in enumerate(inputs):
+        path = inp.get("path") or address_index.get(inp["address"])
+        if not path:
+            raise ValueError(f"Input {i} do plano sem derivation path (endereço fora da carteira?)")
+        pub_key, origin = _bip32_derivation(wallet, path)
+        if serialize_script_pubkey(inp["address"])[2:] != hash160(pub_key):
+            raise ValueError(f"Input {i}: o path {path} não corresponde ao endereço {inp['address']}")
+        psbt.input_maps[i][bytes([PSBT_IN_BIP32_DERIVATION]) + pub_key] = origin
+    for n, (script, _) in enumerate(psbt.tx["outputs"]):
+        path = address_index.get(_script_address(script))
+        if path:
+            pub_key, origin = _bip32_derivation(wallet, path)
+            psbt.output_maps[n][bytes([PSBT_OUT_BIP32_DERIVATION]) + pub_key] = origin
+    return psbt
+
+
+def has_bip32_derivations(psbt: Psbt) -> bool:
+    """True se todos os inputs têm derivação BIP32."""
+    return all(psbt.bip32_paths(i) for i in range(len(psbt.input_maps)))
+
+
+def _script_address(script: bytes) -> Optional[str]:
+    if len(script) == 22 and script[:2] == b"\x00\x14":
+        return b32.address_from_witness(0, script[2:], "testnet")
+    return None
+
+
+def psbt_summary(psbt: Psbt) -> Dict:
+    """
+    Resumo legível (no formato de plano) de um PSBT: outputs por endereço, taxa e txid.
+    """
+    outputs = []
+    for script, amount in psbt.tx["outputs"]:
+        outputs.append({"address": _script_address(script) or script.hex(), "amount_sats": amount})
+    return {
+        "txid": psbt.txid(),
+        "inputs": len(psbt.tx["inputs"]),
+        "outputs": outputs,
+        "fee_sats": psbt.fee(),
+        "finalized": all(psbt.is_finalized(i) for i in range(len(psbt.input_maps))),
+    }
+
+
+def psbt_spends(psbt: Psbt) -> Tuple[List[dict], List[Tuple[Optional[str], int]]]:
+    """
+    (inputs, [(endereço, valor)] na ordem dos outputs) do PSBT, para registrar
+    a transação no ledger de pendentes após o broadcast.
+    """
+    inputs = []
+    for i, txin in enumerate(psbt.tx["inputs"]):
+        utxo = psbt.witness_utxo(i)
+        inputs.append({"txid": txin["txid"], "vout": txin["vout"],
+                       "address": _script_address(utxo[1]) if utxo else None})
+    outputs = [(_script_address(script), amount) for script, amount in psbt.tx["outputs"]]
+    return inputs, outputs
+
+
+def _bip143_hashes_from_tx(tx: Dict) -> Tuple[bytes, bytes, bytes]:
+    prevouts = b"".join(bytes.fromhex(inp["txid"])[::-1] + struct.pack("<I", inp["vout"])
+                        for inp in tx["inputs"])
+    sequences = b"".join(struct.pack("<I", inp["sequence"]) for inp in tx["inputs"])
+    outputs_ser = b"".join(struct.pack("<Q", amount) + varint_encode(len(script)) + script
+                           for script, amount in tx["outputs"])
+    return hash256(prevouts), hash256(sequences), hash256(outputs_ser)
+
+
+def sign_psbt(psbt: Psbt, keys: KeyIndex, address_index: Optional[Dict[str, str]] = None,
+              low_r: bool = False) -> int:
+    """
+    Assina (SIGHASH_ALL) todos os inputs P2WPKH da carteira ainda não finalizados.
+    A chave de cada input é encontrada pelo endereço do witness UTXO no wallet.json
+    ou, se ausente, pela derivação BIP32 declarada no PSBT.
+    Retorna o número de inputs assinados.
+    """
+    if address_index is None:
+        address_index = load_address_index()
+
+    hashes = _bip143_hashes_from_tx(psbt.tx)
+    signed = 0
+    for i, txin in enumerate(psbt.tx["inputs"]):
+        if psbt.is_finalized(i):
+            continue
+        utxo = psbt.witness_utxo(i)
+        if utxo is None:
+            continue
+        amount, script = utxo
+        address = _script_address(script)
+        if address is None:
+            continue  # só P2WPKH é suportado
+
+        sighash_type = psbt.input_maps[i].get(bytes([PSBT_IN_SIGHASH_TYPE]))
+        if sighash_type is not None and struct.unpack("<I", sighash_type)[0] != SIGHASH_ALL:
+            raise ValueError(f"Input {i}: apenas SIGHASH_ALL é suportado")
+
+        candidates = []
+        if address in address_index:
+            candidates.append(address_index[address])
+        candidates += list(psbt.bip32_paths(i).values())
+
+        for path in candidates:
+            try:
+                parse_path(path)
+            except ValueError:
+                continue
+            prv_buf, pub_key = keys.key_for(path)
+            if script[2:] != hash160(pub_key):
+                continue
+            # com os hashes BIP143 prontos, o sighash só usa o input corrente
+            sighash = segwit_sighash(0, [dict(txin, value=amount)], {}, pub_key, hashes,
+                                     psbt.tx["version"], psbt.tx["locktime"])
+            sig = ec.sign_low_r(sighash, bytes(prv_buf)) if low_r else ec.sign(sighash, bytes(prv_buf))
+            psbt.input_maps[i][bytes([PSBT_IN_PARTIAL_SIG]) + pub_key] = sig + bytes([SIGHASH_ALL])
+            signed += 1
+            break
+    return signed
+
+
+def finalize_psbt(psbt: Psbt) -> bool:
+    """
+    Finaliza os inputs P2WPKH que têm assinatura parcial (witness = [sig, pubkey]).
+    Retorna True se todos os inputs ficaram finalizados.
+    """
+    for i, m in enumerate(psbt.input_maps):
+        if psbt.is_finalized(i):
+            continue
+        utxo = psbt.witness_utxo(i)
+        if utxo is None:
+            continue
+        # a assinatura da chave do witness program (pode haver outras parciais no mapa)
+        sigs = [(k[1:], v) for k, v in m.items()
+                if k[0] == PSBT_IN_PARTIAL_SIG and hash160(k[1:]) == utxo[1][2:]]
+        if not sigs:
+            continue
+        pub_key, sig = sigs[0]
+        witness = varint_encode(2) + varint_encode(len(sig)) + sig + varint_encode(len(pub_key)) + pub_key
+        # o finalizador remove os campos usados só para assinar (BIP174)
+        for k in [k for k in m if k[0] in (PSBT_IN_PARTIAL_SIG, PSBT_IN_SIGHASH_TYPE, PSBT_IN_BIP32_DERIVATION)]:
+            del m[k]
+        m[bytes([PSBT_IN_FINAL_SCRIPTWITNESS])] = witness
+    return all(psbt.is_finalized(i) for i in range(len(psbt.input_maps)))
+
+
+def extract_tx(psbt: Psbt) -> str:
+    """
+    Monta a transação final (hex) de um PSBT totalmente finalizado.
+    """
+    tx = psbt.tx
+    if not all(psbt.is_finalized(i) for i in range(len(tx["inputs"]))):
+        raise ValueError("PSBT não finalizado: nem todos os inputs estão assinados")
+
+    raw = struct.pack("<I", tx["version"]) + b"\x00\x01"
+    raw += varint_encode(len(tx["inputs"]))
+    for i, inp in enumerate(tx["inputs"]):
+        script_sig = psbt.input_maps[i].get(bytes([PSBT_IN_FINAL_SCRIPTSIG]), b"")
+        raw += bytes.fromhex(inp["txid"])[::-1] + struct.pack("<I", inp["vout"])
+        raw += varint_encode(len(script_sig)) + script_sig
+        raw += struct.pack("<I", inp["sequence"])
+    raw += varint_encode(len(tx["outputs"]))
+    for script, amount in tx["outputs"]:
+        raw += struct.pack("<Q", amount) + varint_encode(len(script)) + script
+    for m in psbt.input_maps:
+        raw += m.get(bytes([PSBT_IN_FINAL_SCRIPTWITNESS]), b"\x00")
+    raw += struct.pack("<I", tx["locktime"])
+    return raw.hex()
+
+
+def load_psbt(path: str) -> Psbt:
+    with open(path, "rb") as f:
+        return Psbt.parse(f.read())
+
+
+def save_psbt(psbt: Psbt, path: str) -> None:
+    with open(path, "wb") as f:
+        f.write(psbt.serialize())
@@ -0,0 +1,152 @@
+"""
+Scripts e transações serializadas, sem depender de um backend específico.
+
+script_from_address / script_address convertem entre endereço segwit e
+scriptPubKey; decode_raw_tx decodifica o hex bruto devolvido por servidores
+Electrum, pelo bitcoind ou pelo /tx/{txid}/hex do Esplora. read_tx lê uma
+transação de um stream; read_block percorre as transações de um bloco
+serializado sem montar a lista inteira.
+"""
+from typing import Dict, Iterator, List, Optional, Tuple
+import hashlib
+import io
+import struct
+
+from btclib import b32
+
+
+def hash256(data: bytes) -> bytes:
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def script_from_address(address: str) -> bytes:
+    """scriptPubKey de um endereço segwit (bech32/bech32m)."""
+    try:
+        witver, witprog, _ = b32.witness_from_address(address)
+    except Exception as e:
+        raise ValueError(f"Endereço inválido ({address}): {e}")
+    return bytes([0x50 + witver if witver else 0, len(witprog)]) + bytes(witprog)
+
+
+def script_address(script: bytes, network: str = "testnet") -> Optional[str]:
+    """Endereço de um scriptPubKey segwit, ou None (outros tipos não interessam à carteira)."""
+    if len(script) < 4 or script[1] != len(script) - 2:
+        return None
+    if script[0] == 0:
+        witver = 0
+    elif 0x51 <= script[0] <= 0x60:
+        witver = script[0] - 0x50
+    else:
+        return None
+    try:
+        return b32.address_from_witness(witver, script[2:], network)
+    except Exception:
+        return None
+
+
+def write_varint(n: int) -> bytes:
+    if n < 0xfd:
+        return bytes([n])
+    if n <= 0xffff:
+        return b"\xfd" + struct.pack("<H", n)
+    if n <= 0xffffffff:
+        return b"\xfe" + struct.pack("<I", n)
+    return b"\xff" + struct.pack("<Q", n)
+
+
+def read_varint(s: io.BytesIO) -> int:
+    n = s.read(1)[0]
+    if n < 0xfd:
+        return n
+    size = {0xfd: 2, 0xfe: 4, 0xff: 8}[n]
+    return int.from_bytes(s.read(size), "little")
+
+
+def read_tx(s: io.BytesIO) -> Dict:
+    """
+    Lê uma transação (com ou sem witness) a partir da posição atual de s:
+    {"txid", "version", "locktime", "weight", "vin": [{"txid", "vout", "sequence",
+    "is_coinbase"}], "vout": [{"scriptpubkey", "value"}]}.
+    """
+    buf = s.getbuffer()
+    start = s.tell()
+    version = struct.unpack("<I", s.read(4))[0]
+    segwit = bytes(buf[start + 4:start + 6]) == b"\x00\x01"
+    if segwit:
+        s.read(2)
+    body_start = s.tell()
+    vin = []
+    for _ in range(read_varint(s)):
+        txid = s.read(32)[::-1].hex()
+        vout = struct.unpack("<I", s.read(4))[0]
+        s.read(read_varint(s))
+        sequence = struct.unpack("<I", s.read(4))[0]
+        vin.append({"txid": txid, "vout": vout, "sequence": sequence,
+                    "is_coinbase": txid == "00" * 32 and vout == 0xffffffff})
+    vout = []
+    for _ in range(read_varint(s)):
+        value = struct.unpack("<Q", s.read(8))[0]
+        vout.append({"scriptpubkey": s.read(read_varint(s)).hex(), "value": value})
+    body_end = s.tell()
+    if segwit:
+        for _ in vin:
+            for _ in range(read_varint(s)):
+                s.read(read_varint(s))
+    locktime_raw = s.read(4)
+    if len(locktime_raw) != 4:
+        raise ValueError("Transação malformada")
+    end = s.tell()
+
+    stripped = bytes(buf[start:start + 4]) + bytes(buf[body_start:body_end]) + locktime_raw
+    del buf
+    return {
+        "txid": hash256(stripped)[::-1].hex(),
+        "version": version,
+        "locktime": struct.unpack("<I", locktime_raw)[0],
+        "weight": len(stripped) * 3 + (end - start),
+        "vin": vin,
+        "vout": vout,
+    }
+
+
+def decode_raw_tx(raw: bytes) -> Dict:
+    """Decodifica uma transação serializada completa (ver read_tx)."""
+    s = io.BytesIO(raw)
+    try:
+        tx = read_tx(s)
+    except (IndexError, struct.error):
+        raise ValueError("Transação malformada")
+    if s.read(1):
+        raise ValueError("Transação malformada")
+    return tx
+
+
+def block_header(raw: bytes) -> Dict:
+    """{"hash", "prev_hash"} do cabeçalho (80 bytes iniciais) de um bloco."""
+    if len(raw) < 80:
+        raise ValueError("Bloco malformado")
+    return {"hash": hash256(raw[:80])[::-1].hex(), "prev_hash": raw[4:36][::-1].hex()}
+
+
+def read_block(raw: bytes) -> Iterator[Dict]:
+    """Transações de um bloco serializado, na ordem do bloco (ver read_tx)."""
+    s = io.BytesIO(raw)
+    s.seek(80)
+    try:
+        for _ in range(read_varint(s)):
+            yield read_tx(s)
+    except (IndexError, struct.error):
+        raise ValueError("Bloco malformado")
+
+
+def synthetic_funding_tx(outputs: List[Tuple[bytes, int]], nonce: int) -> bytes:
+    """
+    Transação sem witness com um único input estilo coinbase (nonce no
+    scriptSig, para txids distintos) pagando [(scriptPubKey, valor)]. Usada
+    pelos servidores de teste para criar saldo sintético.
+    """
+    coinbase = (b"\x00" * 32 + b"\xff\xff\xff\xff" + write_varint(8) + struct.pack("<Q", nonce)
+                + b"\xff\xff\xff\xff")
+    body = b"".join(struct.pack("<Q", value) + write_varint(len(script)) + script for script, value in outputs)
+    return (struct.pack("<I", 2) + write_varint(1) + coinbase + write_varint(len(outputs)) + body
+            + struct.pack("<I", 0))
@@ -0,0 +1,158 @@
+"""
+Atualização de saldos em segundo plano.
+
+Um BalanceRefresher mantém {endereço: saldo} atualizado numa thread própria,
+consultando os endereços em paralelo (network.fanout, com a concorrência
+ajustada pelo limitador adaptativo do backend) e publicando cada
+resultado assim que ele chega, com o horário da última atualização. Quem
+exibe (ex.: um fragmento do Streamlit) só lê snapshot(), que nunca bloqueia
+na rede. Se ninguém chamar snapshot() por idle_timeout segundos (aba
+fechada), a thread termina sozinha.
+
+Com um backend de consulta em lote (electrum) cada rodada é uma única ida e
+volta para todos os endereços; se o backend tiver notificações (subscribe),
+só os endereços avisados são reconsultados e a rodada completa vira um
+fallback espaçado (subscribed_interval).
+"""
+from typing import Callable, Dict, List, Optional
+import threading
+import time
+
+from wallet import network
+
+
+class BalanceRefresher:
+    def __init__(self, addresses: List[str], interval: float = 30, workers: Optional[int] = None,
+                 idle_timeout: float = 300, fetch: Optional[Callable[[str], dict]] = None,
+                 subscribed_interval: float = 300):
+        self.interval = interval
+        self.subscribed_interval = subscribed_interval
+        self.workers = workers
+        self.idle_timeout = idle_timeout
+        self._fetch = fetch
+        self._addresses = list(addresses)
+        self._balances: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._last_read = time.time()
+        self._refreshing = False
+        self._full = True                 # próxima rodada consulta todos os endereços
+        self._dirty = set()               # endereços avisados pelo subscribe
+        self._subscribed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "BalanceRefresher":
+        if not self.alive:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="wowlie-balance-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._subscribed:
+            network.unsubscribe(self._on_change)
+            self._subscribed = False
+
+    @property
+    def alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def refreshing(self) -> bool:
+        return self._refreshing
+
+    def set_addresses(self, addresses: List[str]) -> None:
+        """Troca a lista de endereços; novos endereços são consultados na hora."""
+        with self._lock:
+            added = set(addresses) - set(self._addresses)
+            self._addresses = list(addresses)
+            for addr in list(self._balances):
+                if addr not in self._addresses:
+                    del self._balances[addr]
+        if added:
+            if self._subscribed:
+                self._subscribe(sorted(added))
+            self.refresh_now()
+
+    def refresh_now(self) -> None:
+        """Antecipa a próxima rodada completa (não espera o resultado)."""
+        self._full = True
+        self._wake.set()
+
+    def _subscribe(self, addresses: List[str]) -> None:
+        try:
+            self._subscribed = network.subscribe(addresses, self._on_change) or self._subscribed
+        except Exception:
+            pass
+
+    def _on_change(self, address: str, status: Optional[str]) -> None:
+        with self._lock:
+            if address not in self._addresses:
+                return
+            self._dirty.add(address)
+        self._wake.set()
+
+    def snapshot(self) -> Dict[str, dict]:
+        """
+        Cópia de {endereço: {"confirmed", "unconfirmed", "total", "updated_at", "error"}}
+        só com os endereços que já têm resultado (ou erro).
+        """
+        self._last_read = time.time()
+        with self._lock:
+            return {a: dict(b) for a, b in self._balances.items()}
+
+    def _publish(self, addr: str, balance: Optional[dict], error: Optional[str]) -> None:
+        with self._lock:
+            if addr not in self._addresses:
+                return
+            entry = self._balances.setdefault(addr, {"confirmed": None, "unconfirmed": None,
+                                                     "total": None, "updated_at": None})
+            if balance is not None:
+                entry.update({k: int(balance.get(k, 0)) for k in ("confirmed", "unconfirmed", "total")})
+                entry["updated_at"] = time.time()
+            entry["error"] = error
+
+    def _refresh(self, addresses: List[str]) -> None:
+        self._refreshing = True
+        try:
+            if self._fetch is None and network.get_backend().batched:
+                try:
+                    for addr, balance in network.get_balances(addresses).items():
+                        self._publish(addr, balance, None)
+                except Exception as e:
+                    for addr in addresses:
+                        self._publish(addr, None, str(e))
+                return
+            fetch = self._fetch or network.get_balance
+            for addr, result in network.fanout(fetch, addresses, self.workers):
+                if isinstance(result, Exception):
+                    self._publish(addr, None, str(result))
+                else:
+                    self._publish(addr, result, None)
+        finally:
+            self._refreshing = False
+
+    def _run(self) -> None:
+        if self._fetch is None:
+            with self._lock:
+                addresses = list(self._addresses)
+            self._subscribe(addresses)
+        while not self._stop.is_set():
+            if time.time() - self._last_read > self.idle_timeout:
+                break
+            self._wake.clear()
+            with self._lock:
+                full, self._full = self._full, False
+                dirty, self._dirty = self._dirty, set()
+                addresses = list(self._addresses) if full else [a for a in self._addresses if a in dirty]
+            if addresses:
+                self._refresh(addresses)
+            interval = self.subscribed_interval if self._subscribed else self.interval
+            if not self._wake.wait(interval):
+                self._full = True
+        if self._subscribed:
+            network.unsubscribe(self._on_change)
+            self._subscribed = False
@@ -0,0 +1,88 @@
+"""
+Sessões desbloqueadas e executor de trabalho pesado compartilhado.
+
+UnlockedSession guarda um KeyIndex aberto (um único PBKDF2 + derivação BIP32
+por login) e se fecha sozinho após idle_timeout segundos sem uso, zeroizando
+as chaves. BoundedExecutor é um pool de threads com limite de tarefas em
+andamento: várias sessões de interface (ex.: Streamlit) submetem unlock e
+assinatura para ele e acompanham os futures, sem ocupar a thread que desenha
+a página. Threads (e não processos) porque o KeyIndex fica na memória do
+processo; o PBKDF2 da cryptography e o do hashlib liberam o GIL.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+import threading
+import time
+
+from wallet.transactions import KeyIndex
+
+DEFAULT_IDLE_TIMEOUT = 5 * 60
+
+
+class SessionExpired(RuntimeError):
+    pass
+
+
+class UnlockedSession:
+    """KeyIndex com expiração por inatividade."""
+
+    def __init__(self, password: str, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._keys: Optional[KeyIndex] = KeyIndex(password)
+        self._last_used = time.time()
+        self._lock = threading.Lock()
+
+    @property
+    def expired(self) -> bool:
+        with self._lock:
+            if self._keys is not None and time.time() - self._last_used > self.idle_timeout:
+                self._close_locked()
+            return self._keys is None
+
+    @property
+    def remaining(self) -> float:
+        """Segundos até a expiração por inatividade."""
+        return max(0.0, self.idle_timeout - (time.time() - self._last_used))
+
+    def keys(self) -> KeyIndex:
+        """KeyIndex da sessão (renova o prazo). Levanta SessionExpired se já expirou."""
+        if self.expired:
+            raise SessionExpired("Sessão expirada por inatividade. Entre novamente.")
+        with self._lock:
+            self._last_used = time.time()
+            return self._keys
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_locked()
+
+    def _close_locked(self) -> None:
+        if self._keys is not None:
+            self._keys.close()
+            self._keys = None
+
+
+class BoundedExecutor:
+    """
+    ThreadPoolExecutor com no máximo max_pending tarefas em andamento (em
+    execução + na fila). submit() levanta RuntimeError quando lotado, em vez
+    de deixar a fila crescer sem limite.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 8):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wowlie-worker")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise RuntimeError("Servidor ocupado: muitas operações em andamento. Tente de novo em instantes.")
+        try:
+            fut = self._pool.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        fut.add_done_callback(lambda _: self._slots.release())
+        return fut
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,166 @@
+"""
+Agrupamento de consultas idênticas simultâneas (single-flight).
+
+Com várias sessões do Streamlit, o daemon e os watchers rodando juntos, a
+mesma consulta (UTXOs ou saldo de um endereço, status de uma transação)
+costuma estar em voo várias vezes ao mesmo tempo. SingleFlight.do(chave, fn)
+faz só a primeira chamada ir ao servidor; as outras com a mesma chave esperam
+e recebem o mesmo resultado (ou a mesma exceção).
+
+Erros ficam num cache negativo curto (error_ttl): durante uma rajada contra
+um servidor fora do ar, quem chega logo depois recebe o erro na hora em vez
+de abrir outra requisição que vai falhar igual.
+
+Comparação com e sem agrupamento num Esplora local:
+    python -m wallet.singleflight --bench [--sessions 8 --addresses 50 --latency-ms 80]
+"""
+from typing import Callable, Dict, Hashable, Tuple
+import threading
+import time
+
+MAX_NEGATIVE = 1024    # chaves com erro guardadas; acima disso as vencidas são descartadas
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, error_ttl: float = 2.0):
+        self.error_ttl = error_ttl
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._errors: Dict[Hashable, Tuple[float, BaseException]] = {}
+        self.stats = {"calls": 0, "upstream": 0, "shared": 0, "negative_hits": 0}
+
+    def do(self, key: Hashable, fn: Callable):
+        """
+        Resultado de fn(), compartilhado entre as chamadas simultâneas com a
+        mesma chave. O resultado é o mesmo objeto para todas: não o altere.
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+            cached = self._errors.get(key)
+            if cached is not None:
+                if cached[0] > time.monotonic():
+                    self.stats["negative_hits"] += 1
+                    raise cached[1]
+                del self._errors[key]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats["upstream"] += 1
+            else:
+                self.stats["shared"] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                    if isinstance(call.error, Exception) and self.error_ttl > 0:
+                        self._remember_error(key, call.error)
+                call.done.set()
+        else:
+            call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _remember_error(self, key: Hashable, error: Exception) -> None:
+        now = time.monotonic()
+        if len(self._errors) >= MAX_NEGATIVE:
+            self._errors = {k: v for k, v in self._errors.items() if v[0] > now}
+        self._errors[key] = (now + self.error_ttl, error)
+
+    def forget(self, key: Hashable) -> None:
+        """Descarta o erro guardado da chave: a próxima chamada vai ao servidor."""
+        with self._lock:
+            self._errors.pop(key, None)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+def benchmark(sessions: int = 8, n_addresses: int = 50, rounds: int = 3, latency: float = 0.08, seed: int = 0):
+    """
+    sessions threads atualizam ao mesmo tempo os saldos dos mesmos
+    n_addresses endereços (como várias abas do Streamlit), rounds vezes, com
+    e sem agrupamento. Mede requisições ao servidor e latência por atualização.
+    """
+    import random
+
+    from btclib import b32
+
+    from wallet.esplora_standin import ChainState, EsploraStandIn, _percentile
+    from wallet.limiter import AdaptiveLimiter
+    from wallet.network import EsploraBackend
+
+    rng = random.Random(seed)
+    addrs = [b32.address_from_witness(0, rng.randbytes(20), "testnet") for _ in range(n_addresses)]
+    state = ChainState()
+    state.synthetic_wallet(addrs, 2, seed=seed)
+    results = []
+    for name, coalesce in (("sem agrupamento", False), ("single-flight", True)):
+        server = EsploraStandIn(state, latency=latency, seed=seed).start()
+        backend = EsploraBackend(server.url, limiter=AdaptiveLimiter(initial=32, max_limit=64), coalesce=coalesce)
+        latencies, errors = [], 0
+        lock = threading.Lock()
+
+        def session():
+            nonlocal errors
+            t = time.perf_counter()
+            try:
+                backend.get_balances(addrs)
+                with lock:
+                    latencies.append(time.perf_counter() - t)
+            except Exception:
+                with lock:
+                    errors += 1
+
+        t0 = time.perf_counter()
+        try:
+            for _ in range(rounds):
+                threads = [threading.Thread(target=session) for _ in range(sessions)]
+                for th in threads:
+                    th.start()
+                for th in threads:
+                    th.join()
+        finally:
+            server.stop()
+        results.append({"name": name, "requests": server.requests, "errors": errors,
+                        "seconds": time.perf_counter() - t0, "p50_ms": _percentile(latencies, 50) * 1000,
+                        "p95_ms": _percentile(latencies, 95) * 1000,
+                        "shared": backend.flight.stats["shared"] if backend.flight else 0})
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    p = argparse.ArgumentParser(description="Benchmark do agrupamento de consultas idênticas (single-flight)")
+    p.add_argument("--bench", action="store_true")
+    p.add_argument("--sessions", type=int, default=8, help="atualizações simultâneas dos mesmos saldos")
+    p.add_argument("--addresses", type=int, default=50)
+    p.add_argument("--rounds", type=int, default=3)
+    p.add_argument("--latency-ms", type=float, default=80.0)
+    args = p.parse_args()
+    if not args.bench:
+        p.print_help()
+    else:
+        print(f"{args.sessions} sessões x {args.addresses} endereços x {args.rounds} rodadas, "
+              f"latência {args.latency_ms:.0f} ms")
+        print(f"{'modo':<18} {'reqs':>6} {'agrup.':>7} {'erros':>6} {'seg':>6} {'p50 ms':>8} {'p95 ms':>8}")
+        for r in benchmark(args.sessions, args.addresses, args.rounds, args.latency_ms / 1000):
+            print(f"{r['name']:<18} {r['requests']:>6} {r['shared']:>7} {r['errors']:>6} {r['seconds']:>6.2f} "
+                  f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f}")
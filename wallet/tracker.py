@@ -0,0 +1,190 @@
+"""
+Acompanhamento de confirmações de muitas transações ao mesmo tempo.
+
+TxTracker segue uma lista de txids (ex.: pagamentos em lote) com custo baixo:
+  - o topo da chain é consultado uma vez por ciclo (tip_interval), não uma
+    vez por transação; as confirmações das já mineradas saem dele
+  - cada transação tem seu próprio intervalo de consulta de status, que dobra
+    enquanto nada muda (min_interval -> max_interval); quando o topo avança,
+    as do mempool são consultadas na hora (provavelmente entraram no bloco)
+  - backends em lote (electrum, bitcoind) consultam todas as vencidas numa
+    única ida e volta; no esplora vão em paralelo (network.fanout, com a
+    concorrência ajustada pelo limitador adaptativo do backend)
+
+Estados: "unknown" (a rede ainda não a viu), "mempool", "confirming" (minerada,
+menos de confirmations confirmações), "confirmed" (final) e "dropped" (final:
+sumiu do mempool por drop_checks consultas seguidas — RBF, expirou ou foi
+recusada — ou nunca apareceu em grace segundos). Cada mudança é entregue a
+on_update(entrada).
+"""
+from typing import Callable, Dict, Iterable, List, Optional
+import threading
+import time
+
+from wallet import network
+
+FINAL_STATES = ("confirmed", "dropped")
+
+
+class TxTracker:
+    def __init__(self, txids: Iterable[str] = (), confirmations: int = 1, min_interval: float = 5,
+                 max_interval: float = 600, tip_interval: float = 30, grace: float = 120,
+                 drop_checks: int = 2, workers: Optional[int] = None,
+                 on_update: Optional[Callable[[dict], None]] = None):
+        self.confirmations = confirmations
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.tip_interval = tip_interval
+        self.grace = grace
+        self.drop_checks = drop_checks
+        self.workers = workers
+        self.on_update = on_update
+        self.tip: Optional[int] = None
+        self._tip_at = 0.0
+        self._entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.stats = {"status_requests": 0, "tip_requests": 0, "errors": 0}
+        self.track(txids)
+
+    def track(self, txids: Iterable[str]) -> None:
+        now = time.time()
+        with self._lock:
+            for txid in txids:
+                txid = txid.strip().lower()
+                if len(txid) != 64 or any(c not in "0123456789abcdef" for c in txid):
+                    raise ValueError(f"TXID inválido: {txid}")
+                if txid not in self._entries:
+                    self._entries[txid] = {"txid": txid, "state": "unknown", "confirmations": 0,
+                                           "block_height": None, "added_at": now, "checked_at": None,
+                                           "checks": 0, "misses": 0, "error": None,
+                                           "interval": self.min_interval, "next_check": now}
+
+    def untrack(self, txid: str) -> None:
+        with self._lock:
+            self._entries.pop(txid, None)
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            return [dict(e) for e in self._entries.values()]
+
+    @property
+    def active(self) -> List[str]:
+        with self._lock:
+            return [t for t, e in self._entries.items() if e["state"] not in FINAL_STATES]
+
+    # ciclo
+
+    def _update_tip(self, now: float) -> bool:
+        """Consulta o topo se venceu tip_interval; True se ele avançou (ou recuou)."""
+        if now - self._tip_at < self.tip_interval:
+            return False
+        try:
+            tip = network.get_tip_height()
+        except Exception:
+            self.stats["errors"] += 1
+            self._tip_at = now - self.tip_interval + self.min_interval   # tenta de novo em min_interval
+            return False
+        finally:
+            self.stats["tip_requests"] += 1
+        self._tip_at = now
+        changed, self.tip = tip != self.tip, tip
+        return changed
+
+    def _fetch(self, txids: List[str]) -> Dict[str, object]:
+        """{txid: status, None (desconhecida) ou Exception}."""
+        self.stats["status_requests"] += 1 if network.get_backend().batched else len(txids)
+        if network.get_backend().batched:
+            try:
+                return network.get_tx_statuses(txids)
+            except Exception as e:
+                return {t: e for t in txids}
+
+        return dict(network.fanout(network.get_tx_status, txids, self.workers))
+
+    def step(self) -> float:
+        """
+        Um ciclo: topo (se venceu), status das transações vencidas e
+        confirmações de todas. Retorna em quantos segundos vence o próximo.
+        """
+        now = time.time()
+        tip_changed = self._update_tip(now)
+        with self._lock:
+            active = [e for e in self._entries.values() if e["state"] not in FINAL_STATES]
+            if tip_changed:
+                for e in active:
+                    if e["state"] in ("unknown", "mempool"):
+                        e["next_check"] = now
+            due = [e["txid"] for e in active if e["next_check"] <= now]
+
+        results = self._fetch(due) if due else {}
+        changed = {}
+        with self._lock:
+            for txid, status in results.items():
+                e = self._entries.get(txid)
+                if e is not None and self._apply(e, status, now):
+                    changed[txid] = e
+            for e in active:
+                if e["state"] == "confirming" and e["txid"] not in changed and self._recount(e):
+                    changed[e["txid"]] = e
+            pending = [e["next_check"] for e in self._entries.values() if e["state"] not in FINAL_STATES]
+            updates = [dict(e) for e in changed.values()]
+        for entry in updates:
+            if self.on_update:
+                self.on_update(entry)
+        if not pending:
+            return self.tip_interval
+        next_due = min(pending) - time.time()
+        return max(0.0, min(next_due, self._tip_at + self.tip_interval - time.time()))
+
+    def _recount(self, e: dict) -> bool:
+        """Confirmações a partir do topo; True se mudou o número ou o estado."""
+        confs = max(0, self.tip - e["block_height"] + 1) if self.tip is not None else 0
+        state = "confirmed" if confs >= self.confirmations else "confirming"
+        if confs == e["confirmations"] and state == e["state"]:
+            return False
+        e["confirmations"], e["state"] = confs, state
+        return True
+
+    def _apply(self, e: dict, status, now: float) -> bool:
+        old = (e["state"], e["confirmations"], e["error"])
+        e["checked_at"] = now
+        if isinstance(status, Exception):
+            self.stats["errors"] += 1
+            e["error"] = str(status)
+            e["interval"] = min(e["interval"] * 2, self.max_interval)
+            e["next_check"] = now + e["interval"]
+            return False
+        e["checks"] += 1
+        e["error"] = None
+
+        if status is None:
+            e["misses"] += 1
+            seen = e["state"] != "unknown"
+            if (seen and e["misses"] >= self.drop_checks) or (not seen and now - e["added_at"] >= self.grace):
+                e["state"], e["confirmations"], e["block_height"] = "dropped", 0, None
+            else:
+                # saiu do mempool? confirma logo na próxima consulta
+                e["interval"] = self.min_interval if seen else min(e["interval"] * 2, self.max_interval)
+        elif status.get("confirmed") and status.get("block_height") is not None:
+            e["misses"] = 0
+            e["block_height"] = int(status["block_height"])
+            if self.tip is None or self.tip < e["block_height"]:
+                self.tip = e["block_height"]
+            self._recount(e)
+            # já minerada: as confirmações vêm do topo; a consulta só detecta reorganizações
+            e["interval"] = self.max_interval
+        else:
+            e["misses"] = 0
+            e["state"], e["confirmations"], e["block_height"] = "mempool", 0, None
+            e["interval"] = self.min_interval if old[0] != "mempool" else min(e["interval"] * 2, self.max_interval)
+        e["next_check"] = now + e["interval"]
+        return (e["state"], e["confirmations"], e["error"]) != old
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        """Repete step() até todas as transações chegarem a um estado final (ou stop)."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            delay = self.step()
+            if not self.active:
+                break
+            stop.wait(delay)
@@ -1,18 +1,23 @@
-from typing import List, Dict, Tuple, Optional, Iterator
+from typing import List, Dict, Tuple, Optional, Iterator, Iterable
 import struct
 import json
 import requests
 import hashlib
 import os
-from wallet.network import get_utxos
-from wallet.keys import get_mnemonic
-from wallet.utils import load_wallet
+import time
+from wallet.network import broadcast_tx, get_utxos_many, stream_utxos_many
+from wallet.cache import check_inputs_unspent, load_utxo_cache
+from wallet.fees import resolve_fee_rate
+from wallet.ledger import apply_ledger, apply_ledger_spool, ledger_lock, record_broadcast, release_outpoints
+from wallet.ledger import RESERVATION_TTL, load_ledger, reserve_outpoints, reserved_outpoints
+from wallet.keys import get_mnemonic, bip32_master_key, derive_prv, parse_path, store_watch_only
+from wallet.utils import load_wallet, load_addresses
+from wallet.parallel import sign_digests_parallel
+from wallet.rawtx import decode_raw_tx, script_address
+from wallet.utxospool import UtxoSpool
+from wallet import blockscan, ec
 from btclib.mnemonic.bip39 import seed_from_mnemonic
-from btclib.bip32 import rootxprv_from_seed, derive, BIP32KeyData
-from btclib.to_pub_key import pub_keyinfo_from_key
 from btclib.hashes import hash160
-from btclib.ecc import dsa
-from btclib.ecc.dsa import ecdsa_sign_, Sig
 from btclib import b32
 
 API = "https://blockstream.info/testnet/api"
@@ -86,32 +91,67 @@ def serialize_script_pubkey(address: str) -> bytes:
     return bytes([0x00, 0x14]) + witprog
 
 
-def estimate_vbytes(n_inputs: int, n_outputs: int) -> int:
+# Tamanhos P2WPKH (bytes)
+INPUT_BASE_SIZE = 41            # outpoint (36) + scriptSig vazio (1) + sequence (4)
+OUTPUT_SIZE = 31                # valor (8) + len (1) + scriptPubKey (22)
+SIG_MAX_DER_SIZE = 71           # r com 33 bytes (R alto) e s low-S
+SIG_LOW_R_MAX_DER_SIZE = 70     # r < 2^255 garante r com no máximo 32 bytes
+
+def estimate_weight(n_inputs: int, n_outputs: int, low_r: bool = False) -> int:
     """
-    Estimativa simples para P2WPKH:
-      - input ~ 68 vbytes
-      - output ~ 31 vbytes
-      - overhead ~ 10 vbytes
-    Use apenas como estimativa para cálculo inicial de fee.
+    Peso (weight units) de uma transação P2WPKH com n_inputs/n_outputs.
+    Usa o maior tamanho possível de assinatura: com low_r=True as assinaturas
+    têm no máximo 71 bytes (70 DER + sighash) e o valor é exato na prática
+    (só sobra 1 byte quando r ou s cai abaixo de 2^248, ~1/128 por assinatura).
     """
-    return int(n_inputs * 68 + n_outputs * 31 + 10)
+    sig_size = (SIG_LOW_R_MAX_DER_SIZE if low_r else SIG_MAX_DER_SIZE) + 1  # + sighash
+    witness = 1 + 1 + sig_size + 1 + 33  # n itens + sig + pubkey comprimida
+    base = (4 + len(varint_encode(n_inputs)) + n_inputs * INPUT_BASE_SIZE
+            + len(varint_encode(n_outputs)) + n_outputs * OUTPUT_SIZE + 4)
+    return base * 4 + 2 + n_inputs * witness  # 2 = marker + flag
 
-def sats_for_fee(n_inputs: int, n_outputs: int, fee_rate: int) -> int:
-    vb = estimate_vbytes(n_inputs, n_outputs)
+def estimate_vbytes(n_inputs: int, n_outputs: int, low_r: bool = False) -> int:
+    """
+    Tamanho virtual (vbytes) de uma transação P2WPKH, arredondado para cima.
+    Com low_r=False é um limite superior (assinaturas de 71 ou 72 bytes com sighash).
+    """
+    return (estimate_weight(n_inputs, n_outputs, low_r) + 3) // 4
+
+def sats_for_fee(n_inputs: int, n_outputs: int, fee_rate: int, low_r: bool = False) -> int:
+    vb = estimate_vbytes(n_inputs, n_outputs, low_r)
     return vb * fee_rate
 
+def tx_vsize(signed_tx_hex: str, unsigned_tx: bytes) -> int:
+    """
+    vsize real de uma transação assinada: (3 * tamanho_sem_witness + tamanho_total) / 4.
+    """
+    weight = 3 * len(unsigned_tx) + len(signed_tx_hex) // 2
+    return (weight + 3) // 4
+
 DUST_P2WPKH = 546  
 
-def select_utxos(utxos: List[dict], amount_sats: int, fee_rate: int) -> Tuple[List[dict], int, int]:
+# nSequence dos inputs (cada input pode trazer o seu em "sequence")
+SEQUENCE_FINAL = 0xffffffff     # sem RBF
+SEQUENCE_RBF = 0xfffffffd       # sinaliza replace-by-fee (BIP125)
+DEFAULT_SEQUENCE = SEQUENCE_RBF
+
+def select_utxos(utxos: List[dict], amount_sats: int, fee_rate: int,
+                 low_r: bool = False) -> Tuple[List[dict], int, int]:
     """
     Seleciona UTXOs ordenando por valor ascendente até cobrir amount + fee estimada.
+    Usa primeiro os confirmados; só se não bastarem entram os não confirmados
+    (ex.: troco pendente registrado no ledger).
     Retorna (selected_utxos, total_sats, fee_estimated)
     """
-    usable = [u for u in utxos if u.get("status", {}).get("confirmed", False)]
-    if not usable:
-        usable = utxos[:]
-    usable.sort(key=lambda u: u["value"])
+    usable = sorted(utxos, key=lambda u: (not u.get("status", {}).get("confirmed", False), u["value"]))
+    return select_sorted_utxos(usable, amount_sats, fee_rate, low_r)
 
+def select_sorted_utxos(usable: Iterable[dict], amount_sats: int, fee_rate: int,
+                        low_r: bool = False) -> Tuple[List[dict], int, int]:
+    """
+    A seleção de select_utxos sobre UTXOs já na ordem (ex.: UtxoSpool.iter_sorted):
+    consome o iterável só até cobrir o valor.
+    """
     selected = []
     total = 0
     target_outputs = 2  # inicialmente: to + change
@@ -119,28 +159,31 @@ def select_utxos(utxos: List[dict], amount_sats: int, fee_rate: int) -> Tuple[Li
     for u in usable:
         selected.append(u)
         total += u["value"]
-        fee_est = sats_for_fee(len(selected), target_outputs, fee_rate)
+        fee_est = sats_for_fee(len(selected), target_outputs, fee_rate, low_r)
         if total >= amount_sats + fee_est:
             return selected, total, fee_est
 
-    fee_est = sats_for_fee(len(selected), target_outputs, fee_rate)
+    fee_est = sats_for_fee(len(selected), target_outputs, fee_rate, low_r)
     return [], total, fee_est
 
 # ---------------------------
 # Wallet helpers (derivation)
 # ---------------------------
 
+def load_address_index() -> Dict[str, str]:
+    """
+    Mapa endereço -> derivation path de todos os endereços da carteira (wallet.json).
+    """
+    w = load_wallet()
+    return {a["address"]: a["path"] for a in w.get("addresses", {}).values()}
+
 def get_address_path(address: str) -> Optional[str]:
     """
     Busca o derivation path de um endereço na carteira (wallet.json).
     Retorna o path ex.: "m/84'/1'/0'/0/0" ou None.
     """
     try:
-        w = load_wallet()
-        for idx, addr_data in w.get("addresses", {}).items():
-            if addr_data.get("address") == address:
-                return addr_data.get("path")
-        return None
+        return load_address_index().get(address)
     except Exception:
         return None
 
@@ -158,13 +201,8 @@ def derive_private_key_ctx(address: str, password: str) -> Tuple[str, SensitiveB
     seed = seed_from_mnemonic(mnemonic, passphrase="")
 
     try:
-        rootxprv = rootxprv_from_seed(seed)
-        child_xprv_str = derive(rootxprv, path)
-        child_xprv = BIP32KeyData.b58decode(child_xprv_str)
-        raw = child_xprv.key 
-        if not (isinstance(raw, (bytes, bytearray)) and len(raw) == 33 and raw[0] == 0x00):
-            raise ValueError("Formato inesperado de chave XPRV.key")
-        prv_ctx = SensitiveBytes(raw[1:])
+        prv, _ = derive_prv(bip32_master_key(seed), path)
+        prv_ctx = SensitiveBytes(prv)
         return path, prv_ctx
     finally:
 
@@ -178,11 +216,146 @@ def derive_private_key_ctx(address: str, password: str) -> Tuple[str, SensitiveB
         except Exception:
             pass
         try:
-            del rootxprv
-            del child_xprv
+            del prv
         except Exception:
             pass
 
+
+class KeyIndex:
+    """
+    Índice path -> (chave privada, pubkey) aberto com um único unlock da carteira.
+    A mnemonic é descriptografada uma vez; cada path é derivado na primeira vez
+    que é pedido e fica em cache até close(), que zeroiza (best-effort) as
+    chaves, o nó mestre e os nós pais, todos guardados em bytearray.
+    Os nós pais (ex.: m/84'/1'/0'/0) também ficam em cache, então cada novo
+    endereço custa só um passo de derivação.
+    Use assim:
+        with KeyIndex(password) as keys:
+            prv, pub = keys.key_for(path)
+    """
+    def __init__(self, password: str):
+        mnemonic = get_mnemonic(password)
+        seed = seed_from_mnemonic(mnemonic, passphrase="")
+        try:
+            prv, chain_code = bip32_master_key(seed)
+            self._master: Optional[Tuple[bytearray, bytearray]] = (bytearray(prv), bytearray(chain_code))
+            # carteiras antigas: grava a xpub da conta para os PSBTs sem senha
+            store_watch_only(self._master)
+            del prv, chain_code
+        finally:
+            try:
+                del mnemonic
+                seed_ba = bytearray(seed)
+                secure_zeroize(seed_ba)
+                del seed_ba
+                del seed
+            except Exception:
+                pass
+        self._nodes: Dict[str, Tuple[bytearray, bytearray]] = {}
+        self._keys: Dict[str, Tuple[bytearray, bytes]] = {}
+
+    def _node(self, path: str) -> Tuple[bytearray, bytearray]:
+        if path == "m":
+            return self._master
+        if path not in self._nodes:
+            parent, _, last = path.rpartition("/")
+            prv, chain_code = derive_prv(self._node(parent), f"m/{last}")
+            self._nodes[path] = (bytearray(prv), bytearray(chain_code))
+            del prv, chain_code
+        return self._nodes[path]
+
+    def key_for(self, path: str) -> Tuple[bytearray, bytes]:
+        """
+        Retorna (chave privada de 32 bytes, pubkey comprimida) para o path.
+        """
+        if self._master is None:
+            raise RuntimeError("KeyIndex já foi fechado.")
+        if path not in self._keys:
+            parse_path(path)  # valida o formato antes de derivar
+            parent, _, last = path.rpartition("/")
+            prv, _ = derive_prv(self._node(parent), f"m/{last}")
+            pub_key = ec.pubkey_from_privkey(prv)
+            if not (len(pub_key) == 33 and pub_key[0] in (0x02, 0x03)):
+                raise ValueError("Chave pública obtida não está em formato comprimido (33 bytes).")
+            self._keys[path] = (bytearray(prv), pub_key)
+            del prv
+        return self._keys[path]
+
+    def close(self) -> None:
+        for prv, _ in self._keys.values():
+            secure_zeroize(prv)
+        for prv, chain_code in self._nodes.values():
+            secure_zeroize(prv)
+            secure_zeroize(chain_code)
+        if self._master is not None:
+            secure_zeroize(self._master[0])
+            secure_zeroize(self._master[1])
+        self._keys = {}
+        self._nodes = {}
+        self._master = None
+
+    def __enter__(self) -> "KeyIndex":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def get_wallet_utxos(addresses: Optional[List[str]] = None) -> List[dict]:
+    """
+    Busca os UTXOs dos endereços informados (padrão: todos os da carteira).
+    Cada UTXO é anotado com "address" e "path" do endereço dono, para que a
+    assinatura resolva a chave de cada input pelo KeyIndex.
+    O resultado já passa pelo ledger de pendentes: sem os outpoints gastos por
+    transações nossas ainda não vistas pela API e com o troco pendente.
+    Com a varredura de blocos ativa (blockscan.enabled) os UTXOs vêm do
+    armazém local, atualizado pelos blocos novos.
+    """
+    index = load_address_index()
+    if addresses is None:
+        addresses = list(index)
+
+    for addr in addresses:
+        if not index.get(addr):
+            raise ValueError(f"Endereço {addr} não encontrado na carteira")
+    by_address = blockscan.wallet_utxos(addresses) if blockscan.enabled() else get_utxos_many(addresses)
+
+    utxos = []
+    for addr, us in apply_ledger(by_address).items():
+        for u in us:
+            u = dict(u)
+            u["address"] = addr
+            u["path"] = index[addr]
+            utxos.append(u)
+    return utxos
+
+def spool_wallet_utxos(addresses: Optional[List[str]] = None) -> UtxoSpool:
+    """
+    Como get_wallet_utxos, num UtxoSpool (sqlite temporário) em vez de uma
+    lista: no esplora os UTXOs de cada endereço vêm do stream e são gravados
+    em lotes, com memória limitada mesmo com dezenas de milhares de UTXOs por
+    endereço. Feche o spool (with) depois da seleção.
+    """
+    index = load_address_index()
+    if addresses is None:
+        addresses = list(index)
+
+    for addr in addresses:
+        if not index.get(addr):
+            raise ValueError(f"Endereço {addr} não encontrado na carteira")
+    spool = UtxoSpool(index)
+    try:
+        if blockscan.enabled():
+            for addr, us in blockscan.wallet_utxos(addresses).items():
+                spool.add(addr, us)
+        else:
+            stream_utxos_many(addresses, spool.add)
+        apply_ledger_spool(spool)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
 # ---------------------------
 # Construção de transações
 # ---------------------------
@@ -199,7 +372,7 @@ def build_unsigned_tx(inputs: List[dict], outputs: Dict[str, int]) -> bytes:
         tx += txid_bytes
         tx += struct.pack('<I', inp['vout'])
         tx += b'\x00'  # scriptSig length = 0
-        tx += b'\xff\xff\xff\xff'  # sequence
+        tx += struct.pack('<I', inp.get('sequence', DEFAULT_SEQUENCE))  # sequence
     tx += varint_encode(len(outputs))
     for addr, amount in outputs.items():
         tx += struct.pack('<Q', amount)
@@ -209,26 +382,46 @@ def build_unsigned_tx(inputs: List[dict], outputs: Dict[str, int]) -> bytes:
     tx += b'\x00\x00\x00\x00'  # locktime
     return tx
 
+def bip143_hashes(inputs: List[dict], outputs: Dict[str, int]) -> Tuple[bytes, bytes, bytes]:
+    """
+    Calcula (hashPrevouts, hashSequence, hashOutputs) do BIP143.
+    Com SIGHASH_ALL eles são iguais para todos os inputs, então basta calcular
+    uma vez por transação (evita custo O(n²) em transações com muitos inputs).
+    """
+    prevouts = b''.join(bytes.fromhex(inp['txid'])[::-1] + struct.pack('<I', inp['vout'])
+                        for inp in inputs)
+    sequences = b''.join(struct.pack('<I', inp.get('sequence', DEFAULT_SEQUENCE)) for inp in inputs)
+
+    outputs_ser = b''
+    for addr, amt in outputs.items():
+        outputs_ser += struct.pack('<Q', amt)
+        script_pubkey = serialize_script_pubkey(addr)
+        outputs_ser += varint_encode(len(script_pubkey))
+        outputs_ser += script_pubkey
+
+    return hash256(prevouts), hash256(sequences), hash256(outputs_ser)
+
 def build_witness_commitment(input_idx: int, inputs: List[dict], outputs: Dict[str, int],
-                             amount: int, script_code: bytes) -> bytes:
+                             amount: int, script_code: bytes,
+                             hashes: Optional[Tuple[bytes, bytes, bytes]] = None,
+                             version: int = 2, locktime: int = 0) -> bytes:
     """
     Constrói a mensagem a ser hasheada segundo BIP143 para SegWit v0.
+    hashes: resultado de bip143_hashes() já calculado (opcional).
+    version/locktime: os da transação (as que a carteira monta usam 2 e 0).
     """
+    if hashes is None:
+        hashes = bip143_hashes(inputs, outputs)
+    hash_prevouts, hash_sequence, hash_outputs = hashes
+
     # nVersion
-    commit = struct.pack('<I', 2)
+    commit = struct.pack('<I', version)
 
     # hashPrevouts
-    prevouts = b''
-    for inp in inputs:
-        prevouts += bytes.fromhex(inp['txid'])[::-1]
-        prevouts += struct.pack('<I', inp['vout'])
-    commit += hash256(prevouts)
+    commit += hash_prevouts
 
     # hashSequence
-    sequences = b''
-    for _ in inputs:
-        sequences += b'\xff\xff\xff\xff'
-    commit += hash256(sequences)
+    commit += hash_sequence
 
     # outpoint (current input)
     cur = inputs[input_idx]
@@ -243,93 +436,139 @@ def build_witness_commitment(input_idx: int, inputs: List[dict], outputs: Dict[s
     commit += struct.pack('<Q', amount)
 
     # nSequence
-    commit += b'\xff\xff\xff\xff'
+    commit += struct.pack('<I', cur.get('sequence', DEFAULT_SEQUENCE))
 
     # hashOutputs
-    outputs_ser = b''
-    for addr, amt in outputs.items():
-        outputs_ser += struct.pack('<Q', amt)
-        script_pubkey = serialize_script_pubkey(addr)
-        outputs_ser += varint_encode(len(script_pubkey))
-        outputs_ser += script_pubkey
-    commit += hash256(outputs_ser)
+    commit += hash_outputs
 
     # nLocktime
-    commit += b'\x00\x00\x00\x00'
+    commit += struct.pack('<I', locktime)
 
     # sighash type (SIGHASH_ALL)
     commit += struct.pack('<I', 1)
 
     return commit
 
+def segwit_sighash(input_idx: int, inputs: List[dict], outputs: Dict[str, int], pub_key: bytes,
+                   hashes: Optional[Tuple[bytes, bytes, bytes]] = None,
+                   version: int = 2, locktime: int = 0) -> bytes:
+    """
+    Sighash BIP143 (SIGHASH_ALL) de um input P2WPKH.
+    """
+    pubkey_hash = hash160(pub_key)
+    script_code = bytes([0x76, 0xa9, 0x14]) + pubkey_hash + bytes([0x88, 0xac])
+
+    amount = inputs[input_idx]['value']
+    commit = build_witness_commitment(input_idx, inputs, outputs, amount, script_code, hashes,
+                                      version, locktime)
+    return hash256(commit)
+
 # ---------------------------
 # Assinatura do input (SegWit)
 # ---------------------------
 
+# Abaixo disso o custo de subir o pool de processos supera o ganho
+PARALLEL_MIN_INPUTS = 32
+
 def sign_input_segwit(input_idx: int, inputs: List[dict], outputs: Dict[str, int],
-                      from_address: str, password: str) -> Tuple[bytes, bytes]:
+                      keys: KeyIndex,
+                      hashes: Optional[Tuple[bytes, bytes, bytes]] = None,
+                      low_r: bool = False) -> Tuple[bytes, bytes]:
     """
     Assina um input SegWit (P2WPKH) e retorna (sig_der_with_sighash, pubkey_compressed).
-    Usa derive_private_key_ctx para manter chave privada mutável e zeroizá-la após uso.
+    A chave é resolvida pelo "path" do input através do KeyIndex.
+    low_r=True faz grinding até r < 2^255 (assinatura de no máximo 71 bytes com sighash).
     """
+    path = inputs[input_idx].get("path")
+    if not path:
+        raise ValueError(f"Input {input_idx} sem derivation path")
 
-    path, prv_ctx = derive_private_key_ctx(from_address, password)
-    try:
-        mnemonic = get_mnemonic(password)
-        seed = seed_from_mnemonic(mnemonic, passphrase="")
-        rootxprv = rootxprv_from_seed(seed)
-        child_xprv = derive(rootxprv, path)
-        pub_key = pub_keyinfo_from_key(child_xprv)[0]
-
-        if not (len(pub_key) == 33 and pub_key[0] in (0x02, 0x03)):
-            raise ValueError("Chave pública obtida não está em formato comprimido (33 bytes).")
-
-        pubkey_hash = hash160(pub_key)
-        script_code = bytes([0x76, 0xa9, 0x14]) + pubkey_hash + bytes([0x88, 0xac])
-
-        amount = inputs[input_idx]['value']
-        commit = build_witness_commitment(input_idx, inputs, outputs, amount, script_code)
-        sighash = hash256(commit)
+    prv_buf, pub_key = keys.key_for(path)
+    sighash = segwit_sighash(input_idx, inputs, outputs, pub_key, hashes)
 
-        with prv_ctx as prv_buf:
-            priv_bytes = bytes(prv_buf) 
-            sig_der_bytes = ecdsa_sign_(sighash, priv_bytes)
-        
-        sig_der = sig_der_bytes + b'\x01'
+    if low_r:
+        sig_der_bytes = ec.sign_low_r(sighash, bytes(prv_buf))
+    else:
+        sig_der_bytes = ec.sign(sighash, bytes(prv_buf))
+    sig_der = sig_der_bytes + b'\x01'
 
-        return sig_der, pub_key
-    finally:
+    return sig_der, pub_key
 
-        try:
-            del mnemonic
-            seed_ba = bytearray(seed)
-            secure_zeroize(seed_ba)
-            del seed_ba
-            del seed
-        except Exception:
-            pass
-        try:
-            del rootxprv
-            del child_xprv
-        except Exception:
-            pass
-        try:
-            secure_zeroize(prv_ctx._buf)
-            prv_ctx._buf = bytearray()
-        except Exception:
-            pass
+def sign_inputs_segwit(inputs: List[dict], outputs: Dict[str, int], keys: KeyIndex,
+                       workers: Optional[int] = None, low_r: bool = False) -> List[Tuple[bytes, bytes]]:
+    """
+    Assina todos os inputs e retorna [(sig_der_with_sighash, pubkey_compressed), ...].
+    Com workers > 1 e transação grande (>= PARALLEL_MIN_INPUTS inputs), os sighashes
+    são calculados aqui e as assinaturas são distribuídas num pool de processos
+    (ver wallet.parallel). O resultado é idêntico ao serial (nonce RFC6979).
+    """
+    hashes = bip143_hashes(inputs, outputs)
+
+    if not workers or workers <= 1 or len(inputs) < PARALLEL_MIN_INPUTS:
+        return [sign_input_segwit(i, inputs, outputs, keys, hashes, low_r) for i in range(len(inputs))]
+
+    slots: Dict[str, int] = {}
+    prv_keys: List[bytearray] = []
+    pub_keys: List[bytes] = []
+    key_ids: List[int] = []
+    sighashes: List[bytes] = []
+    for i, inp in enumerate(inputs):
+        path = inp.get("path")
+        if not path:
+            raise ValueError(f"Input {i} sem derivation path")
+        if path not in slots:
+            prv_buf, pub_key = keys.key_for(path)
+            slots[path] = len(prv_keys)
+            prv_keys.append(prv_buf)
+            pub_keys.append(pub_key)
+        key_ids.append(slots[path])
+        sighashes.append(segwit_sighash(i, inputs, outputs, pub_keys[slots[path]], hashes))
+
+    sigs = sign_digests_parallel(sighashes, key_ids, prv_keys, workers, low_r)
+    return [(sig + b'\x01', pub_keys[k]) for sig, k in zip(sigs, key_ids)]
 
 # ---------------------------
 # Montagem final da transação assinada (SegWit)
 # ---------------------------
 
+def resolve_input_paths(inputs: List[dict]) -> List[dict]:
+    """
+    Garante que cada input tenha "address" e "path" (busca o path no wallet.json
+    quando só o endereço foi informado).
+    """
+    index = None
+    resolved = []
+    for i, inp in enumerate(inputs):
+        if not inp.get("path"):
+            if not inp.get("address"):
+                raise ValueError(f"Input {i} sem endereço nem derivation path")
+            if index is None:
+                index = load_address_index()
+            path = index.get(inp["address"])
+            if not path:
+                raise ValueError(f"Endereço {inp['address']} não encontrado na carteira")
+            inp = dict(inp, path=path)
+        resolved.append(inp)
+    return resolved
+
 def build_signed_segwit_tx(inputs: List[dict], outputs: Dict[str, int],
-                           from_address: str, password: str) -> str:
+                           password: Optional[str] = None,
+                           keys: Optional[KeyIndex] = None,
+                           workers: Optional[int] = None, low_r: bool = False) -> str:
     """
     Constrói transação SegWit com witness assinado para cada input.
+    Cada input carrega o "address"/"path" do dono, então inputs de vários
+    endereços da carteira podem ser gastos juntos. Informe a senha (a carteira
+    é aberta uma única vez) ou um KeyIndex já aberto.
+    workers > 1 ativa a assinatura paralela para transações grandes.
+    low_r=True gera só assinaturas low-R (vsize igual ao estimate_vbytes(low_r=True)).
     Retorna hex da transação.
-    OBS: atualmente assume que todos os inputs pertencem ao mesmo from_address.
     """
+    if keys is None and password is None:
+        raise ValueError("Informe a senha ou um KeyIndex para assinar.")
+
+    inputs = resolve_input_paths(inputs)
+
     raw = b''
     raw += struct.pack('<I', 2)  # version
     raw += b'\x00\x01'  # marker + flag (segwit)
@@ -340,7 +579,7 @@ def build_signed_segwit_tx(inputs: List[dict], outputs: Dict[str, int],
         raw += bytes.fromhex(inp['txid'])[::-1]
         raw += struct.pack('<I', inp['vout'])
         raw += b'\x00'  # scriptSig len
-        raw += b'\xff\xff\xff\xff'
+        raw += struct.pack('<I', inp.get('sequence', DEFAULT_SEQUENCE))
 
     # outputs
     raw += varint_encode(len(outputs))
@@ -351,32 +590,59 @@ def build_signed_segwit_tx(inputs: List[dict], outputs: Dict[str, int],
         raw += script_pubkey
 
     # witness para cada input
-    for i in range(len(inputs)):
-        sig_der, pub_key = sign_input_segwit(i, inputs, outputs, from_address, password)
-        raw += varint_encode(2)  # número de stack items
-        raw += varint_encode(len(sig_der))
-        raw += sig_der
-        raw += varint_encode(len(pub_key))
-        raw += pub_key
+    own_keys = keys is None
+    if own_keys:
+        keys = KeyIndex(password)
+    try:
+        for sig_der, pub_key in sign_inputs_segwit(inputs, outputs, keys, workers, low_r):
+            raw += varint_encode(2)  # número de stack items
+            raw += varint_encode(len(sig_der))
+            raw += sig_der
+            raw += varint_encode(len(pub_key))
+            raw += pub_key
+    finally:
+        if own_keys:
+            keys.close()
 
     # locktime
     raw += b'\x00\x00\x00\x00'
     return raw.hex()
 
 
-def build_and_sign_tx(from_address: str, to_address: str, amount_sats: int,
-                      password: str, fee_rate: int = 5, change_address: Optional[str] = None) -> Dict:
+def prepare_tx(from_address: Optional[str], to_address: str, amount_sats: int,
+               fee_rate: Optional[int], change_address: Optional[str] = None, low_r: bool = False,
+               rbf: bool = True, reserve: bool = False) -> Dict:
     """
-    Constrói e assina transação pronta para broadcast (mas não broadcasta).
-    Retorna dict com signed_tx_hex, txid (calculado sem witness), vbytes, fee estimado e metadados.
+    Busca UTXOs, seleciona os inputs e monta os outputs (destino + troco).
+    from_address=None usa os UTXOs de todos os endereços da carteira.
+    rbf=True (padrão) marca os inputs com nSequence que sinaliza replace-by-fee.
+    reserve=True ignora moedas reservadas por outras seleções e reserva as
+    escolhidas no ledger (libere com release_outpoints se o envio falhar).
+    fee_rate=None usa a taxa estimada pela API (wallet.fees).
+    Retorna dict com inputs, outputs, total, fee estimada, taxa, troco e endereço de troco.
     """
-    utxos = get_utxos(from_address)
-    if not utxos:
-        raise RuntimeError("Nenhum UTXO encontrado para este endereço.")
-
-    selected, total_sel, fee_est = select_utxos(utxos, amount_sats, fee_rate)
-    if not selected:
-        raise RuntimeError(f"Saldo insuficiente: disponível {total_sel} sats; necessário ~{amount_sats + fee_est} sats.")
+    fee_rate = resolve_fee_rate(fee_rate)
+
+    # UTXOs em disco e seleção pelo índice: memória limitada com endereços enormes
+    with spool_wallet_utxos([from_address] if from_address else None) as spool:
+        if not len(spool):
+            raise RuntimeError("Nenhum UTXO encontrado para este endereço." if from_address
+                               else "Nenhum UTXO encontrado na carteira.")
+
+        with ledger_lock():
+            held = 0
+            if reserve:
+                held = spool.total()
+                spool.discard(reserved_outpoints())
+                held -= spool.total()
+            selected, total_sel, fee_est = select_sorted_utxos(spool.iter_sorted(), amount_sats, fee_rate, low_r)
+            if not selected:
+                msg = f"Saldo insuficiente: disponível {total_sel} sats; necessário ~{amount_sats + fee_est} sats."
+                if held:
+                    msg += f" Outros {held} sats estão reservados por envios em andamento (ou assinados sem broadcast)."
+                raise RuntimeError(msg)
+            if reserve:
+                reserve_outpoints(selected)
 
     # calcular change
     change = total_sel - amount_sats - fee_est
@@ -388,97 +654,188 @@ def build_and_sign_tx(from_address: str, to_address: str, amount_sats: int,
             change = 0
         else:
             if not change_address:
-                change_address = from_address
+                change_address = from_address or load_addresses()[1][-1]
             outputs[change_address] = change
 
-    inputs = [{"txid": u["txid"], "vout": u["vout"], "value": u["value"]} for u in selected]
+    sequence = SEQUENCE_RBF if rbf else SEQUENCE_FINAL
+    inputs = [{"txid": u["txid"], "vout": u["vout"], "value": u["value"],
+               "address": u["address"], "path": u["path"], "sequence": sequence} for u in selected]
 
-    signed_hex = build_signed_segwit_tx(inputs, outputs, from_address, password)
+    return {
+        "inputs": inputs,
+        "outputs": outputs,
+        "total_input": total_sel,
+        "fee_est": fee_est,
+        "fee_rate": fee_rate,
+        "change": change,
+        "change_address": change_address if change > 0 else None,
+    }
+
+
+def build_and_sign_tx(from_address: Optional[str], to_address: str, amount_sats: int,
+                      password: str, fee_rate: Optional[int] = None, change_address: Optional[str] = None,
+                      workers: Optional[int] = None, low_r: bool = False, rbf: bool = True) -> Dict:
+    """
+    Constrói e assina transação pronta para broadcast (mas não broadcasta).
+    from_address=None gasta UTXOs de todos os endereços da carteira.
+    Retorna dict com signed_tx_hex, txid (calculado sem witness), vbytes, fee estimado e metadados.
+    """
+    prep = prepare_tx(from_address, to_address, amount_sats, fee_rate, change_address, low_r, rbf)
+    inputs, outputs = prep["inputs"], prep["outputs"]
 
-    vbytes = estimate_vbytes(len(inputs), len(outputs))
-    fee_final = vbytes * fee_rate
+    signed_hex = build_signed_segwit_tx(inputs, outputs, password, workers=workers, low_r=low_r)
 
-    txid = hash256(build_unsigned_tx(inputs, outputs))[::-1].hex()
+    return _signed_tx_summary(signed_hex, inputs, outputs, from_address, to_address,
+                              amount_sats, prep["change_address"], low_r)
+
+def _signed_tx_summary(signed_hex: str, inputs: List[dict], outputs: Dict[str, int],
+                       from_address: Optional[str], to_address: str, amount_sats: int,
+                       change_address: Optional[str], low_r: bool) -> Dict:
+    """
+    Dict de resumo de uma transação assinada (formato retornado por build_and_sign_tx).
+    """
+    unsigned = build_unsigned_tx(inputs, outputs)
+    vbytes = tx_vsize(signed_hex, unsigned)
+    total_input = sum(inp["value"] for inp in inputs)
+    fee_final = total_input - sum(outputs.values())
+
+    txid = hash256(unsigned)[::-1].hex()
 
     return {
         "signed_tx_hex": signed_hex,
         "txid": txid,
         "from_address": from_address,
+        "from_addresses": sorted({inp["address"] for inp in inputs}),
         "to_address": to_address,
         "amount_sats": amount_sats,
         "fee_sats": fee_final,
-        "change_sats": change,
-        "change_address": change_address if change > 0 else None,
+        "change_sats": outputs.get(change_address, 0) if change_address else 0,
+        "change_address": change_address,
         "inputs": len(inputs),
         "outputs": len(outputs),
         "vbytes": vbytes,
-        "total_input": total_sel,
+        "estimated_vbytes": estimate_vbytes(len(inputs), len(outputs), low_r),
+        "low_r": low_r,
+        "rbf": any(inp.get("sequence", DEFAULT_SEQUENCE) < SEQUENCE_FINAL - 1 for inp in inputs),
+        "total_input": total_input,
         "network": "testnet"
     }
 
-def build_tx_plan(from_address: str, to_address: str, amount_sats: int, fee_rate: int = 5,
-                  change_address: Optional[str] = None) -> Dict:
+def build_tx_plan(from_address: Optional[str], to_address: str, amount_sats: int,
+                  fee_rate: Optional[int] = None,
+                  change_address: Optional[str] = None, low_r: bool = False, rbf: bool = True) -> Dict:
     """
-    Cria um plano de transação (não assinado) e salva em tx_plan.json.
+    Cria um plano de transação (não assinado). Quem chama decide onde salvar
+    (ex.: cmd_create_tx grava em tx_plan.json); assine depois com sign_tx_plan().
+    from_address=None usa UTXOs de todos os endereços da carteira.
+    low_r=True planeja assinaturas low-R: o vsize estimado é o vsize final.
     """
-    utxos = get_utxos(from_address)
-    if not utxos:
-        raise RuntimeError("Nenhum UTXO encontrado para este endereço.")
+    prep = prepare_tx(from_address, to_address, amount_sats, fee_rate, change_address, low_r, rbf)
+    inputs, outputs = prep["inputs"], prep["outputs"]
 
-    selected, total_sel, fee_est = select_utxos(utxos, amount_sats, fee_rate)
-    if not selected:
-        raise RuntimeError(f"Saldo insuficiente: disponível {total_sel} sats; necessário ~{amount_sats + fee_est} sats.")
-
-    change = total_sel - amount_sats - fee_est
-    outputs = {to_address: amount_sats}
-    if change > 0:
-        if change < DUST_P2WPKH:
-            fee_est += change
-            change = 0
-        else:
-            if not change_address:
-                change_address = from_address
-            outputs[change_address] = change
-
-    inputs = [{"txid": u["txid"], "vout": u["vout"], "value": u["value"]} for u in selected]
     n_out = len(outputs)
-    vbytes = estimate_vbytes(len(inputs), n_out)
-    fee_final = vbytes * fee_rate
+    vbytes = estimate_vbytes(len(inputs), n_out, low_r)
+    fee_final = prep["total_input"] - sum(outputs.values())
 
     plan = {
         "from_address": from_address,
+        "from_addresses": sorted({inp["address"] for inp in inputs}),
         "to_address": to_address,
         "amount_sats": amount_sats,
-        "fee_rate_sats_vb": fee_rate,
+        "fee_rate_sats_vb": prep["fee_rate"],
         "inputs": inputs,
         "outputs": outputs,
         "estimated_vbytes": vbytes,
         "estimated_fee_sats": fee_final,
-        "change_sats": outputs.get(change_address, 0) if change > 0 else 0,
-        "change_address": change_address if change > 0 else None,
+        "low_r": low_r,
+        "rbf": rbf,
+        "change_sats": prep["change"],
+        "change_address": prep["change_address"],
         "network": "testnet",
-        "note": "Plano não assinado. Use build_and_sign_tx() para assinar localmente."
+        "note": "Plano não assinado. Assine com: wowlie sign --plan <arquivo>"
     }
 
-    with open("tx_plan.json", "w") as f:
-        json.dump(plan, f, indent=2)
+    return plan
 
+def load_tx_plan(path: str) -> Dict:
+    """
+    Lê e valida um plano salvo por create-tx (inputs, outputs e taxa consistentes).
+    """
+    with open(path) as f:
+        plan = json.load(f)
+
+    if plan.get("network", "testnet") != "testnet":
+        raise ValueError(f"Plano para rede não suportada: {plan.get('network')}")
+    inputs = plan.get("inputs") or []
+    outputs = plan.get("outputs") or {}
+    if not inputs or not outputs:
+        raise ValueError("Plano sem inputs ou outputs.")
+    for i, inp in enumerate(inputs):
+        if not all(k in inp for k in ("txid", "vout", "value")):
+            raise ValueError(f"Input {i} do plano incompleto (txid, vout, value).")
+    if any(not isinstance(v, int) or v <= 0 for v in outputs.values()):
+        raise ValueError("Plano com valor de output inválido.")
+
+    fee = sum(inp["value"] for inp in inputs) - sum(outputs.values())
+    if fee < 0:
+        raise ValueError("Plano inválido: outputs somam mais que os inputs.")
+    if "estimated_fee_sats" in plan and plan["estimated_fee_sats"] != fee:
+        raise ValueError(f"Plano inconsistente: taxa declarada {plan['estimated_fee_sats']} sats, "
+                         f"inputs - outputs = {fee} sats.")
     return plan
 
+def sign_tx_plan(plan: Dict, password: Optional[str] = None, keys: Optional[KeyIndex] = None,
+                 workers: Optional[int] = None, check_unspent: bool = True) -> Dict:
+    """
+    Assina exatamente os inputs/outputs de um plano (sem buscar nem reselecionar
+    UTXOs, sem rede). Com check_unspent, confere no cache local de UTXOs que os
+    inputs do plano ainda não foram gastos.
+    Retorna o mesmo formato de build_and_sign_tx.
+    """
+    inputs = resolve_input_paths(plan["inputs"])
+    outputs = {addr: int(v) for addr, v in plan["outputs"].items()}
+
+    if check_unspent:
+        spent, _ = check_inputs_unspent(inputs)
+        if spent:
+            raise RuntimeError("Inputs do plano já gastos (segundo o cache de UTXOs): " + ", ".join(spent))
+
+    low_r = bool(plan.get("low_r", False))
+    signed_hex = build_signed_segwit_tx(inputs, outputs, password, keys, workers=workers, low_r=low_r)
+
+    return _signed_tx_summary(signed_hex, inputs, outputs, plan.get("from_address"),
+                              plan.get("to_address"), plan.get("amount_sats"),
+                              plan.get("change_address"), low_r)
+
+def record_signed_tx(txid: str, signed_tx_hex: str) -> bool:
+    """
+    Registra no ledger de pendentes uma transação transmitida a partir de um
+    hex pronto (broadcast externo, send sem broadcast enviado depois): inputs
+    e outputs vêm do próprio hex; o endereço de cada input, do cache de UTXOs
+    ou dos outputs pendentes do ledger. Retorna False (nada registrado) se a
+    transação não gasta nem recebe nada da carteira.
+    """
+    tx = decode_raw_tx(bytes.fromhex(signed_tx_hex.strip()))
+    owned = load_address_index()
+    owners = {(u["txid"], u["vout"]): addr for addr, entry in load_utxo_cache().items() for u in entry["utxos"]}
+    owners.update({(o["txid"], o["vout"]): o["address"]
+                   for e in load_ledger()["txs"].values() for o in e["outputs"]})
+    inputs = [{"txid": i["txid"], "vout": i["vout"], "address": owners.get((i["txid"], i["vout"]))}
+              for i in tx["vin"]]
+    outputs = [(script_address(bytes.fromhex(o["scriptpubkey"])), o["value"]) for o in tx["vout"]]
+    if not any(i["address"] in owned for i in inputs) and not any(a in owned for a, _ in outputs):
+        return False
+    record_broadcast(txid, inputs, outputs, owned)
+    return True
+
+
 def broadcast_tx_hex(signed_tx_hex: str) -> str:
     """
-    Publica um TX HEX ASSINADO na Blockstream testnet.
+    Publica um TX HEX ASSINADO pelo backend de rede ativo (wallet.network).
     Retorna o txid (hex).
     """
     try:
-        r = requests.post(
-            f"{API}/tx", 
-            data=signed_tx_hex.strip(), 
-            headers={"Content-Type": "text/plain"}, 
-            timeout=30
-        )
-        r.raise_for_status()
-        return r.text.strip()
+        return broadcast_tx(signed_tx_hex.strip())
     except requests.exceptions.HTTPError as e:
         error_msg = f"Erro HTTP {e.response.status_code}"
         try:
@@ -490,20 +847,43 @@ def broadcast_tx_hex(signed_tx_hex: str) -> str:
     except Exception as e:
         raise RuntimeError(f"Erro ao transmitir transação: {e}")
 
-def send_transaction(from_address: str, to_address: str, amount_sats: int,
-                     password: str, fee_rate: int = 5, change_address: Optional[str] = None,
-                     broadcast: bool = True) -> Dict:
+def send_transaction(from_address: Optional[str], to_address: str, amount_sats: int,
+                     password: Optional[str], fee_rate: Optional[int] = None, change_address: Optional[str] = None,
+                     broadcast: bool = True, workers: Optional[int] = None,
+                     low_r: bool = False, rbf: bool = True, keys: Optional[KeyIndex] = None,
+                     keep_reserved: bool = False) -> Dict:
     """
     Constrói, assina e (opcionalmente) envia a transação para a rede.
+    from_address=None gasta UTXOs de todos os endereços da carteira.
+    keys (KeyIndex já aberto) dispensa a senha e reaproveita as chaves derivadas.
+    Os inputs ficam reservados no ledger durante o envio; após o broadcast a
+    transação é registrada como pendente (inputs gastos, troco disponível).
+    Sem broadcast a reserva é liberada, a não ser com keep_reserved=True: aí
+    os inputs ficam fora das próximas seleções por ledger.RESERVATION_TTL (o
+    broadcast posterior do hex, via record_signed_tx, registra a transação).
     Retorna dicionário com dados da transação (inclui txid_broadcast se enviado).
     """
-    tx_data = build_and_sign_tx(from_address, to_address, amount_sats, password, fee_rate, change_address)
+    prep = prepare_tx(from_address, to_address, amount_sats, fee_rate, change_address, low_r, rbf,
+                      reserve=True)
+    inputs, outputs = prep["inputs"], prep["outputs"]
 
-    if broadcast:
-        txid = broadcast_tx_hex(tx_data["signed_tx_hex"])
-        tx_data["txid_broadcast"] = txid
-        tx_data["broadcast"] = True
-    else:
-        tx_data["broadcast"] = False
+    try:
+        signed_hex = build_signed_segwit_tx(inputs, outputs, password, keys, workers=workers, low_r=low_r)
+        tx_data = _signed_tx_summary(signed_hex, inputs, outputs, from_address, to_address,
+                                     amount_sats, prep["change_address"], low_r)
+
+        if broadcast:
+            txid = broadcast_tx_hex(tx_data["signed_tx_hex"])
+            record_broadcast(txid, inputs, outputs, load_address_index())
+            tx_data["txid_broadcast"] = txid
+            tx_data["broadcast"] = True
+        else:
+            tx_data["broadcast"] = False
+            if not keep_reserved:
+                release_outpoints(inputs)
+            tx_data["reserved_until"] = int(time.time()) + RESERVATION_TTL if keep_reserved else None
+    except Exception:
+        release_outpoints(inputs)
+        raise
 
     return tx_data
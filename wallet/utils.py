@@ -1,8 +1,10 @@
+from contextlib import contextmanager
 from pathlib import Path
-import json, os
+import json, os, time
 
 WALLET_DIR = Path.home() / ".wowlie"
 WALLET_FILE = WALLET_DIR / "wallet.json"
+CONFIG_FILE = WALLET_DIR / "config.json"
 
 def ensure_dirs():
     WALLET_DIR.mkdir(parents=True, exist_ok=True)
@@ -46,3 +48,55 @@ def load_addresses():
         return idxs, addrs, w
     except Exception:
         return [], [], None
+
+
+def load_config() -> dict:
+    """Configuração opcional em ~/.wowlie/config.json (vazia se não existir)."""
+    try:
+        with open(CONFIG_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        raise RuntimeError(f"config.json inválido: {e}")
+
+
+def _lock(f) -> None:
+    try:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    except ImportError:
+        import msvcrt
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                time.sleep(0.05)
+
+
+def _unlock(f) -> None:
+    try:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    except ImportError:
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Lock exclusivo entre processos sobre o arquivo path (flock no Unix,
+    msvcrt no Windows). Não protege threads do mesmo processo: combine com
+    um threading.Lock.
+    """
+    ensure_dirs()
+    with open(path, "a+") as f:
+        _lock(f)
+        try:
+            yield
+        finally:
+            _unlock(f)
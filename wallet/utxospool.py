@@ -0,0 +1,205 @@
+"""
+UTXOs em disco para a seleção de moedas (endereços com muitos UTXOs).
+
+Endereços muito reutilizados podem ter dezenas de milhares de UTXOs; montar
+a lista inteira (r.json()) e ordená-la para a seleção ocupa dezenas de MB e
+só começa depois do download completo. UtxoSpool guarda os UTXOs num sqlite
+temporário, gravados em lotes à medida que chegam do stream
+(network.stream_utxos_many), com um índice na ordem da seleção — confirmados
+primeiro, menor valor primeiro. iter_sorted() percorre esse índice com um
+cursor, e a seleção (transactions.select_sorted_utxos) para assim que cobre
+o valor: a memória fica limitada a um lote, qualquer que seja o número de
+UTXOs.
+
+Comparação com a lista em memória (um endereço com 50 mil UTXOs num Esplora
+local, em outro processo):
+    python -m wallet.utxospool --bench [--utxos 50000]
+"""
+from typing import Dict, Iterable, Iterator, Optional
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+BATCH = 1000     # UTXOs por INSERT; é o que fica em memória por stream
+
+
+class UtxoSpool:
+    def __init__(self, paths: Optional[Dict[str, str]] = None, directory: Optional[str] = None):
+        """paths: {endereço: caminho de derivação}, anotado em cada UTXO devolvido."""
+        self.paths = paths or {}
+        self.addresses = set()
+        self._dir = tempfile.mkdtemp(prefix="wowlie-utxos-", dir=directory)
+        self._db = sqlite3.connect(os.path.join(self._dir, "utxos.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        # os campos do formato Esplora em colunas (sem serializar cada UTXO em JSON)
+        self._db.execute("""CREATE TABLE utxos (txid TEXT NOT NULL, vout INTEGER NOT NULL,
+                            value INTEGER NOT NULL, unconfirmed INTEGER NOT NULL, address TEXT NOT NULL,
+                            block_height INTEGER, block_hash TEXT, block_time INTEGER,
+                            pending INTEGER NOT NULL, PRIMARY KEY (txid, vout))""")
+        self._indexed = False
+        self._lock = threading.Lock()
+
+    def add(self, address: str, utxos: Iterable[dict]) -> int:
+        """Grava os UTXOs do endereço em lotes de BATCH; retorna quantos. Pode ser chamado de várias threads."""
+        with self._lock:
+            self.addresses.add(address)
+        n, rows = 0, []
+        for u in utxos:
+            status = u.get("status", {})
+            rows.append((u["txid"], u["vout"], u["value"], 0 if status.get("confirmed") else 1, address,
+                         status.get("block_height"), status.get("block_hash"), status.get("block_time"),
+                         1 if u.get("pending") else 0))
+            if len(rows) >= BATCH:
+                n += self._insert(rows)
+                rows = []
+        return n + self._insert(rows)
+
+    def _insert(self, rows) -> int:
+        if rows:
+            with self._lock:
+                self._db.executemany("INSERT OR REPLACE INTO utxos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM utxos").fetchone()[0]
+
+    def __contains__(self, outpoint: str) -> bool:
+        txid, vout = outpoint.rsplit(":", 1)
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM utxos WHERE txid = ? AND vout = ?",
+                                    (txid, int(vout))).fetchone() is not None
+
+    def discard(self, outpoints: Iterable[str]) -> None:
+        """Remove outpoints ("txid:vout"), ex.: gastos por transações pendentes ou reservados."""
+        keys = [(op.rsplit(":", 1)[0], int(op.rsplit(":", 1)[1])) for op in outpoints]
+        if keys:
+            with self._lock:
+                self._db.executemany("DELETE FROM utxos WHERE txid = ? AND vout = ?", keys)
+
+    def total(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(value), 0) FROM utxos").fetchone()[0]
+
+    def iter_sorted(self) -> Iterator[dict]:
+        """UTXOs na ordem da seleção (confirmados primeiro, menor valor primeiro), lidos do índice sob demanda."""
+        with self._lock:
+            if not self._indexed:
+                # índice criado depois da carga: inserir sem ele é bem mais rápido
+                self._db.execute("CREATE INDEX IF NOT EXISTS utxos_order ON utxos (unconfirmed, value)")
+                self._indexed = True
+        cursor = self._db.execute("""SELECT txid, vout, value, unconfirmed, address, block_height, block_hash,
+                                     block_time, pending FROM utxos ORDER BY unconfirmed, value""")
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(BATCH)
+            if not rows:
+                return
+            for txid, vout, value, unconfirmed, address, height, block_hash, block_time, pending in rows:
+                status = {"confirmed": not unconfirmed}
+                if not unconfirmed:
+                    status.update(block_height=height, block_hash=block_hash, block_time=block_time)
+                u = {"txid": txid, "vout": vout, "value": value, "status": status,
+                     "address": address, "path": self.paths.get(address)}
+                if pending:
+                    u["pending"] = True
+                yield u
+
+    def close(self) -> None:
+        self._db.close()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def __enter__(self) -> "UtxoSpool":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def benchmark(n_utxos: int = 50_000, amount: int = 500_000, fee_rate: int = 2):
+    """
+    Um endereço com n_utxos UTXOs num Esplora local em outro processo (a
+    memória medida com tracemalloc é só a do cliente). Compara a lista em
+    memória (get_utxos + select_utxos) com o stream (iter_utxos + UtxoSpool +
+    select_sorted_utxos): pico de memória, tempo até o primeiro UTXO e total.
+    """
+    import socket
+    import subprocess
+    import sys
+    import time
+    import tracemalloc
+
+    from wallet.network import EsploraBackend
+    from wallet.transactions import select_sorted_utxos, select_utxos
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, "-m", "wallet.esplora_standin", "--serve", str(port),
+                             "--synthetic", f"1x{n_utxos}", "--latency-ms", "0", "--jitter-ms", "0"],
+                            stdout=subprocess.PIPE, text=True, env={**os.environ, "PYTHONUNBUFFERED": "1"})
+    try:
+        address = proc.stdout.readline().strip()
+        while "http://" not in proc.stdout.readline():
+            pass
+        backend = EsploraBackend(f"http://127.0.0.1:{port}", coalesce=False)
+
+        def in_memory(t0):
+            # lista: download inteiro, r.json(), cópia ordenada
+            utxos = backend.get_utxos(address)
+            first = time.perf_counter() - t0
+            return len(utxos), first, select_utxos(utxos, amount, fee_rate)[0]
+
+        def streamed(t0):
+            # stream: UTXOs gravados no spool em lotes; seleção pelo índice
+            first = None
+
+            def timed():
+                nonlocal first
+                for u in backend.iter_utxos(address):
+                    if first is None:
+                        first = time.perf_counter() - t0
+                    yield u
+
+            with UtxoSpool() as spool:
+                n = spool.add(address, timed())
+                return n, first, select_sorted_utxos(spool.iter_sorted(), amount, fee_rate)[0]
+
+        results = []
+        for name, path in (("lista (get_utxos + sort)", in_memory), ("stream (spool sqlite)", streamed)):
+            t0 = time.perf_counter()
+            n, first, selected = path(t0)
+            elapsed = time.perf_counter() - t0
+            # pico de memória numa segunda execução: tracemalloc deixa as alocações bem mais lentas
+            tracemalloc.start()
+            path(time.perf_counter())
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results.append({"name": name, "utxos": n, "first_ms": first * 1000, "total_ms": elapsed * 1000,
+                            "peak_mb": peak / 2**20, "selected": [(u["txid"], u["vout"]) for u in selected]})
+        return results
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    p = argparse.ArgumentParser(description="Benchmark da seleção com UTXOs em stream/disco")
+    p.add_argument("--bench", action="store_true")
+    p.add_argument("--utxos", type=int, default=50_000)
+    p.add_argument("--amount", type=int, default=500_000, help="valor a selecionar (sats)")
+    args = p.parse_args()
+    if not args.bench:
+        p.print_help()
+    else:
+        rows = benchmark(args.utxos, args.amount)
+        print(f"Um endereço com {args.utxos:,} UTXOs; seleção de {args.amount:,} sats")
+        print(f"{'caminho':<28} {'UTXOs':>8} {'1º UTXO ms':>11} {'total ms':>9} {'pico MB':>8}")
+        for r in rows:
+            print(f"{r['name']:<28} {r['utxos']:>8} {r['first_ms']:>11.0f} {r['total_ms']:>9.0f} {r['peak_mb']:>8.1f}")
+        print("mesma seleção:", "sim" if rows[0]["selected"] == rows[1]["selected"] else "não")